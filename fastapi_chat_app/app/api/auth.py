@@ -4,10 +4,10 @@ from fastapi import APIRouter, Depends, Header, HTTPException, status
 from pydantic import BaseModel
 
 from ..services.auth_service import AuthService
+from .deps import get_auth_service
 
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
-auth_service = AuthService()
 
 
 class RegisterRequest(BaseModel):
@@ -25,7 +25,7 @@ class TokenResponse(BaseModel):
 	username: str
 
 
-def get_current_user(authorization: Optional[str] = Header(default=None)) -> Dict[str, Any]:
+def get_current_user(authorization: Optional[str] = Header(default=None), auth_service: AuthService = Depends(get_auth_service)) -> Dict[str, Any]:
 	if not authorization or not authorization.lower().startswith("bearer "):
 		raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="未授权访问")
 	token = authorization.split(" ", 1)[1].strip()
@@ -36,7 +36,7 @@ def get_current_user(authorization: Optional[str] = Header(default=None)) -> Dic
 
 
 @router.post("/register")
-async def register(body: RegisterRequest) -> Dict[str, Any]:
+async def register(body: RegisterRequest, auth_service: AuthService = Depends(get_auth_service)) -> Dict[str, Any]:
 	try:
 		user = auth_service.register_user(body.username, body.password)
 	except ValueError as exc:
@@ -45,7 +45,7 @@ async def register(body: RegisterRequest) -> Dict[str, Any]:
 
 
 @router.post("/login", response_model=TokenResponse)
-async def login(body: LoginRequest) -> Dict[str, str]:
+async def login(body: LoginRequest, auth_service: AuthService = Depends(get_auth_service)) -> Dict[str, str]:
 	try:
 		result = auth_service.authenticate(body.username, body.password)
 	except ValueError as exc:
@@ -53,6 +53,12 @@ async def login(body: LoginRequest) -> Dict[str, str]:
 	return {"token": result["token"], "username": result["user"]["username"]}
 
 
+@router.post("/logout")
+async def logout(current_user: Dict[str, Any] = Depends(get_current_user), auth_service: AuthService = Depends(get_auth_service)) -> Dict[str, Any]:
+	auth_service.revoke_token(current_user["token"])
+	return {"message": "已退出登录"}
+
+
 @router.get("/me")
 async def me(current_user: Dict[str, Any] = Depends(get_current_user)) -> Dict[str, Any]:
 	user = current_user.copy()
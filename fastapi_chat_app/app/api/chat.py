@@ -1,42 +1,170 @@
-from typing import Any, Dict, Optional
+import json
+import time
+from typing import Any, AsyncIterator, Dict, List, Literal, Optional, Tuple, Union
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
+from ..config import AppConfig
 from ..services.chat_service import ChatService
+from ..services.container import ServiceContainer
+from ..services.context_assembler import AssembledContext
+from ..services.session_service import SessionService
+from ..utils.stream_coalescer import coalesce_stream
+from ..utils.text_processor import estimate_tokens
 from .auth import get_current_user
+from .deps import get_chat_service, get_services, get_session_service
 
 router = APIRouter(prefix="/api/chat", tags=["chat"])
-chat_service = ChatService()
 
 
 class ChatRequest(BaseModel):
 	message: str
 	document_id: Optional[str] = None  # 文档ID变为可选
+	search_all: bool = False  # 为 True 时基于全部文档回答
+	retrieval_mode: Optional[Literal["dense", "lexical", "hybrid"]] = None  # 默认取 RETRIEVAL_MODE
+	session_id: Optional[str] = None  # 传入时带上该会话的历史，并把本轮问答记入会话
+	stream: bool = False  # 为 True 时流式返回：默认 SSE，Accept 为 application/x-ndjson 时每行一个 JSON
 
 
-@router.post("/message")
-async def chat_message(body: ChatRequest, current_user: Dict[str, Any] = Depends(get_current_user)) -> Dict[str, Any]:
+class SessionRequest(BaseModel):
+	document_id: Optional[str] = None
+
+
+def _get_session(session_id: str, current_user: Dict[str, Any], sessions: SessionService) -> Dict[str, Any]:
+	session = sessions.get(session_id, current_user["user_id"])
+	if session is None:
+		raise HTTPException(status_code=404, detail="会话不存在")
+	return session
+
+
+def _context_tokens(context: Optional[AssembledContext]) -> Optional[Dict[str, int]]:
+	# 上下文的估算 token 数及相对直接拼接检索结果节省的数量；未检索（通用聊天或命中缓存）时为 None
+	if context is None:
+		return None
+	return {"tokens": context.tokens, "baseline_tokens": context.baseline_tokens, "saved_tokens": context.saved_tokens}
+
+
+def _wants_ndjson(accept: Optional[str]) -> bool:
+	return "application/x-ndjson" in (accept or "").lower()
+
+
+@router.post("/message", response_model=None)
+async def chat_message(
+	body: ChatRequest,
+	accept: Optional[str] = Header(default=None),
+	current_user: Dict[str, Any] = Depends(get_current_user),
+	chat_service: ChatService = Depends(get_chat_service),
+	sessions: SessionService = Depends(get_session_service),
+	services: ServiceContainer = Depends(get_services),
+) -> Union[Dict[str, Any], StreamingResponse]:
 	if not body.message:
 		raise HTTPException(status_code=400, detail="消息内容不能为空")
+	started = time.perf_counter()
+	session = _get_session(body.session_id, current_user, sessions) if body.session_id else None
 	
 	# 如果有文档ID，使用RAG模式；否则使用通用聊天模式
 	chunks = []
-	if body.document_id:
-		chunks = chat_service.retrieve_context(body.document_id, body.message, k=5)
+	lookup = None
+	context = None
+	if body.document_id or body.search_all:
+		# 命中回答缓存时返回生成该回答时的片段，不再检索
+		lookup = await chat_service.lookup_answer(body.document_id, body.message, search_all=body.search_all, mode=body.retrieval_mode, session=session)
+		if lookup is not None and lookup.cached is not None:
+			chunks = lookup.cached.context_chunks
+		else:
+			context = await chat_service.aassemble_context(body.document_id, body.message, k=5, search_all=body.search_all, mode=body.retrieval_mode)
+			chunks = context.chunks
 	
-	# Do a one-shot (non-stream) completion by accumulating tokens from stream for simplicity.
+	tokens = chat_service.stream_answer(body.document_id, body.message, search_all=body.search_all, context_chunks=chunks, mode=body.retrieval_mode, lookup=lookup, session=session)
+	head = {
+		"relevant_chunks": chunks,
+		"cached": lookup is not None and lookup.cached is not None,
+		"session_id": body.session_id,
+		"context_tokens": _context_tokens(context),
+	}
+	if body.stream:
+		ndjson = _wants_ndjson(accept)
+		events = _stream_events(tokens, head, services.cfg, started, time.perf_counter())
+		return StreamingResponse(
+			(_ndjson_line(event, data) if ndjson else _sse_event(event, data) async for event, data in events),
+			media_type="application/x-ndjson" if ndjson else "text/event-stream",
+			# 禁止代理缓冲与缓存，片段到达即转发
+			headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+		)
+
 	response_parts = []
-	async for token in chat_service.stream_answer(body.document_id, body.message):
+	async for token in tokens:
 		response_parts.append(token)
-	return {
-		"response": "".join(response_parts),
-		"relevant_chunks": chunks,
+	return {"response": "".join(response_parts), **head}
+
+
+def _sse_event(event: str, data: Dict[str, Any]) -> str:
+	return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}\n\n"
+
+
+def _ndjson_line(event: str, data: Dict[str, Any]) -> str:
+	return json.dumps({"type": event, **data}, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+async def _stream_events(tokens: AsyncIterator[str], head: Dict[str, Any], cfg: AppConfig, started: float, retrieved: float) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+	"""
+	流式响应的事件序列：context（检索到的片段，先于回答发送）、若干 chunk（与 /ws/chat 相同的片段合并策略）、
+	最后 end（回答长度与耗时）；上游出错时以 error 结束。
+	"""
+	yield "context", head
+	first: Optional[float] = None
+	parts: List[str] = []
+	try:
+		async for part in coalesce_stream(tokens, cfg.ws_coalesce_max_bytes, cfg.ws_coalesce_max_ms / 1000, cfg.ws_max_pending_bytes):
+			if first is None:
+				first = time.perf_counter()
+			parts.append(part)
+			yield "chunk", {"content": part}
+	except Exception as exc:
+		yield "error", {"message": str(exc) or exc.__class__.__name__}
+		return
+	finished = time.perf_counter()
+	response = "".join(parts)
+	yield "end", {
+		"usage": {
+			"response_chars": len(response),
+			"response_tokens": estimate_tokens(response),
+			"context_tokens": head["context_tokens"],
+		},
+		"timing": {
+			"retrieval_ms": round((retrieved - started) * 1000, 1),
+			"first_token_ms": round((first - started) * 1000, 1) if first is not None else None,
+			"total_ms": round((finished - started) * 1000, 1),
+		},
 	}
 
 
+@router.post("/sessions")
+async def create_session(body: SessionRequest, current_user: Dict[str, Any] = Depends(get_current_user), sessions: SessionService = Depends(get_session_service)) -> Dict[str, Any]:
+	session = sessions.create(current_user["user_id"], body.document_id)
+	return {"session_id": session["session_id"], "document_id": session["document_id"], "created_time": session["created_time"]}
+
+
+@router.get("/sessions/{session_id}")
+async def get_session(session_id: str, current_user: Dict[str, Any] = Depends(get_current_user), sessions: SessionService = Depends(get_session_service)) -> Dict[str, Any]:
+	session = _get_session(session_id, current_user, sessions)
+	return {k: v for k, v in session.items() if k != "user_id"}
+
+
+@router.delete("/sessions/{session_id}")
+async def delete_session(session_id: str, current_user: Dict[str, Any] = Depends(get_current_user), sessions: SessionService = Depends(get_session_service)) -> Dict[str, Any]:
+	if not sessions.delete(session_id, current_user["user_id"]):
+		raise HTTPException(status_code=404, detail="会话不存在")
+	return {"status": "deleted"}
+
+
 @router.get("/recommendations")
-async def get_recommendations(current_user: Dict[str, Any] = Depends(get_current_user)) -> Dict[str, Any]:
+async def get_recommendations(current_user: Dict[str, Any] = Depends(get_current_user), chat_service: ChatService = Depends(get_chat_service)) -> Dict[str, Any]:
 	return {"recommendations": chat_service.get_recommendations()}
 
 
+@router.get("/stats")
+async def get_stats(current_user: Dict[str, Any] = Depends(get_current_user), chat_service: ChatService = Depends(get_chat_service)) -> Dict[str, Any]:
+	return chat_service.stats()
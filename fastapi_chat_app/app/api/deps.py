@@ -0,0 +1,38 @@
+from fastapi import Request, WebSocket
+
+from ..services.auth_service import AuthService
+from ..services.chat_service import ChatService
+from ..services.container import ServiceContainer
+from ..services.document_service import DocumentService
+from ..services.ingestion_queue import IngestionQueue
+from ..services.session_service import SessionService
+
+
+# 服务由 main.py 的 lifespan 创建并挂在 app.state.services 上，路由通过依赖注入取用
+
+def get_services(request: Request) -> ServiceContainer:
+	return request.app.state.services
+
+
+def get_ws_services(websocket: WebSocket) -> ServiceContainer:
+	return websocket.app.state.services
+
+
+def get_auth_service(request: Request) -> AuthService:
+	return get_services(request).auth
+
+
+def get_chat_service(request: Request) -> ChatService:
+	return get_services(request).chat
+
+
+def get_document_service(request: Request) -> DocumentService:
+	return get_services(request).documents
+
+
+def get_ingestion_queue(request: Request) -> IngestionQueue:
+	return get_services(request).ingestion
+
+
+def get_session_service(request: Request) -> SessionService:
+	return get_services(request).sessions
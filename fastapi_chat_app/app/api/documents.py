@@ -3,32 +3,41 @@ from typing import Any, Dict
 from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
 
 from ..services.document_service import DocumentService
+from ..services.ingestion_queue import IngestionQueue
 from .auth import get_current_user
+from .deps import get_document_service, get_ingestion_queue
 
 router = APIRouter(prefix="/api/documents", tags=["documents"])
-doc_service = DocumentService()
 
 
 @router.post("/upload")
 async def upload_document(
 	file: UploadFile = File(...),
 	current_user: Dict[str, Any] = Depends(get_current_user),
+	ingestion_queue: IngestionQueue = Depends(get_ingestion_queue),
 ) -> Dict[str, Any]:
 	if not file.filename.lower().endswith(".txt"):
 		raise HTTPException(status_code=400, detail="只支持txt文件")
-	content = (await file.read()).decode("utf-8", errors="ignore")
-	doc, chunks_count = doc_service.process_text(file.filename, content)
+	job = await ingestion_queue.submit(file.filename, file.read)
 	return {
-		"document_id": doc.document_id,
-		"filename": doc.filename,
-		"chunks_count": chunks_count,
-		"status": "processed",
+		"job_id": job["job_id"],
+		"document_id": job["document_id"],
+		"filename": job["filename"],
+		"status": job["status"],
 	}
 
 
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, current_user: Dict[str, Any] = Depends(get_current_user), ingestion_queue: IngestionQueue = Depends(get_ingestion_queue)) -> Dict[str, Any]:
+	job = ingestion_queue.get_job(job_id)
+	if not job:
+		raise HTTPException(status_code=404, detail="任务不存在")
+	return job
+
+
 @router.get("/")
-async def list_documents(current_user: Dict[str, Any] = Depends(get_current_user)) -> Dict[str, Any]:
-	docs = doc_service.list_documents()
+async def list_documents(current_user: Dict[str, Any] = Depends(get_current_user), doc_service: DocumentService = Depends(get_document_service)) -> Dict[str, Any]:
+	docs = doc_service.list_documents(include_chunks=False)
 	return {
 		"documents": [
 			{
@@ -43,7 +52,7 @@ async def list_documents(current_user: Dict[str, Any] = Depends(get_current_user
 
 
 @router.delete("/{document_id}")
-async def delete_document(document_id: str, current_user: Dict[str, Any] = Depends(get_current_user)) -> Dict[str, Any]:
+async def delete_document(document_id: str, current_user: Dict[str, Any] = Depends(get_current_user), doc_service: DocumentService = Depends(get_document_service)) -> Dict[str, Any]:
 	doc_service.delete_document(document_id)
 	return {"status": "deleted"}
 
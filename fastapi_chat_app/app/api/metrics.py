@@ -0,0 +1,18 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from ..config import load_config
+from ..utils.metrics import REGISTRY
+
+router = APIRouter(tags=["metrics"])
+
+# Prometheus 文本格式 0.0.4
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics() -> PlainTextResponse:
+	"""导出进程内的存储、向量化、检索、LLM 流式输出与 WebSocket 指标，供 Prometheus 抓取。"""
+	if not load_config().metrics_enabled:
+		raise HTTPException(status_code=404, detail="Not Found")
+	return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
@@ -0,0 +1,25 @@
+from typing import Any, Dict, List, Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel, Field
+
+from ..services.chat_service import ChatService
+from .auth import get_current_user
+from .deps import get_chat_service
+
+router = APIRouter(prefix="/api/search", tags=["search"])
+
+
+class SearchRequest(BaseModel):
+	query: str
+	k: int = Field(default=10, ge=1, le=100)
+	nprobe: Optional[int] = Field(default=None, ge=1)  # 越大召回越高，默认取 ANN_NPROBE
+	document_ids: Optional[List[str]] = None  # 限定在部分文档内检索
+	mode: Optional[Literal["dense", "lexical", "hybrid"]] = None  # 默认取 RETRIEVAL_MODE
+
+
+@router.post("")
+async def search(body: SearchRequest, current_user: Dict[str, Any] = Depends(get_current_user), chat_service: ChatService = Depends(get_chat_service)) -> Dict[str, Any]:
+	if not body.query.strip():
+		raise HTTPException(status_code=400, detail="查询内容不能为空")
+	return {"results": await chat_service.asearch(body.query, k=body.k, nprobe=body.nprobe, document_ids=body.document_ids, mode=body.mode)}
@@ -1,44 +1,165 @@
-from typing import Optional
+import asyncio
+import json
+from typing import Any, Dict, Optional
 
 from fastapi import APIRouter, Query, WebSocket, WebSocketDisconnect
 
-from ..services.chat_service import ChatService
-from .auth import auth_service
+from ..services.chat_service import RETRIEVAL_MODES
+from ..utils.metrics import (
+	WEBSOCKET_ACTIVE_CONNECTIONS,
+	WEBSOCKET_CONNECTIONS,
+	WEBSOCKET_FRAMES,
+	WEBSOCKET_SENT_BYTES,
+	WEBSOCKET_SESSION_BYTES,
+	WEBSOCKET_SESSION_FRAMES,
+	WEBSOCKET_SLOW_CLIENTS,
+)
+from ..utils.stream_coalescer import coalesce_stream
+from .deps import get_ws_services
 
 router = APIRouter(tags=["websocket"])
-chat_service = ChatService()
+
+FRAME_FORMATS = ("json", "compact")
+
+_CHUNK_FRAMES = WEBSOCKET_FRAMES.labels("chunk")
+_CHUNK_BYTES = WEBSOCKET_SENT_BYTES.labels("chunk")
+_CONTROL_FRAMES = WEBSOCKET_FRAMES.labels("control")
+_CONTROL_BYTES = WEBSOCKET_SENT_BYTES.labels("control")
+
+
+class SlowClientError(Exception):
+	pass
+
+
+def _is_optional_str(value: Any) -> bool:
+	return value is None or isinstance(value, str)
+
+
+class _FrameWriter:
+	"""
+	发送聊天帧并统计每个会话的帧数与字节数。compact 格式下回答片段以 UTF-8 二进制帧发送（不带 JSON 包装），
+	start / end / error 等控制消息仍为 JSON 文本帧。单帧发送超过 send_timeout 秒抛出 SlowClientError。
+	"""
+
+	def __init__(self, websocket: WebSocket, compact: bool, send_timeout: float) -> None:
+		self._ws = websocket
+		self._compact = compact
+		self._send_timeout = send_timeout
+		self.frames = 0
+		self.bytes = 0
+
+	async def _send(self, message: Dict[str, Any]) -> None:
+		try:
+			await asyncio.wait_for(self._ws.send(message), self._send_timeout)
+		except asyncio.TimeoutError:
+			raise SlowClientError() from None
+
+	async def control(self, data: Dict[str, Any]) -> None:
+		text = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+		await self._send({"type": "websocket.send", "text": text})
+		size = len(text.encode("utf-8"))
+		self.frames += 1
+		self.bytes += size
+		_CONTROL_FRAMES.inc()
+		_CONTROL_BYTES.inc(size)
+
+	async def chunk(self, content: str) -> None:
+		if self._compact:
+			payload = content.encode("utf-8")
+			await self._send({"type": "websocket.send", "bytes": payload})
+			size = len(payload)
+		else:
+			text = json.dumps({"type": "chunk", "content": content}, ensure_ascii=False, separators=(",", ":"))
+			await self._send({"type": "websocket.send", "text": text})
+			size = len(text.encode("utf-8"))
+		self.frames += 1
+		self.bytes += size
+		_CHUNK_FRAMES.inc()
+		_CHUNK_BYTES.inc(size)
 
 
 @router.websocket("/ws/chat")
-async def ws_chat(websocket: WebSocket, document_id: Optional[str] = Query(None), token: Optional[str] = Query(None)):
+async def ws_chat(websocket: WebSocket, document_id: Optional[str] = Query(None), token: Optional[str] = Query(None), format: Optional[str] = Query(None), session_id: Optional[str] = Query(None)):
 	"""
 	WebSocket聊天接口
 	document_id: 可选的文档ID，如果不提供则使用通用聊天模式
 	token: 身份验证令牌，必须有效
+	format: 帧格式 json（默认取 WS_FRAME_FORMAT）或 compact（回答片段为 UTF-8 二进制帧）
+	session_id: 要继续的会话；不提供时在第一条消息时创建（第一轮问答完成后才保存），start 消息中返回会话ID
 	"""
-	user = auth_service.verify_token(token)
-	if not user:
+	services = get_ws_services(websocket)
+	chat_service = services.chat
+	sessions = services.sessions
+	cfg = services.cfg
+	user = services.auth.verify_token(token)
+	frame_format = (format or cfg.ws_frame_format).lower()
+	if not user or frame_format not in FRAME_FORMATS:
 		await websocket.close(code=1008)
 		return
 
 	await websocket.accept()
+	WEBSOCKET_CONNECTIONS.inc()
+	WEBSOCKET_ACTIVE_CONNECTIONS.inc()
+	writer = _FrameWriter(websocket, frame_format == "compact", cfg.ws_send_timeout)
 	try:
 		while True:
-			data = await websocket.receive_json()
+			try:
+				data = await websocket.receive_json()
+			except ValueError:
+				# 不是合法 JSON 的文本帧只回复错误，不断开连接
+				await writer.control({"type": "error", "message": "invalid payload"})
+				continue
 			if not isinstance(data, dict) or data.get("type") != "message":
-				await websocket.send_json({"type": "error", "message": "invalid payload"})
+				await writer.control({"type": "error", "message": "invalid payload"})
 				continue
-			content = data.get("content", "").strip()
+			content = data.get("content", "")
+			if not isinstance(content, str):
+				await writer.control({"type": "error", "message": "invalid content"})
+				continue
+			content = content.strip()
 			if not content:
-				await websocket.send_json({"type": "error", "message": "消息内容不能为空"})
+				await writer.control({"type": "error", "message": "消息内容不能为空"})
 				continue
 			# 如果消息中包含document_id，使用它（优先级高于URL参数）
 			msg_document_id = data.get("document_id", document_id)
-			await websocket.send_json({"type": "start"})
-			async for token_part in chat_service.stream_answer(msg_document_id, content):
-				await websocket.send_json({"type": "chunk", "content": token_part})
-			await websocket.send_json({"type": "end"})
+			msg_session_id = data.get("session_id", session_id)
+			if not _is_optional_str(msg_document_id) or not _is_optional_str(msg_session_id):
+				await writer.control({"type": "error", "message": "invalid document_id or session_id"})
+				continue
+			search_all = bool(data.get("search_all", False))
+			retrieval_mode = data.get("retrieval_mode")
+			if retrieval_mode is not None and retrieval_mode not in RETRIEVAL_MODES:
+				await writer.control({"type": "error", "message": "invalid retrieval_mode"})
+				continue
+			# 每轮重新读取会话，取到上一轮记录的问答与后台完成的摘要
+			if msg_session_id:
+				session = sessions.get(msg_session_id, user["user_id"])
+				if session is None:
+					await writer.control({"type": "error", "message": "会话不存在"})
+					continue
+			else:
+				if session_id:
+					sessions.release(session_id)
+				session = sessions.new(user["user_id"], msg_document_id)
+			session_id = session["session_id"]
+			await writer.control({"type": "start", "session_id": session_id})
+			# 上游逐字输出的片段合并成较大的帧发送；客户端接收慢时待发送内容有上限
+			tokens = chat_service.stream_answer(msg_document_id, content, search_all=search_all, mode=retrieval_mode, session=session)
+			async for part in coalesce_stream(tokens, cfg.ws_coalesce_max_bytes, cfg.ws_coalesce_max_ms / 1000, cfg.ws_max_pending_bytes):
+				await writer.chunk(part)
+			await writer.control({"type": "end"})
 	except WebSocketDisconnect:
 		return
-
-
+	except SlowClientError:
+		WEBSOCKET_SLOW_CLIENTS.inc()
+		# 1013：稍后重试；连接可能已不可用，关闭失败无需处理
+		try:
+			await websocket.close(code=1013)
+		except Exception:
+			pass
+	finally:
+		if session_id:
+			sessions.release(session_id)
+		WEBSOCKET_ACTIVE_CONNECTIONS.dec()
+		WEBSOCKET_SESSION_FRAMES.observe(writer.frames)
+		WEBSOCKET_SESSION_BYTES.observe(writer.bytes)
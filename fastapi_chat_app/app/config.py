@@ -1,4 +1,5 @@
 import os
+from typing import Optional
 from pydantic import BaseModel
 
 
@@ -7,10 +8,119 @@ class AppConfig(BaseModel):
 	base_url: str
 	llm_model: str
 	embedding_model: str
-	data_dir: str = os.path.join(os.path.dirname(os.path.dirname(__file__)), "..", "data")
+	# 数据目录，可用 DATA_DIR 指向其他位置（例如基准测试使用的临时目录）
+	data_dir: str = os.getenv("DATA_DIR") or os.path.join(os.path.dirname(os.path.dirname(__file__)), "..", "data")
 	documents_path: str = os.path.join(data_dir, "documents.json")
+	# json 后端的文档目录：清单 manifest.json 与每个文档的分块文件；首次使用时从 documents.json 导入
+	documents_dir: str = os.path.join(data_dir, "documents")
 	vectors_path: str = os.path.join(data_dir, "vectors.json")
 	users_path: str = os.path.join(data_dir, "users.json")
+	# 文档/用户存储后端：json（整文件读写）、log（只追加日志，写入只追加一条记录）或 sqlite（带索引的表）
+	storage_backend: str = "json"
+	sqlite_path: str = os.path.join(data_dir, "app.sqlite3")
+	documents_log_path: str = os.path.join(data_dir, "documents.jsonl")
+	users_log_path: str = os.path.join(data_dir, "users.jsonl")
+	# 日志失效字节超过该值且超过存活字节时后台压缩；log_fsync 为 True 时每次追加后 fsync
+	log_compact_min_bytes: int = 1024 * 1024
+	log_fsync: bool = False
+	# 向量存储后端：binary（float32 内存映射文件，默认）、json（旧版 vectors.json）或 sqlite（与 sqlite_path 同库）
+	vector_backend: str = "binary"
+	vectors_dir: str = os.path.join(data_dir, "vectors")
+	# 二进制后端的检索精度：float32、float16 或 int8；量化时先粗排 k * vector_rescore_factor 个候选再用 float32 重排
+	vector_dtype: str = "float32"
+	vector_rescore_factor: int = 4
+	# JSON 读缓存：按文件签名失效，上限按文件字节数计算
+	storage_cache_enabled: bool = True
+	storage_cache_max_bytes: int = 64 * 1024 * 1024
+	# 鉴权：signed 为 HMAC 签名的无状态令牌，stored 为写入 users.json 的旧版令牌
+	auth_token_mode: str = "signed"
+	auth_secret: Optional[str] = None
+	auth_secret_path: str = os.path.join(data_dir, ".auth_secret")
+	auth_token_ttl: int = 7 * 24 * 3600
+	auth_max_tokens_per_user: int = 10
+	revoked_tokens_path: str = os.path.join(data_dir, "revoked_tokens.json")
+	# OpenAI 接口的连接池：最大连接数、保持的空闲连接数与空闲过期秒数；http2 需要安装 h2
+	http_max_connections: int = 100
+	http_max_keepalive: int = 20
+	http_keepalive_expiry: float = 60.0
+	http_timeout: float = 600.0
+	http_connect_timeout: float = 5.0
+	http2: bool = True
+	# 启动时预热的连接数（HTTP/1.1 时生效）
+	http_warmup: bool = True
+	http_warmup_connections: int = 2
+	# WebSocket 输出：片段合并到 ws_coalesce_max_bytes 字节或 ws_coalesce_max_ms 毫秒后发送一帧（字节数为 0 时不合并）；
+	# 待发送内容超过 ws_max_pending_bytes 时暂停读取上游，单帧发送超过 ws_send_timeout 秒视为慢客户端并断开。
+	# ws_frame_format 为默认帧格式：json 或 compact（片段以 UTF-8 二进制帧发送，其余消息仍为 JSON），客户端可用 format 参数指定
+	ws_coalesce_max_bytes: int = 512
+	ws_coalesce_max_ms: float = 20.0
+	ws_max_pending_bytes: int = 1024 * 1024
+	ws_send_timeout: float = 10.0
+	ws_frame_format: str = "json"
+	# 是否开放 /metrics（Prometheus 文本格式）
+	metrics_enabled: bool = True
+	# 查询向量缓存：内存 LRU + TTL，可选 SQLite 持久层
+	query_cache_size: int = 1024
+	query_cache_ttl: int = 24 * 3600
+	query_cache_persist: bool = False
+	query_cache_persist_max: int = 100000
+	query_cache_path: str = os.path.join(data_dir, "query_embeddings.sqlite3")
+	# 回答缓存：同一文档（或全部文档）下问题向量相似度不低于 answer_cache_threshold 时直接回放已生成的回答，内存 LRU + TTL
+	answer_cache_enabled: bool = True
+	answer_cache_size: int = 1024
+	answer_cache_ttl: int = 3600
+	answer_cache_threshold: float = 0.95
+	# 查询向量合并请求：窗口（毫秒）内或凑满 max_size 条的并发查询合为一次接口调用
+	query_batch_enabled: bool = True
+	query_batch_window_ms: float = 5.0
+	query_batch_max_size: int = 32
+	# 文档向量化：单批条数/字符数上限、并发批次数与每批重试
+	embed_batch_size: int = 64
+	embed_batch_max_chars: int = 60000
+	embed_concurrency: int = 4
+	embed_max_retries: int = 3
+	embed_retry_backoff: float = 0.5
+	# 文档块向量缓存：按 hash(模型, 块文本) 寻址，重复内容不再调用向量化接口
+	embed_cache_enabled: bool = True
+	embed_cache_max_entries: int = 200000
+	embed_cache_path: str = os.path.join(data_dir, "chunk_embeddings.sqlite3")
+	# 向量化实现：openai（远程接口）或 local（进程内字符 n-gram 哈希向量化，维度与 n-gram 上限可配）
+	embedding_provider: str = "openai"
+	local_embedding_dim: int = 1024
+	local_embedding_ngram_max: int = 3
+	# 后台入库任务：任务记录、上传暂存目录、worker 数量与保留的历史任务数
+	jobs_path: str = os.path.join(data_dir, "jobs.json")
+	uploads_dir: str = os.path.join(data_dir, "uploads")
+	ingest_workers: int = 2
+	ingest_job_history: int = 200
+	# 流式入库时每个窗口的块数：窗口内的批次并发向量化，完成后再读入下一窗口
+	ingest_window_chunks: int = 256
+	upload_read_block: int = 64 * 1024
+	# 全局近似最近邻索引（IVF）：探测的倒排列表数与开始训练聚类中心的向量数
+	ann_nprobe: int = 16
+	ann_train_threshold: int = 4096
+	# 多 worker 部署：文档变更通过 changes.jsonl 通知其他进程，各进程每 change_poll_ms 毫秒检查一次并更新进程内索引
+	changes_path: str = os.path.join(data_dir, "changes.jsonl")
+	change_poll_ms: float = 200.0
+	change_feed_max_bytes: int = 1024 * 1024
+	# 上下文组装：从 k * context_candidates_factor 个检索候选中按 MMR（context_mmr_lambda 越大越偏重相关度）选出至多 k 个片段，
+	# 与已选片段相似度（字符 4-gram Jaccard）不低于 context_dedupe_threshold 的候选跳过，相邻片段合并并去掉切分重叠，总量不超过 context_max_tokens（估算）
+	context_assembly_enabled: bool = True
+	context_max_tokens: int = 2000
+	context_candidates_factor: int = 3
+	context_mmr_lambda: float = 0.7
+	context_dedupe_threshold: float = 0.9
+	# 聊天会话：每个会话一个文件；提示中的历史（摘要加最近的轮次）按估算 token 数不超过 chat_history_max_tokens，
+	# 超出预算的较早轮次在后台合并进滚动摘要，摘要生成上限为 chat_summary_max_tokens；
+	# 超过 chat_session_ttl 秒没有新问答的会话失效并定期清理（0 表示不过期）
+	sessions_dir: str = os.path.join(data_dir, "sessions")
+	chat_history_max_tokens: int = 2000
+	chat_summary_max_tokens: int = 400
+	chat_session_ttl: int = 7 * 24 * 3600
+	# 检索模式：dense（向量）、lexical（BM25，不调用向量化）或 hybrid（两路各取 k * hybrid_candidates_factor 个候选按倒数排名融合）
+	retrieval_mode: str = "dense"
+	hybrid_candidates_factor: int = 4
+	rrf_k: int = 60
 
 
 def load_config() -> AppConfig:
@@ -23,6 +133,67 @@ def load_config() -> AppConfig:
 		base_url=os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"),
 		llm_model=os.getenv("LLM_MODEL", "gpt-4o-mini"),
 		embedding_model=os.getenv("EMBEDDING_MODEL", "text-embedding-3-small"),
+		storage_backend=os.getenv("STORAGE_BACKEND", "json").lower(),
+		log_fsync=os.getenv("LOG_FSYNC", "false").lower() == "true",
+		vector_backend=os.getenv("VECTOR_BACKEND", "binary").lower(),
+		vector_dtype=os.getenv("VECTOR_DTYPE", "float32").lower(),
+		vector_rescore_factor=int(os.getenv("VECTOR_RESCORE_FACTOR", "4")),
+		storage_cache_enabled=os.getenv("STORAGE_CACHE_ENABLED", "true").lower() == "true",
+		storage_cache_max_bytes=int(os.getenv("STORAGE_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+		auth_token_mode=os.getenv("AUTH_TOKEN_MODE", "signed").lower(),
+		auth_secret=os.getenv("AUTH_SECRET") or None,
+		auth_token_ttl=int(os.getenv("AUTH_TOKEN_TTL", str(7 * 24 * 3600))),
+		auth_max_tokens_per_user=int(os.getenv("AUTH_MAX_TOKENS_PER_USER", "10")),
+		http_max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "100")),
+		http_max_keepalive=int(os.getenv("HTTP_MAX_KEEPALIVE", "20")),
+		http_keepalive_expiry=float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60")),
+		http_timeout=float(os.getenv("HTTP_TIMEOUT", "600")),
+		http2=os.getenv("HTTP2", "true").lower() == "true",
+		http_warmup=os.getenv("HTTP_WARMUP", "true").lower() == "true",
+		http_warmup_connections=int(os.getenv("HTTP_WARMUP_CONNECTIONS", "2")),
+		ws_coalesce_max_bytes=int(os.getenv("WS_COALESCE_MAX_BYTES", "512")),
+		ws_coalesce_max_ms=float(os.getenv("WS_COALESCE_MAX_MS", "20")),
+		ws_max_pending_bytes=int(os.getenv("WS_MAX_PENDING_BYTES", str(1024 * 1024))),
+		ws_send_timeout=float(os.getenv("WS_SEND_TIMEOUT", "10")),
+		ws_frame_format=os.getenv("WS_FRAME_FORMAT", "json").lower(),
+		metrics_enabled=os.getenv("METRICS_ENABLED", "true").lower() == "true",
+		query_cache_size=int(os.getenv("QUERY_CACHE_SIZE", "1024")),
+		query_cache_ttl=int(os.getenv("QUERY_CACHE_TTL", str(24 * 3600))),
+		query_cache_persist=os.getenv("QUERY_CACHE_PERSIST", "false").lower() == "true",
+		query_cache_persist_max=int(os.getenv("QUERY_CACHE_PERSIST_MAX", "100000")),
+		answer_cache_enabled=os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true",
+		answer_cache_size=int(os.getenv("ANSWER_CACHE_SIZE", "1024")),
+		answer_cache_ttl=int(os.getenv("ANSWER_CACHE_TTL", "3600")),
+		answer_cache_threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+		query_batch_enabled=os.getenv("QUERY_BATCH_ENABLED", "true").lower() == "true",
+		query_batch_window_ms=float(os.getenv("QUERY_BATCH_WINDOW_MS", "5")),
+		query_batch_max_size=int(os.getenv("QUERY_BATCH_MAX_SIZE", "32")),
+		embed_batch_size=int(os.getenv("EMBED_BATCH_SIZE", "64")),
+		embed_batch_max_chars=int(os.getenv("EMBED_BATCH_MAX_CHARS", "60000")),
+		embed_concurrency=int(os.getenv("EMBED_CONCURRENCY", "4")),
+		embed_max_retries=int(os.getenv("EMBED_MAX_RETRIES", "3")),
+		embed_retry_backoff=float(os.getenv("EMBED_RETRY_BACKOFF", "0.5")),
+		embed_cache_enabled=os.getenv("EMBED_CACHE_ENABLED", "true").lower() == "true",
+		embed_cache_max_entries=int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "200000")),
+		embedding_provider=os.getenv("EMBEDDING_PROVIDER", "openai").lower(),
+		local_embedding_dim=int(os.getenv("LOCAL_EMBEDDING_DIM", "1024")),
+		local_embedding_ngram_max=int(os.getenv("LOCAL_EMBEDDING_NGRAM_MAX", "3")),
+		ingest_workers=int(os.getenv("INGEST_WORKERS", "2")),
+		ingest_window_chunks=int(os.getenv("INGEST_WINDOW_CHUNKS", "256")),
+		ann_nprobe=int(os.getenv("ANN_NPROBE", "16")),
+		ann_train_threshold=int(os.getenv("ANN_TRAIN_THRESHOLD", "4096")),
+		change_poll_ms=float(os.getenv("CHANGE_POLL_MS", "200")),
+		context_assembly_enabled=os.getenv("CONTEXT_ASSEMBLY_ENABLED", "true").lower() == "true",
+		context_max_tokens=int(os.getenv("CONTEXT_MAX_TOKENS", "2000")),
+		context_candidates_factor=int(os.getenv("CONTEXT_CANDIDATES_FACTOR", "3")),
+		context_mmr_lambda=float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7")),
+		context_dedupe_threshold=float(os.getenv("CONTEXT_DEDUPE_THRESHOLD", "0.9")),
+		chat_history_max_tokens=int(os.getenv("CHAT_HISTORY_MAX_TOKENS", "2000")),
+		chat_summary_max_tokens=int(os.getenv("CHAT_SUMMARY_MAX_TOKENS", "400")),
+		chat_session_ttl=int(os.getenv("CHAT_SESSION_TTL", str(7 * 24 * 3600))),
+		retrieval_mode=os.getenv("RETRIEVAL_MODE", "dense").lower(),
+		hybrid_candidates_factor=int(os.getenv("HYBRID_CANDIDATES_FACTOR", "4")),
+		rrf_k=int(os.getenv("RRF_K", "60")),
 	)
 
 
@@ -1,3 +1,4 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
@@ -6,9 +7,25 @@ from pathlib import Path
 from .api.auth import router as auth_router
 from .api.documents import router as documents_router
 from .api.chat import router as chat_router
+from .api.search import router as search_router
 from .api.websocket import router as ws_router
+from .api.metrics import router as metrics_router
+from .services.container import ServiceContainer
 
-app = FastAPI(title="FastAPI Chat App", version="0.1.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 整个进程共用一套服务与 OpenAI 连接池：启动时预热连接、启动入库 worker，退出时依次关闭
+    services = ServiceContainer()
+    app.state.services = services
+    await services.start()
+    try:
+        yield
+    finally:
+        await services.close()
+
+
+app = FastAPI(title="FastAPI Chat App", version="0.1.0", lifespan=lifespan)
 
 # 配置CORS
 app.add_middleware(
@@ -73,6 +90,8 @@ else:
 app.include_router(auth_router)
 app.include_router(documents_router)
 app.include_router(chat_router)
+app.include_router(search_router)
 app.include_router(ws_router)
+app.include_router(metrics_router)
 
 
@@ -1,4 +1,4 @@
-from typing import List, Literal
+from typing import List, Literal, Optional
 from pydantic import BaseModel, Field
 from datetime import datetime
 import uuid
@@ -12,8 +12,11 @@ class ChatMessage(BaseModel):
 
 class ChatSession(BaseModel):
 	session_id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-	document_id: str
+	user_id: str
+	document_id: Optional[str] = None  # 通用聊天会话不绑定文档
 	messages: List[ChatMessage] = Field(default_factory=list)
+	# 滚动摘要：合并进 summary 的消息从 messages 中移除；旧版会话文件中 messages[:summarized_count] 为已合并的消息
+	summary: str = ""
+	summarized_count: int = 0
 	created_time: str = Field(default_factory=lambda: datetime.utcnow().isoformat() + "Z")
-
-
+	updated_time: str = Field(default_factory=lambda: datetime.utcnow().isoformat() + "Z")
@@ -0,0 +1,213 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from ..config import AppConfig
+from ..storage.json_storage import JSONStorage
+from ..utils.metrics import ANSWER_CACHE_LOOKUPS
+from .query_cache import normalize_query
+
+
+# search_all 的回答依赖全部文档，任一文档变化都会使其失效
+ALL_DOCUMENTS = "*"
+
+_HITS = ANSWER_CACHE_LOOKUPS.labels("hit")
+_MISSES = ANSWER_CACHE_LOOKUPS.labels("miss")
+
+
+class CachedAnswer(NamedTuple):
+	answer: str
+	context_chunks: List[str]
+	similarity: float
+
+
+class AnswerLookup(NamedTuple):
+	cached: Optional[CachedAnswer]
+	# 查找时得到的问题向量，未命中时写入缓存复用；lexical 模式只按文本精确匹配，为 None
+	vector: Optional[np.ndarray]
+
+
+class _Entry(NamedTuple):
+	scope: Tuple[Hashable, ...]
+	text: str
+	# 为 None 的条目只能按文本精确命中
+	vector: Optional[np.ndarray]
+	answer: str
+	context_chunks: List[str]
+	expires: float
+
+
+class AnswerCache:
+	"""
+	回答缓存：键为 (文档范围, 文档版本, 检索模式, 向量模型) 与问题向量。同一范围内问题向量的余弦相似度
+	不低于 threshold 即命中，归一化后完全相同的问题不需要向量即可命中。内存 LRU + TTL。
+
+	文档版本取自存储中持久化的版本号（versions 返回 document_id -> 版本），其他 worker 重新入库或删除文档后
+	本进程的查找键随之变化，旧回答不会再命中；生成期间版本发生变化的回答不会写入。invalidate 只用于及时释放失效条目。
+	"""
+
+	def __init__(self, max_entries: int, ttl: float, threshold: float, versions: Callable[[], Dict[str, int]]) -> None:
+		self._max_entries = max_entries
+		self._ttl = ttl
+		self._threshold = threshold
+		self._lock = threading.Lock()
+		self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+		self._scopes: Dict[Tuple[Hashable, ...], Dict[int, None]] = {}
+		self._texts: Dict[Tuple[Tuple[Hashable, ...], str], int] = {}
+		self._document_versions = versions
+		# 全部文档范围的版本是所有文档版本的指纹，版本表对象未变化时复用
+		self._fingerprint: Tuple[Optional[Dict[str, int]], int] = (None, 0)
+		self._next_id = 0
+		self.hits = 0
+		self.exact_hits = 0
+		self.misses = 0
+		self.invalidations = 0
+
+	@classmethod
+	def from_config(cls, cfg: AppConfig, versions: Callable[[], Dict[str, int]]) -> "AnswerCache":
+		return cls(cfg.answer_cache_size, cfg.answer_cache_ttl, cfg.answer_cache_threshold, versions)
+
+	def version(self, document_id: str) -> Optional[int]:
+		"""文档的持久化版本号，文档不存在时为 None；全部文档范围返回所有文档版本的指纹。"""
+		versions = self._document_versions()
+		if document_id != ALL_DOCUMENTS:
+			return versions.get(document_id)
+		source, fingerprint = self._fingerprint
+		if versions is not source:
+			fingerprint = hash(frozenset(versions.items()))
+			self._fingerprint = (versions, fingerprint)
+		return fingerprint
+
+	def key(self, document_id: str, mode: str, model: str) -> Tuple[Hashable, ...]:
+		return (document_id, self.version(document_id), mode, model)
+
+	def get(self, scope: Tuple[Hashable, ...], text: str, vector: Optional[Any] = None, exact_only: bool = False) -> Optional[CachedAnswer]:
+		"""
+		先按归一化文本精确查找；未命中且给出问题向量时按相似度查找。
+		vector 为 None 的未命中不计入统计（调用方随后会带向量再查），exact_only 为 True 时只做精确查找并计入统计。
+		"""
+		now = time.monotonic()
+		with self._lock:
+			entry_id = self._texts.get((scope, normalize_query(text)))
+			if entry_id is not None:
+				entry = self._entries[entry_id]
+				if entry.expires > now:
+					self._entries.move_to_end(entry_id)
+					self.hits += 1
+					self.exact_hits += 1
+					_HITS.inc()
+					return CachedAnswer(entry.answer, entry.context_chunks, 1.0)
+				self._drop(entry_id)
+			if exact_only:
+				self.misses += 1
+				_MISSES.inc()
+				return None
+			if vector is None:
+				return None
+			best_id, similarity = self._nearest(scope, vector, now)
+			if best_id is None or similarity < self._threshold:
+				self.misses += 1
+				_MISSES.inc()
+				return None
+			entry = self._entries[best_id]
+			self._entries.move_to_end(best_id)
+			self.hits += 1
+			_HITS.inc()
+			return CachedAnswer(entry.answer, entry.context_chunks, similarity)
+
+	def _nearest(self, scope: Tuple[Hashable, ...], vector: Any, now: float) -> Tuple[Optional[int], float]:
+		ids = list(self._scopes.get(scope, ()))
+		for entry_id in ids:
+			if self._entries[entry_id].expires <= now:
+				self._drop(entry_id)
+		ids = [i for i in ids if i in self._entries and self._entries[i].vector is not None]
+		if not ids:
+			return None, 0.0
+		query = _normalized(vector)
+		scores = np.stack([self._entries[i].vector for i in ids]) @ query
+		best = int(np.argmax(scores))
+		return ids[best], float(scores[best])
+
+	def put(self, scope: Tuple[Hashable, ...], text: str, vector: Optional[Any], answer: str, context_chunks: List[str]) -> None:
+		if not answer:
+			return
+		text = normalize_query(text)
+		# 生成期间文档已变化（包括其他 worker 的写入）：版本不一致的回答丢弃
+		if scope[1] != self.version(scope[0]):
+			return
+		with self._lock:
+			previous = self._texts.get((scope, text))
+			if previous is not None:
+				self._drop(previous)
+			entry_id = self._next_id
+			self._next_id += 1
+			self._entries[entry_id] = _Entry(scope, text, _normalized(vector) if vector is not None else None, answer, list(context_chunks), time.monotonic() + self._ttl)
+			self._scopes.setdefault(scope, {})[entry_id] = None
+			self._texts[(scope, text)] = entry_id
+			while len(self._entries) > self._max_entries:
+				self._drop(next(iter(self._entries)))
+
+	def invalidate(self, document_id: str) -> None:
+		"""文档重新入库或删除后调用：释放该文档与全部文档范围的缓存回答（版本变化后它们已不会命中）。"""
+		with self._lock:
+			self.invalidations += 1
+			stale = [s for s in self._scopes if s[0] in (document_id, ALL_DOCUMENTS)]
+			for scope in stale:
+				for entry_id in list(self._scopes[scope]):
+					self._drop(entry_id)
+
+	def clear(self) -> None:
+		"""全部失效（无法确定哪些文档发生了变化时使用）。"""
+		with self._lock:
+			self.invalidations += 1
+			self._entries.clear()
+			self._scopes.clear()
+			self._texts.clear()
+
+	def _drop(self, entry_id: int) -> None:
+		entry = self._entries.pop(entry_id)
+		ids = self._scopes[entry.scope]
+		del ids[entry_id]
+		if not ids:
+			del self._scopes[entry.scope]
+		self._texts.pop((entry.scope, entry.text), None)
+
+	def stats(self) -> Dict[str, Any]:
+		with self._lock:
+			total = self.hits + self.misses
+			return {
+				"hits": self.hits,
+				"exact_hits": self.exact_hits,
+				"misses": self.misses,
+				"hit_rate": self.hits / total if total else 0.0,
+				"entries": len(self._entries),
+				"invalidations": self.invalidations,
+				"threshold": self._threshold,
+			}
+
+
+def _normalized(vector: Any) -> np.ndarray:
+	array = np.asarray(vector, dtype=np.float32).ravel()
+	norm = float(np.linalg.norm(array))
+	return array / norm if norm > 0 else array
+
+
+_caches: Dict[str, AnswerCache] = {}
+_caches_lock = threading.Lock()
+
+
+def loaded_answer_cache(location: str) -> Optional[AnswerCache]:
+	"""已创建的共享回答缓存；尚未创建时返回 None。"""
+	return _caches.get(location)
+
+
+def shared_answer_cache(storage: JSONStorage, cfg: AppConfig) -> AnswerCache:
+	"""进程内按文档存储位置共享一个回答缓存，文档版本取自该存储。"""
+	with _caches_lock:
+		cache = _caches.get(storage.location)
+		if cache is None:
+			cache = _caches[storage.location] = AnswerCache.from_config(cfg, storage.document_versions)
+		return cache
@@ -1,15 +1,42 @@
+import base64
 import hashlib
+import hmac
+import json
+import os
 import secrets
+import threading
 import time
 from datetime import datetime
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
-from ..storage.json_storage import JSONStorage
+from ..storage.json_storage import JSONStorage, create_storage
+
+
+_SIGNED_PREFIX = "v1"
+
+
+def _b64encode(raw: bytes) -> str:
+	return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+	return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
 
 
 class AuthService:
 	def __init__(self, storage: Optional[JSONStorage] = None) -> None:
-		self._storage = storage or JSONStorage()
+		self._storage = storage or create_storage()
+		self._cfg = self._storage._cfg
+		self._secret = self._load_secret()
+		self._revoke_lock = threading.Lock()
+		# jti -> 过期时间；只保存签名令牌中的短随机 id，过期后自动清理。
+		# 文件签名变化（其他 worker 注销了令牌）时重新加载
+		self._revoked_signature: Optional[Tuple[int, int, int]] = None
+		self._revoked: Dict[str, int] = self._load_revoked()
+		# 旧版令牌索引：token -> (user_id, expires_at)，随 users 快照变化重建
+		self._token_index: Dict[str, Tuple[str, int]] = {}
+		self._user_index: Dict[str, Dict[str, Any]] = {}
+		self._indexed_users: Optional[List[Dict[str, Any]]] = None
 
 	def _hash_password(self, password: str, salt: str) -> str:
 		return hashlib.sha256(f"{password}{salt}".encode("utf-8")).hexdigest()
@@ -21,11 +48,104 @@ class AuthService:
 			"created_at": user["created_at"],
 		}
 
-	def _load_users(self) -> Dict[str, Any]:
-		data = self._storage.read_users()
-		if "users" not in data:
-			data["users"] = []
-		return data
+	def _load_secret(self) -> bytes:
+		if self._cfg.auth_secret:
+			return self._cfg.auth_secret.encode("utf-8")
+		path = self._cfg.auth_secret_path
+		try:
+			# O_EXCL 保证多个进程同时启动时只有一个生成密钥
+			fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+		except FileExistsError:
+			with open(path, "r", encoding="utf-8") as f:
+				return f.read().strip().encode("utf-8")
+		secret = secrets.token_hex(32)
+		with os.fdopen(fd, "w", encoding="utf-8") as f:
+			f.write(secret)
+		return secret.encode("utf-8")
+
+	def _revoked_file_signature(self) -> Optional[Tuple[int, int, int]]:
+		try:
+			st = os.stat(self._cfg.revoked_tokens_path)
+		except FileNotFoundError:
+			return None
+		return st.st_ino, st.st_mtime_ns, st.st_size
+
+	def _load_revoked(self) -> Dict[str, int]:
+		self._revoked_signature = self._revoked_file_signature()
+		try:
+			with open(self._cfg.revoked_tokens_path, "r", encoding="utf-8") as f:
+				data = json.load(f)
+		except (FileNotFoundError, ValueError):
+			return {}
+		now = int(time.time())
+		return {jti: exp for jti, exp in data.get("revoked", {}).items() if exp > now}
+
+	def _save_revoked(self) -> None:
+		path = self._cfg.revoked_tokens_path
+		tmp_path = f"{path}.{os.getpid()}.tmp"
+		with open(tmp_path, "w", encoding="utf-8") as f:
+			json.dump({"revoked": self._revoked}, f)
+		os.replace(tmp_path, path)
+		self._revoked_signature = self._revoked_file_signature()
+
+	def _current_revoked(self) -> Dict[str, int]:
+		"""吊销集合；吊销文件被其他 worker 更新后重新加载（每次只需一次 stat）。"""
+		if self._revoked_file_signature() != self._revoked_signature:
+			with self._revoke_lock:
+				if self._revoked_file_signature() != self._revoked_signature:
+					self._revoked = self._load_revoked()
+		return self._revoked
+
+	def _token_expiry(self, entry: Dict[str, Any]) -> int:
+		return int(entry.get("expires_at") or int(entry.get("created_at", 0)) + self._cfg.auth_token_ttl)
+
+	def _prune_tokens(self, tokens: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+		now = int(time.time())
+		alive = [t for t in tokens if self._token_expiry(t) > now]
+		return alive[-self._cfg.auth_max_tokens_per_user:]
+
+	def _issue_signed_token(self, user: Dict[str, Any]) -> str:
+		payload = {
+			"uid": user["user_id"],
+			"usr": user["username"],
+			"cat": user["created_at"],
+			"exp": int(time.time()) + self._cfg.auth_token_ttl,
+			"jti": secrets.token_hex(8),
+		}
+		body = f"{_SIGNED_PREFIX}.{_b64encode(json.dumps(payload, separators=(',', ':')).encode('utf-8'))}"
+		signature = hmac.new(self._secret, body.encode("ascii"), hashlib.sha256).digest()
+		return f"{body}.{_b64encode(signature)}"
+
+	def _decode_signed_token(self, token: str) -> Optional[Dict[str, Any]]:
+		"""校验签名与过期时间，成功返回载荷；不涉及任何文件读写。"""
+		parts = token.split(".")
+		if len(parts) != 3 or parts[0] != _SIGNED_PREFIX:
+			return None
+		# 令牌来自客户端，可能含非 ASCII 字符或任意内容，任何解析失败都视为无效
+		try:
+			body = f"{parts[0]}.{parts[1]}"
+			expected = hmac.new(self._secret, body.encode("ascii"), hashlib.sha256).digest()
+			if not hmac.compare_digest(expected, _b64decode(parts[2])):
+				return None
+			payload = json.loads(_b64decode(parts[1]))
+			if not isinstance(payload, dict) or int(payload.get("exp", 0)) <= time.time():
+				return None
+		except (UnicodeEncodeError, ValueError, TypeError):
+			return None
+		return payload
+
+	def _refresh_token_index(self) -> None:
+		users = self._storage.list_users()
+		# 存储内容未变化时返回的是同一个列表对象，无需重建
+		if users is self._indexed_users:
+			return
+		token_index: Dict[str, Tuple[str, int]] = {}
+		user_index: Dict[str, Dict[str, Any]] = {}
+		for user in users:
+			user_index[user["user_id"]] = user
+			for entry in user.get("tokens", []):
+				token_index[entry.get("token")] = (user["user_id"], self._token_expiry(entry))
+		self._token_index, self._user_index, self._indexed_users = token_index, user_index, users
 
 	def register_user(self, username: str, password: str) -> Dict[str, Any]:
 		username = username.strip()
@@ -34,11 +154,6 @@ class AuthService:
 		if len(password) < 6:
 			raise ValueError("密码长度至少为6位")
 
-		data = self._load_users()
-		for user in data["users"]:
-			if user["username"].lower() == username.lower():
-				raise ValueError("用户名已存在")
-
 		salt = secrets.token_hex(16)
 		password_hash = self._hash_password(password, salt)
 		user_id = secrets.token_hex(12)
@@ -51,17 +166,15 @@ class AuthService:
 			"tokens": [],
 			"created_at": now,
 		}
-		data["users"].append(new_user)
-		self._storage.write_users(data)
+		# 查重与写入在同一把跨进程锁内，多个 worker 同时注册同名用户时只有一个成功
+		with self._storage.lock("users"):
+			if self._storage.find_user(username) is not None:
+				raise ValueError("用户名已存在")
+			self._storage.put_user(new_user)
 		return self._sanitize_user(new_user)
 
 	def authenticate(self, username: str, password: str) -> Dict[str, Any]:
-		data = self._load_users()
-		target_user: Optional[Dict[str, Any]] = None
-		for user in data["users"]:
-			if user["username"].lower() == username.strip().lower():
-				target_user = user
-				break
+		target_user = self._storage.find_user(username)
 		if not target_user:
 			raise ValueError("用户名或密码错误")
 
@@ -69,24 +182,62 @@ class AuthService:
 		if password_hash != target_user["password_hash"]:
 			raise ValueError("用户名或密码错误")
 
+		if self._cfg.auth_token_mode == "signed":
+			# 签名令牌无需落盘，登录不再重写 users.json
+			return {"token": self._issue_signed_token(target_user), "user": self._sanitize_user(target_user)}
+
 		token = secrets.token_hex(24)
+		now = int(time.time())
 		token_entry = {
 			"token": token,
-			"created_at": int(time.time()),
+			"created_at": now,
+			"expires_at": now + self._cfg.auth_token_ttl,
 		}
-		target_user.setdefault("tokens", [])
-		target_user["tokens"].append(token_entry)
-		self._storage.write_users(data)
-		return {"token": token, "user": self._sanitize_user(target_user)}
+		with self._storage.lock("users"):
+			# 锁内重新读取，其他 worker 同时为该用户登录或注销时不会丢失令牌
+			current = self._storage.get_user(target_user["user_id"]) or target_user
+			tokens = self._prune_tokens(current.get("tokens", []) + [token_entry])
+			updated_user = {**current, "tokens": tokens}
+			self._storage.put_user(updated_user)
+		return {"token": token, "user": self._sanitize_user(updated_user)}
 
 	def verify_token(self, token: Optional[str]) -> Optional[Dict[str, Any]]:
 		if not token:
 			return None
-		data = self._load_users()
-		for user in data["users"]:
-			for entry in user.get("tokens", []):
-				if entry.get("token") == token:
-					return self._sanitize_user(user)
-		return None
+		if token.startswith(_SIGNED_PREFIX + "."):
+			payload = self._decode_signed_token(token)
+			if not payload or payload.get("jti") in self._current_revoked():
+				return None
+			return {"user_id": payload["uid"], "username": payload["usr"], "created_at": payload["cat"]}
+
+		# 旧版令牌：哈希索引查找，过期即失效
+		self._refresh_token_index()
+		found = self._token_index.get(token)
+		if not found or found[1] <= time.time():
+			return None
+		user = self._user_index.get(found[0])
+		return self._sanitize_user(user) if user else None
 
+	def revoke_token(self, token: str) -> None:
+		"""注销令牌：签名令牌加入吊销集合，旧版令牌从用户记录中移除。"""
+		payload = self._decode_signed_token(token)
+		if payload is not None:
+			with self._revoke_lock, self._storage.lock("revoked"):
+				# 先合并其他 worker 已写入的吊销记录再追加，避免互相覆盖
+				revoked = self._load_revoked()
+				now = int(time.time())
+				self._revoked = {jti: exp for jti, exp in revoked.items() if exp > now}
+				self._revoked[payload["jti"]] = int(payload["exp"])
+				self._save_revoked()
+			return
 
+		self._refresh_token_index()
+		found = self._token_index.get(token)
+		if found is None:
+			return
+		with self._storage.lock("users"):
+			user = self._storage.get_user(found[0])
+			if user is None:
+				return
+			kept = [t for t in user.get("tokens", []) if t.get("token") != token]
+			self._storage.put_user({**user, "tokens": self._prune_tokens(kept)})
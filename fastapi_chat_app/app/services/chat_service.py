@@ -1,51 +1,251 @@
-from typing import List, Dict, Any, Optional
+import time
+from typing import AsyncIterator, List, Dict, Any, Hashable, Optional, Tuple
+from .answer_cache import ALL_DOCUMENTS, AnswerCache, AnswerLookup, shared_answer_cache
+from .context_assembler import AssembledContext, ContextAssembler, plain_context
 from .embedding_service import EmbeddingService
 from .openai_client import OpenAIClientService
-from ..storage.json_storage import JSONStorage
-from ..storage.vector_storage import VectorStorage
+from .session_service import SessionService
+from ..config import load_config
+from ..storage.ann_index import shared_index
+from ..storage.lexical_index import loaded_lexical_index, shared_lexical_index
+from ..storage.json_storage import JSONStorage, create_storage
+from ..storage.vector_storage import VectorStorage, create_vector_storage
+from ..utils.metrics import RETRIEVAL_SCORING_SECONDS
+
+
+_GLOBAL_SCORING = RETRIEVAL_SCORING_SECONDS.labels("global")
+_LEXICAL_SCORING = RETRIEVAL_SCORING_SECONDS.labels("lexical")
+
+RETRIEVAL_MODES = ("dense", "lexical", "hybrid")
+
+# 回放缓存回答时每个片段的字符数
+_REPLAY_CHARS = 32
+
+
+def reciprocal_rank_fusion(rankings: List[List[Hashable]], k: int = 60) -> List[Tuple[Hashable, float]]:
+	"""倒数排名融合：每一路中排第 r 名（从 1 开始）的条目得 1 / (k + r)，求和后降序排列。"""
+	scores: Dict[Hashable, float] = {}
+	for ranking in rankings:
+		for rank, key in enumerate(ranking, 1):
+			scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+	return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+async def _replay(answer: str) -> AsyncIterator[str]:
+	for start in range(0, len(answer), _REPLAY_CHARS):
+		yield answer[start:start + _REPLAY_CHARS]
+
+
+def _has_history(session: Optional[Dict[str, Any]]) -> bool:
+	return session is not None and bool(session.get("messages") or session.get("summary"))
 
 
 class ChatService:
-	def __init__(self, embedding: Optional[EmbeddingService] = None, client: Optional[OpenAIClientService] = None, json_storage: Optional[JSONStorage] = None, vector_storage: Optional[VectorStorage] = None) -> None:
+	def __init__(self, embedding: Optional[EmbeddingService] = None, client: Optional[OpenAIClientService] = None, json_storage: Optional[JSONStorage] = None, vector_storage: Optional[VectorStorage] = None, sessions: Optional[SessionService] = None) -> None:
 		self._embed = embedding or EmbeddingService()
 		self._client = client or OpenAIClientService()
-		self._js = json_storage or JSONStorage()
-		self._vs = vector_storage or VectorStorage(self._js)
-
-	def _get_document(self, document_id: str) -> Optional[Dict[str, Any]]:
-		data = self._js.read_documents()
-		for doc in data.get("documents", []):
-			if doc.get("document_id") == document_id:
-				return doc
-		return None
-
-	def retrieve_context(self, document_id: Optional[str], query: str, k: int = 5) -> List[str]:
-		"""检索相关文档片段，如果document_id为None则返回空列表"""
+		self._js = json_storage or create_storage()
+		self._vs = vector_storage or create_vector_storage(self._js)
+		self._sessions = sessions or SessionService(self._js, self._client)
+		self._cfg = load_config()
+		self._answers: Optional[AnswerCache] = shared_answer_cache(self._js, self._cfg) if self._cfg.answer_cache_enabled else None
+		self._context: Optional[ContextAssembler] = ContextAssembler.from_config(self._cfg) if self._cfg.context_assembly_enabled else None
+
+	def _mode(self, mode: Optional[str]) -> str:
+		mode = (mode or self._cfg.retrieval_mode).lower()
+		if mode not in RETRIEVAL_MODES:
+			raise ValueError(f"不支持的检索模式: {mode}")
+		return mode
+
+	def _candidate_count(self, k: int) -> int:
+		# 混合检索时两路各取更多候选再融合
+		return max(k * self._cfg.hybrid_candidates_factor, k)
+
+	def search(self, query: str, k: int = 10, nprobe: Optional[int] = None, document_ids: Optional[List[str]] = None, mode: Optional[str] = None) -> List[Dict[str, Any]]:
+		"""跨文档检索：dense 查询全局 ANN 索引，lexical 查询 BM25 索引，hybrid 两路按倒数排名融合。"""
+		if not query:
+			return []
+		mode = self._mode(mode)
+		if mode == "lexical":
+			return self._hydrate(self._lexical_hits(query, k, document_ids))
+		query_vector = self._embed.embed_query(query)
+		return self._search_with_vector(query, query_vector, k, nprobe, document_ids, mode)
+
+	async def asearch(self, query: str, k: int = 10, nprobe: Optional[int] = None, document_ids: Optional[List[str]] = None, mode: Optional[str] = None) -> List[Dict[str, Any]]:
+		"""异步版本：查询向量经合并请求获取，不阻塞事件循环；lexical 模式不调用向量化。"""
+		if not query:
+			return []
+		mode = self._mode(mode)
+		if mode == "lexical":
+			return self._hydrate(self._lexical_hits(query, k, document_ids))
+		query_vector = await self._embed.aembed_query(query)
+		return self._search_with_vector(query, query_vector, k, nprobe, document_ids, mode)
+
+	def _lexical_hits(self, query: str, k: int, document_ids: Optional[List[str]]) -> List[Tuple[str, str, float]]:
+		start = time.perf_counter()
+		hits = shared_lexical_index(self._js).search(query, k=k, document_ids=document_ids)
+		_LEXICAL_SCORING.observe(time.perf_counter() - start)
+		return hits
+
+	def _search_with_vector(self, query: str, query_vector: Any, k: int, nprobe: Optional[int], document_ids: Optional[List[str]], mode: str) -> List[Dict[str, Any]]:
+		n = self._candidate_count(k) if mode == "hybrid" else k
+		start = time.perf_counter()
+		hits = shared_index(self._vs).search(query_vector, k=n, nprobe=nprobe, document_ids=document_ids)
+		_GLOBAL_SCORING.observe(time.perf_counter() - start)
+		if mode == "hybrid":
+			hits = self._fuse(hits, self._lexical_hits(query, n, document_ids), k)
+		return self._hydrate(hits)
+
+	def _fuse(self, dense: List[Tuple[str, str, float]], lexical: List[Tuple[str, str, float]], k: int) -> List[Tuple[str, str, float]]:
+		fused = reciprocal_rank_fusion([[h[:2] for h in dense], [h[:2] for h in lexical]], self._cfg.rrf_k)[:k]
+		return [(document_id, chunk_id, score) for (document_id, chunk_id), score in fused]
+
+	def _hydrate(self, hits: List[Tuple[str, str, float]]) -> List[Dict[str, Any]]:
+		"""把 (document_id, chunk_id, 分数) 补全为带文件名与片段内容的结果。"""
+		docs: Dict[str, Optional[Dict[str, Any]]] = {}
+		chunk_maps: Dict[str, Dict[str, Dict[str, Any]]] = {}
+		results = []
+		for document_id, chunk_id, score in hits:
+			if document_id not in docs:
+				docs[document_id] = self._js.get_document(document_id)
+			doc = docs[document_id]
+			if doc is None:
+				continue
+			if document_id not in chunk_maps:
+				chunk_maps[document_id] = {c["chunk_id"]: c for c in doc.get("chunks", [])}
+			chunk = chunk_maps[document_id].get(chunk_id)
+			if chunk is None:
+				continue
+			results.append(
+				{
+					"document_id": document_id,
+					"filename": doc.get("filename", ""),
+					"chunk_id": chunk_id,
+					"chunk_index": chunk.get("chunk_index"),
+					"content": chunk["content"],
+					"score": score,
+				}
+			)
+		return results
+
+	def _document_candidates(self, document_id: str) -> Optional[Tuple[Any, List[str], Any]]:
+		"""返回单文档检索所需的 (矩阵, 与矩阵行对应的 chunk_id, 量化副本)。"""
+		found = self._vs.get_document_matrix(document_id)
+		if not found or len(found[0]) == 0:
+			return None
+		chunk_ids, matrix = found
+		return matrix, chunk_ids, self._vs.get_quantized_matrix(document_id)
+
+	def _document_hits(self, document_id: str, query: str, ranked: List[Tuple[str, float]], k: int, mode: str) -> List[Tuple[str, str, float]]:
+		dense = [(document_id, chunk_id, score) for chunk_id, score in ranked]
+		if mode == "hybrid":
+			return self._fuse(dense, self._lexical_hits(query, self._candidate_count(k), [document_id]), k)
+		return dense
+
+	def retrieve_passages(self, document_id: Optional[str], query: str, k: int = 5, search_all: bool = False, mode: Optional[str] = None) -> List[Dict[str, Any]]:
+		"""
+		检索相关片段，按相关度降序返回带 document_id、chunk_index 与分数的结果（格式同 search）；
+		search_all 为 True 时检索全部文档，否则document_id为None则返回空列表
+		"""
+		if search_all:
+			return self.search(query, k=k, mode=mode)
 		if not document_id:
 			return []
-		doc = self._get_document(document_id)
-		if not doc:
+		mode = self._mode(mode)
+		if mode == "lexical":
+			return self._hydrate(self._lexical_hits(query, k, [document_id]))
+		candidates = self._document_candidates(document_id)
+		if candidates is None:
 			return []
-		vecs = self._vs.get_document_vectors(document_id)
-		if not vecs:
+		matrix, chunk_ids, quantized = candidates
+		n = self._candidate_count(k) if mode == "hybrid" else k
+		# 以 chunk_id 作为排序对象，结果再经 _hydrate 补全内容
+		ranked = self._embed.top_k(query, matrix, chunk_ids, k=n, quantized=quantized)
+		return self._hydrate(self._document_hits(document_id, query, ranked, k, mode))
+
+	async def aretrieve_passages(self, document_id: Optional[str], query: str, k: int = 5, search_all: bool = False, mode: Optional[str] = None) -> List[Dict[str, Any]]:
+		"""retrieve_passages 的异步版本，供接口层在事件循环中调用。"""
+		if search_all:
+			return await self.asearch(query, k=k, mode=mode)
+		if not document_id:
 			return []
-		chunk_map = {c["chunk_id"]: c["content"] for c in doc.get("chunks", [])}
-		chunk_ids = [x["chunk_id"] for x in vecs.get("chunk_vectors", [])]
-		vectors = [x["vector"] for x in vecs.get("chunk_vectors", [])]
-		chunks = [chunk_map.get(cid, "") for cid in chunk_ids]
-		top = self._embed.top_k(query, vectors, chunks, k=k)
-		return [t[0] for t in top]
-
-	async def stream_answer(self, document_id: Optional[str], user_message: str):
+		mode = self._mode(mode)
+		if mode == "lexical":
+			return self._hydrate(self._lexical_hits(query, k, [document_id]))
+		candidates = self._document_candidates(document_id)
+		if candidates is None:
+			return []
+		matrix, chunk_ids, quantized = candidates
+		n = self._candidate_count(k) if mode == "hybrid" else k
+		ranked = await self._embed.atop_k(query, matrix, chunk_ids, k=n, quantized=quantized)
+		return self._hydrate(self._document_hits(document_id, query, ranked, k, mode))
+
+	def retrieve_context(self, document_id: Optional[str], query: str, k: int = 5, search_all: bool = False, mode: Optional[str] = None) -> List[str]:
+		"""检索相关文档片段的内容；search_all 为 True 时检索全部文档，否则document_id为None则返回空列表"""
+		return [p["content"] for p in self.retrieve_passages(document_id, query, k=k, search_all=search_all, mode=mode)]
+
+	async def aretrieve_context(self, document_id: Optional[str], query: str, k: int = 5, search_all: bool = False, mode: Optional[str] = None) -> List[str]:
+		"""retrieve_context 的异步版本，供接口层在事件循环中调用。"""
+		return [p["content"] for p in await self.aretrieve_passages(document_id, query, k=k, search_all=search_all, mode=mode)]
+
+	async def aassemble_context(self, document_id: Optional[str], query: str, k: int = 5, search_all: bool = False, mode: Optional[str] = None) -> AssembledContext:
+		"""检索 k * CONTEXT_CANDIDATES_FACTOR 个候选并组装成提示上下文（去重叠、MMR、token 预算）；关闭组装时为前 k 个片段。"""
+		if self._context is None:
+			return plain_context(await self.aretrieve_passages(document_id, query, k=k, search_all=search_all, mode=mode))
+		passages = await self.aretrieve_passages(document_id, query, k=k * self._cfg.context_candidates_factor, search_all=search_all, mode=mode)
+		return self._context.assemble(passages, k)
+
+	def _answer_key(self, document_id: Optional[str], search_all: bool, mode: Optional[str]) -> Optional[Tuple[Hashable, ...]]:
+		"""回答缓存的范围键；缓存关闭或通用聊天（不检索文档）时返回 None。"""
+		if self._answers is None or not (document_id or search_all):
+			return None
+		return self._answers.key(ALL_DOCUMENTS if search_all else document_id, self._mode(mode), self._embed.embedding_model)
+
+	async def lookup_answer(self, document_id: Optional[str], user_message: str, search_all: bool = False, mode: Optional[str] = None, session: Optional[Dict[str, Any]] = None) -> Optional[AnswerLookup]:
+		"""
+		查找缓存的回答：归一化后相同的问题直接命中，否则向量化问题后按相似度查找；lexical 模式只做精确查找，不调用向量化。
+		缓存不适用（关闭、通用聊天或会话已有历史）时返回 None。
+		"""
+		key = self._answer_key(document_id, search_all, mode)
+		if key is None or _has_history(session):
+			return None
+		if key[2] == "lexical":
+			return AnswerLookup(self._answers.get(key, user_message, exact_only=True), None)
+		cached = self._answers.get(key, user_message)
+		if cached is not None:
+			return AnswerLookup(cached, None)
+		vector = await self._embed.aembed_query(user_message)
+		return AnswerLookup(self._answers.get(key, user_message, vector), vector)
+
+	async def stream_answer(self, document_id: Optional[str], user_message: str, search_all: bool = False, context_chunks: Optional[List[str]] = None, mode: Optional[str] = None, lookup: Optional[AnswerLookup] = None, session: Optional[Dict[str, Any]] = None):
 		"""
 		流式生成回答
 		document_id: 可选的文档ID，如果为None则使用通用聊天模式
 		user_message: 用户消息
+		search_all: 为 True 时基于全部文档检索（忽略 document_id）
+		context_chunks: 调用方已检索好的片段，传入时不再重复检索
+		mode: 检索模式 dense / lexical / hybrid，默认取 RETRIEVAL_MODE
+		lookup: 调用方的回答缓存查找结果，命中时直接回放，未命中时写入缓存复用其中的问题向量；未传入且未传入 context_chunks 时在此查找
+		session: 调用方已校验归属的会话记录；提示中加入按预算组装的历史，完整回答后记入会话。
+		         有历史时回答依赖上文，不查找也不写入回答缓存
 		"""
-		context_chunks = []
-		if document_id:
-			# 有文档ID时，使用RAG模式
-			context_chunks = self.retrieve_context(document_id, user_message, k=5)
+		history = self._sessions.prompt_history(session) if _has_history(session) else []
+		key = None if history else self._answer_key(document_id, search_all, mode)
+		if lookup is None and context_chunks is None and key is not None:
+			lookup = await self.lookup_answer(document_id, user_message, search_all=search_all, mode=mode)
+		cached = lookup.cached if lookup is not None else None
+		if cached is not None:
+			async for part in _replay(cached.answer):
+				yield part
+			if session is not None:
+				self._sessions.record_turn(session, user_message, cached.answer)
+			return
+
+		if context_chunks is None:
+			context_chunks = []
+			if document_id or search_all:
+				# 有文档ID时，使用RAG模式
+				context_chunks = (await self.aassemble_context(document_id, user_message, k=5, search_all=search_all, mode=mode)).chunks
 		
 		if context_chunks:
 			# RAG模式：基于文档片段回答
@@ -53,6 +253,7 @@ class ChatService:
 			context_block = "\n\n".join([f"[片段{i+1}]\n{c}" for i, c in enumerate(context_chunks)])
 			messages = [
 				{"role": "system", "content": system_prompt},
+				*history,
 				{"role": "user", "content": f"参考文档片段：\n{context_block}\n\n问题：{user_message}"},
 			]
 		else:
@@ -60,11 +261,39 @@ class ChatService:
 			system_prompt = "你是甜心助手，一个温暖、贴心、友善的AI助手。请用甜美、温和的语气回答用户的问题，提供有帮助的信息。"
 			messages = [
 				{"role": "system", "content": system_prompt},
+				*history,
 				{"role": "user", "content": user_message},
 			]
 		
+		parts: List[str] = []
 		async for token in self._client.stream_chat(messages):
+			parts.append(token)
 			yield token
+		# 完整生成后才写入缓存与会话，中途出错或客户端断开的回答不会被记录
+		answer = "".join(parts)
+		if key is not None:
+			# 复用查找时的问题向量，不再等待向量化；没有向量时只能按文本精确命中
+			try:
+				self._answers.put(key, user_message, lookup.vector if lookup is not None else None, answer, context_chunks)
+			except Exception as exc:
+				print(f"[WARN] Failed to cache answer: {exc}")
+		if session is not None:
+			self._sessions.record_turn(session, user_message, answer)
+
+	def stats(self) -> Dict[str, Any]:
+		lexical_index = loaded_lexical_index(self._js.location)
+		return {
+			"query_embedding_cache": self._embed.query_cache_stats(),
+			"storage_cache": self._js.cache_stats(),
+			"query_batching": self._embed.query_batch_stats(),
+			"retrieval_mode": self._cfg.retrieval_mode,
+			# 尚未有词法检索时索引不会构建
+			"lexical_index": lexical_index.stats() if lexical_index is not None else None,
+			"answer_cache": self._answers.stats() if self._answers is not None else None,
+			"sessions": self._sessions.stats(),
+			# 上下文组装累计的估算 token：直接拼接前 k 个片段（baseline）与组装后的对比
+			"context": self._context.stats() if self._context is not None else None,
+		}
 
 	def get_recommendations(self, limit: int = 8) -> List[str]:
 		"""返回推荐问题列表"""
@@ -75,14 +304,11 @@ class ChatService:
 			"文档中是否有需要注意的风险点？",
 			"请将文档内容转换成要点说明。",
 		]
-		documents = self._js.read_documents().get("documents", [])
-		if documents:
-			# 按上传时间倒序排序
-			sorted_docs = sorted(documents, key=lambda d: d.get("upload_time", ""), reverse=True)
-			for doc in sorted_docs[:3]:
-				filename = doc.get("filename", "文档")
-				base_recommendations.append(f"总结一下《{filename}》的主要内容。")
-				base_recommendations.append(f"《{filename}》中有哪些重点？")
+		# 存储层按上传时间倒序给出最近的文档，不读取分块内容
+		for doc in self._js.recent_documents(3):
+			filename = doc.get("filename", "文档")
+			base_recommendations.append(f"总结一下《{filename}》的主要内容。")
+			base_recommendations.append(f"《{filename}》中有哪些重点？")
 		# 去重保持顺序
 		seen = set()
 		unique = []
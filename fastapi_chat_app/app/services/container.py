@@ -0,0 +1,78 @@
+import asyncio
+from typing import Optional
+
+from ..config import AppConfig, load_config
+from ..storage.json_storage import JSONStorage, create_storage
+from ..storage.vector_storage import VectorStorage, create_vector_storage
+from .auth_service import AuthService
+from .chat_service import ChatService
+from .document_service import DocumentService
+from .embedding_providers import create_embedding_provider
+from .embedding_service import EmbeddingService
+from .ingestion_queue import IngestionQueue
+from .session_service import SessionService
+from .openai_client import OpenAIClientService, create_async_http_client, create_http_client, http2_available
+
+
+# 过期会话的清理间隔（秒）
+_SESSION_EXPIRE_INTERVAL = 3600
+
+
+class ServiceContainer:
+	"""
+	应用级服务容器：整个进程共用一套存储、一对 OpenAI 客户端（同步/异步各一个连接池）与各业务服务。
+	由 main.py 的 lifespan 创建，启动时预热连接并启动入库 worker，关闭时依次停止并释放连接。
+	"""
+
+	def __init__(self, cfg: Optional[AppConfig] = None) -> None:
+		self.cfg = cfg or load_config()
+		self.storage: JSONStorage = create_storage()
+		self.vector_storage: VectorStorage = create_vector_storage(self.storage)
+		self.http2 = self.cfg.http2 and http2_available()
+		self.openai = OpenAIClientService(self.cfg, create_http_client(self.cfg), create_async_http_client(self.cfg))
+		self.embedding = EmbeddingService(create_embedding_provider(self.cfg, self.openai))
+		self.sessions = SessionService(self.storage, self.openai, self.cfg)
+		self.chat = ChatService(self.embedding, self.openai, self.storage, self.vector_storage, self.sessions)
+		self.documents = DocumentService(self.storage, self.vector_storage, self.embedding)
+		self.auth = AuthService(self.storage)
+		self.ingestion = IngestionQueue(self.documents, self.storage)
+		self._sync_task: Optional[asyncio.Task] = None
+		self._expire_task: Optional[asyncio.Task] = None
+
+	async def start(self) -> None:
+		if self.cfg.http_warmup:
+			warmed = await self.openai.warmup()
+			print(f"[INFO] Warmed {warmed} connection(s) to {self.cfg.base_url} (http2={self.http2})")
+		# 启动文档入库 worker，并恢复上次未完成的任务
+		await self.ingestion.start()
+		# 定期应用其他 worker 的文档变更
+		self._sync_task = asyncio.create_task(self._sync_changes())
+		# 定期清理过期的聊天会话
+		self._expire_task = asyncio.create_task(self._expire_sessions())
+
+	async def _sync_changes(self) -> None:
+		interval = self.cfg.change_poll_ms / 1000
+		while True:
+			await asyncio.sleep(interval)
+			try:
+				self.documents.sync_changes()
+			except Exception as exc:
+				print(f"[WARN] Failed to apply document changes from other workers: {exc}")
+
+	async def _expire_sessions(self) -> None:
+		while True:
+			try:
+				await asyncio.to_thread(self.sessions.expire)
+			except Exception as exc:
+				print(f"[WARN] Failed to expire chat sessions: {exc}")
+			await asyncio.sleep(_SESSION_EXPIRE_INTERVAL)
+
+	async def close(self) -> None:
+		tasks = [t for t in (self._sync_task, self._expire_task) if t is not None]
+		for task in tasks:
+			task.cancel()
+		await asyncio.gather(*tasks, return_exceptions=True)
+		await self.ingestion.stop()
+		# 取消进行中的会话摘要，未写入的摘要在下一轮对话时重新生成
+		await self.sessions.close()
+		await self.openai.aclose()
@@ -0,0 +1,217 @@
+import threading
+import unicodedata
+from typing import Any, Dict, FrozenSet, List, NamedTuple, Optional, Tuple
+
+from ..config import AppConfig
+from ..utils.metrics import CONTEXT_TOKENS
+from ..utils.text_processor import estimate_tokens, token_counts
+
+
+# 片段相似度按字符 n-gram 集合的 Jaccard 系数计算
+_SHINGLE_CHARS = 4
+
+# 每个片段在提示中除正文外的开销（"[片段n]" 标记与分隔），按估算 token 计
+_SPAN_OVERHEAD = 6
+
+# 相邻分块重叠部分的查找范围（字符）：切分时的重叠为 100 字符，远小于该值
+_OVERLAP_WINDOW = 256
+
+_BASELINE_TOKENS = CONTEXT_TOKENS.labels("baseline")
+_ASSEMBLED_TOKENS = CONTEXT_TOKENS.labels("assembled")
+
+
+class AssembledContext(NamedTuple):
+	chunks: List[str]
+	# 组装后上下文的估算 token 数，以及直接拼接前 k 个检索结果时的估算 token 数
+	tokens: int
+	baseline_tokens: int
+
+	@property
+	def saved_tokens(self) -> int:
+		return self.baseline_tokens - self.tokens
+
+
+def _span_tokens(content: str) -> int:
+	return estimate_tokens(content) + _SPAN_OVERHEAD
+
+
+def _overlap(left: str, right: str) -> int:
+	"""
+	left 的结尾与 right 的开头重合的最长字符数（相邻分块切分时保留的重叠部分）。
+	right 整体是 left 的结尾时（同一片段被重复检索到）返回 len(right)，否则只在 left 末尾 _OVERLAP_WINDOW 个字符内查找，
+	且只检查与 right 首字符相同的位置，最靠前的匹配即最长重叠。
+	"""
+	if left.endswith(right):
+		return len(right)
+	tail = left[-_OVERLAP_WINDOW:]
+	start = tail.find(right[0])
+	while start >= 0:
+		if right.startswith(tail[start:]):
+			return len(tail) - start
+		start = tail.find(right[0], start + 1)
+	return 0
+
+
+def _shingles(content: str) -> FrozenSet[str]:
+	text = "".join(unicodedata.normalize("NFKC", content).lower().split())
+	if len(text) <= _SHINGLE_CHARS:
+		return frozenset([text]) if text else frozenset()
+	return frozenset(text[i:i + _SHINGLE_CHARS] for i in range(len(text) - _SHINGLE_CHARS + 1))
+
+
+def _jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+	if not a or not b:
+		return 0.0
+	return len(a & b) / len(a | b)
+
+
+class _SpanCosts:
+	"""
+	一次组装内按候选缓存的 token 估算输入：片段正文的字符计数，以及接在同文档前一片段之后的非重叠部分的字符计数。
+	合并段的估算由各部分计数相加得到，与对合并后的文本调用 estimate_tokens 的结果相同；MMR 每轮判断预算时无需重新拼接和扫描文本。
+	"""
+
+	def __init__(self) -> None:
+		self._counts: Dict[Tuple[Optional[int], int], Tuple[int, int]] = {}
+
+	def _part(self, previous: Optional[Dict[str, Any]], passage: Dict[str, Any]) -> Tuple[int, int]:
+		key = (id(previous) if previous is not None else None, id(passage))
+		counts = self._counts.get(key)
+		if counts is None:
+			content = passage["content"]
+			if previous is not None:
+				content = content[_overlap(previous["content"], content):]
+			counts = self._counts[key] = token_counts(content)
+		return counts
+
+	def span_tokens(self, group: List[Dict[str, Any]]) -> int:
+		wide = other = 0
+		previous = None
+		for passage in group:
+			part_wide, part_other = self._part(previous, passage)
+			wide += part_wide
+			other += part_other
+			previous = passage
+		return wide + (other + 3) // 4 + _SPAN_OVERHEAD
+
+
+def plain_context(passages: List[Dict[str, Any]]) -> AssembledContext:
+	"""不做组装：按检索顺序直接拼接（CONTEXT_ASSEMBLY_ENABLED=false 时使用）。"""
+	tokens = sum(_span_tokens(p["content"]) for p in passages)
+	return AssembledContext([p["content"] for p in passages], tokens, tokens)
+
+
+class ContextAssembler:
+	"""
+	检索结果到提示上下文的组装：从按相关度排好的候选中以最大边际相关性（MMR）选出至多 k 个片段，
+	与已选片段近乎重复（字符 4-gram 集合的 Jaccard 系数不低于 dedupe_threshold）的候选直接跳过；
+	同一文档相邻的片段按文档顺序合并成一段并去掉切分时的重叠，合并后的总量不超过 max_tokens。片段间相似度只看文本，不需要向量。
+	"""
+
+	def __init__(self, max_tokens: int, mmr_lambda: float, dedupe_threshold: float) -> None:
+		self._max_tokens = max_tokens
+		self._lambda = mmr_lambda
+		self._dedupe_threshold = dedupe_threshold
+		self._lock = threading.Lock()
+		self.assembled = 0
+		self.baseline_tokens = 0
+		self.tokens = 0
+
+	@classmethod
+	def from_config(cls, cfg: AppConfig) -> "ContextAssembler":
+		return cls(cfg.context_max_tokens, cfg.context_mmr_lambda, cfg.context_dedupe_threshold)
+
+	def assemble(self, passages: List[Dict[str, Any]], k: int) -> AssembledContext:
+		"""passages 为按相关度降序的检索结果（retrieve_passages 的返回值），可以多于 k 个。"""
+		baseline = sum(_span_tokens(p["content"]) for p in passages[:k])
+		selected = self._select(passages, k)
+		spans = self._spans(selected)
+		result = AssembledContext(spans, sum(_span_tokens(s) for s in spans), baseline)
+		_BASELINE_TOKENS.observe(result.baseline_tokens)
+		_ASSEMBLED_TOKENS.observe(result.tokens)
+		with self._lock:
+			self.assembled += 1
+			self.baseline_tokens += result.baseline_tokens
+			self.tokens += result.tokens
+		return result
+
+	def _select(self, passages: List[Dict[str, Any]], k: int) -> List[Dict[str, Any]]:
+		if not passages:
+			return []
+		# 各检索模式的分数量纲不同（余弦、BM25、RRF），先归一化到 [0, 1]
+		scores = [float(p.get("score") or 0.0) for p in passages]
+		low, high = min(scores), max(scores)
+		relevance = [(s - low) / (high - low) if high > low else 1.0 for s in scores]
+		shingles = [_shingles(p["content"]) for p in passages]
+		costs = _SpanCosts()
+		max_similarity = [0.0] * len(passages)
+		remaining = list(range(len(passages)))
+		selected: List[Dict[str, Any]] = []
+		while remaining and len(selected) < k:
+			best = max(remaining, key=lambda i: self._lambda * relevance[i] - (1 - self._lambda) * max_similarity[i])
+			remaining.remove(best)
+			candidate = passages[best]
+			if selected and max_similarity[best] >= self._dedupe_threshold:
+				continue
+			if self._fits(selected + [candidate], costs):
+				selected.append(candidate)
+			elif not selected:
+				# 最相关的片段单独就超出预算时截断保留
+				selected.append({**candidate, "content": self._truncate(candidate["content"])})
+			else:
+				continue
+			for i in remaining:
+				max_similarity[i] = max(max_similarity[i], _jaccard(shingles[i], shingles[best]))
+		return selected
+
+	def _fits(self, selected: List[Dict[str, Any]], costs: _SpanCosts) -> bool:
+		return sum(costs.span_tokens(group) for group in self._groups(selected)) <= self._max_tokens
+
+	def _truncate(self, content: str) -> str:
+		budget = self._max_tokens - _SPAN_OVERHEAD
+		while content and estimate_tokens(content) > budget:
+			content = content[:max(int(len(content) * budget / estimate_tokens(content)), 0)]
+		return content
+
+	@classmethod
+	def _spans(cls, selected: List[Dict[str, Any]]) -> List[str]:
+		spans = []
+		for group in cls._groups(selected):
+			text = group[0]["content"]
+			for previous, passage in zip(group, group[1:]):
+				# 合并后的文本总以前一片段结尾，重叠只需与前一片段比较；同一片段被重复检索到（序号相同）时完全重合
+				text += passage["content"][_overlap(previous["content"], passage["content"]):]
+			spans.append(text)
+		return spans
+
+	@staticmethod
+	def _groups(selected: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+		"""同一文档相邻序号的片段分为一组；各组按其中最相关片段的名次排列，组内按文档顺序。"""
+		order = {id(p): rank for rank, p in enumerate(selected)}
+		ordered = sorted(selected, key=lambda p: (p.get("document_id") or "", p.get("chunk_index") if p.get("chunk_index") is not None else -1, order[id(p)]))
+		groups: List[List[Dict[str, Any]]] = []
+		for passage in ordered:
+			previous = groups[-1][-1] if groups else None
+			if (
+				previous is not None
+				and passage.get("chunk_index") is not None
+				and previous.get("chunk_index") is not None
+				and passage.get("document_id") == previous.get("document_id")
+				and passage["chunk_index"] - previous["chunk_index"] <= 1
+			):
+				groups[-1].append(passage)
+			else:
+				groups.append([passage])
+		groups.sort(key=lambda group: min(order[id(p)] for p in group))
+		return groups
+
+	def stats(self) -> Dict[str, Any]:
+		with self._lock:
+			return {
+				"assembled": self.assembled,
+				"max_tokens": self._max_tokens,
+				"baseline_tokens": self.baseline_tokens,
+				"tokens": self.tokens,
+				"saved_tokens": self.baseline_tokens - self.tokens,
+				"saved_ratio": (self.baseline_tokens - self.tokens) / self.baseline_tokens if self.baseline_tokens else 0.0,
+			}
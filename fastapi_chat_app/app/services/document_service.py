@@ -1,46 +1,196 @@
 from __future__ import annotations
-from typing import List, Dict, Any, Tuple
+from typing import Iterable, Iterator, List, Dict, Any, Tuple
 from ..models.document import Document, DocumentChunk
-from ..storage.json_storage import JSONStorage
-from ..storage.vector_storage import VectorStorage
+from ..storage.ann_index import discard_index, loaded_index
+from ..storage.change_feed import ChangeFeed
+from ..storage.json_storage import JSONStorage, create_storage
+from ..storage.lexical_index import discard_lexical_index, loaded_lexical_index
+from ..storage.vector_storage import VectorStorage, create_vector_storage
+from .answer_cache import loaded_answer_cache
 from .embedding_service import EmbeddingService
-from ..utils.text_processor import split_text_into_chunks
+from .openai_client import ProgressCallback
+from ..utils.text_processor import iter_text_chunks, split_text_into_chunks
 import os
+import uuid
 
 
 class DocumentService:
 	def __init__(self, json_storage: JSONStorage | None = None, vector_storage: VectorStorage | None = None, embedding: EmbeddingService | None = None) -> None:
-		self._js = json_storage or JSONStorage()
-		self._vs = vector_storage or VectorStorage(self._js)
+		self._js = json_storage or create_storage()
+		self._vs = vector_storage or create_vector_storage(self._js)
 		self._embedding = embedding or EmbeddingService()
+		self._cfg = self._js._cfg
+		# 多 worker 部署时通知其他进程：它们据此更新进程内的索引与回答缓存
+		self._changes = ChangeFeed(self._cfg.changes_path, self._cfg.change_feed_max_bytes)
 
-	def list_documents(self) -> List[Dict[str, Any]]:
-		data = self._js.read_documents()
-		return data.get("documents", [])
+	def list_documents(self, include_chunks: bool = True) -> List[Dict[str, Any]]:
+		return self._js.list_documents(include_chunks=include_chunks)
 
 	def delete_document(self, document_id: str) -> None:
-		data = self._js.read_documents()
-		data["documents"] = [d for d in data.get("documents", []) if d.get("document_id") != document_id]
-		self._js.write_documents(data)
+		self._js.delete_document(document_id)
 		self._vs.delete_document_vectors(document_id)
+		index = loaded_lexical_index(self._js.location)
+		if index is not None:
+			index.remove(document_id)
+		self._document_changed(document_id, "delete")
+
+	def _document_changed(self, document_id: str, op: str = "put") -> None:
+		# 文档内容或向量变化后，基于旧版本生成的缓存回答失效，并通知其他进程
+		cache = loaded_answer_cache(self._js.location)
+		if cache is not None:
+			cache.invalidate(document_id)
+		self._changes.publish(op, document_id)
+
+	def sync_changes(self) -> int:
+		"""
+		应用其他进程写入的文档变更：已加载的词法索引、全局向量索引与回答缓存随之更新，返回涉及的文档数。
+		变更日志被轮换过（可能错过了部分变更）时丢弃这些进程内索引，下次使用时从存储重建。
+		"""
+		events = self._changes.poll()
+		if events is None:
+			discard_lexical_index(self._js.location)
+			discard_index(self._vs.location)
+			cache = loaded_answer_cache(self._js.location)
+			if cache is not None:
+				cache.clear()
+			return 0
+		# 同一文档的多次变更只需按最后状态处理一次
+		latest = {e["document_id"]: e["op"] for e in events}
+		for document_id, op in latest.items():
+			self._apply_change(document_id, op)
+		return len(latest)
+
+	def _apply_change(self, document_id: str, op: str) -> None:
+		lexical = loaded_lexical_index(self._js.location)
+		if lexical is not None:
+			record = self._js.get_document(document_id) if op == "put" else None
+			if record is not None:
+				lexical.add(document_id, [(c["chunk_id"], c["content"]) for c in record.get("chunks", [])])
+			else:
+				lexical.remove(document_id)
+		ann = loaded_index(self._vs.location)
+		if ann is not None:
+			found = self._vs.get_document_matrix(document_id) if op == "put" else None
+			if found is not None and len(found[0]):
+				ann.add(document_id, found[0], found[1])
+			else:
+				ann.remove(document_id)
+		cache = loaded_answer_cache(self._js.location)
+		if cache is not None:
+			cache.invalidate(document_id)
 
 	def _persist_document(self, doc: Document) -> None:
-		data = self._js.read_documents()
-		data["documents"] = [d for d in data.get("documents", []) if d.get("document_id") != doc.document_id]
-		data["documents"].append(doc.model_dump())
-		self._js.write_documents(data)
+		self._persist_record(doc.model_dump())
 
-	def process_text(self, filename: str, text: str) -> Tuple[Document, int]:
+	def _persist_record(self, record: Dict[str, Any]) -> None:
+		self._js.put_document(record)
+		# 词法索引已加载时增量更新；未加载时首次查询会从存储全量构建
+		index = loaded_lexical_index(self._js.location)
+		if index is not None:
+			index.add(record["document_id"], [(c["chunk_id"], c["content"]) for c in record.get("chunks", [])])
+		self._document_changed(record["document_id"])
+
+	def _build_document(self, filename: str, text: str, document_id: str | None = None) -> Document:
 		chunks_text = split_text_into_chunks(text)
 		chunks: List[DocumentChunk] = []
 		for idx, c in enumerate(chunks_text):
 			chunks.append(DocumentChunk(content=c, chunk_index=idx))
 		doc = Document(filename=filename, chunks=chunks, metadata={"total_chunks": len(chunks), "file_size": len(text)})
-		self._persist_document(doc)
-		vectors = self._embedding.embed_chunks([c.content for c in chunks])
+		if document_id:
+			doc.document_id = document_id
+		return doc
+
+	def _store_vectors(self, doc: Document, vectors: List[List[float]]) -> None:
 		dim = len(vectors[0]) if vectors else 0
-		self._vs.upsert_document_vectors(doc.document_id, [c.chunk_id for c in chunks], vectors, dim)
-		return doc, len(chunks)
+		self._vs.upsert_document_vectors(doc.document_id, [c.chunk_id for c in doc.chunks], vectors, dim)
+		self._document_changed(doc.document_id)
+
+	def process_text(self, filename: str, text: str) -> Tuple[Document, int]:
+		doc = self._build_document(filename, text)
+		self._persist_document(doc)
+		vectors = self._embedding.embed_chunks([c.content for c in doc.chunks])
+		self._store_vectors(doc, vectors)
+		return doc, len(doc.chunks)
+
+	async def aprocess_text(self, filename: str, text: str, on_progress: ProgressCallback | None = None, document_id: str | None = None) -> Tuple[Document, int]:
+		"""
+		异步版本：向量化按批并发执行，不阻塞事件循环。
+		document_id 由入库任务预先分配，任务重跑时覆盖同一文档。
+		"""
+		doc = self._build_document(filename, text, document_id)
+		self._persist_document(doc)
+		if on_progress:
+			on_progress(0, len(doc.chunks))
+		vectors = await self._embedding.aembed_chunks([c.content for c in doc.chunks], on_progress=on_progress)
+		self._store_vectors(doc, vectors)
+		return doc, len(doc.chunks)
+
+	async def aprocess_stream(self, filename: str, pieces: Iterable[str], on_progress: ProgressCallback | None = None, document_id: str | None = None, stats: Dict[str, int] | None = None) -> Tuple[str, int]:
+		"""
+		流式入库：文本片段边切分边按窗口（ingest_window_chunks 块）向量化，向量与分块逐窗口追加写入存储，
+		内存中只保留当前窗口与计数，不构造整份文本或 pydantic 对象。全部完成后才提交向量与文档记录，返回 (document_id, 块数)。
+		on_progress(已向量化块数, 0) 在每个窗口完成后调用，总块数在读完输入前未知。
+		stats 用于累加本次入库的向量缓存命中/未命中数，同时记录在文档 metadata 中。
+		"""
+		document_id = document_id or str(uuid.uuid4())
+		stats = stats if stats is not None else {}
+		writer = self._vs.open_writer(document_id)
+		chunk_writer = self._js.open_chunk_writer(document_id)
+		window: List[Dict[str, Any]] = []
+		file_size = 0
+
+		def counted() -> Iterator[str]:
+			nonlocal file_size
+			for piece in pieces:
+				file_size += len(piece)
+				yield piece
+
+		async def flush() -> None:
+			vectors = await self._embedding.aembed_chunks([c["content"] for c in window], stats=stats)
+			writer.append([c["chunk_id"] for c in window], vectors)
+			chunk_writer.append(window)
+			window.clear()
+			if on_progress:
+				on_progress(chunk_writer.count, 0)
+
+		try:
+			for idx, content in enumerate(iter_text_chunks(counted())):
+				window.append({"chunk_id": str(uuid.uuid4()), "content": content, "chunk_index": idx})
+				if len(window) >= self._cfg.ingest_window_chunks:
+					await flush()
+			if window:
+				await flush()
+			writer.commit()
+		except BaseException:
+			writer.abort()
+			chunk_writer.abort()
+			raise
+		# 分块已在临时位置写完，提交只写入文档头信息（json 后端替换分块文件并更新清单，log 后端整条追加，sqlite 在一个事务内移入）
+		record = Document(document_id=document_id, filename=filename, chunks=[], metadata={"total_chunks": chunk_writer.count, "file_size": file_size, "embedding_cache": dict(stats)}).model_dump()
+		try:
+			chunk_writer.commit(record)
+		except BaseException:
+			chunk_writer.abort()
+			raise
+		# 词法索引已加载时才需要读回分块更新它（索引本身就保存全部分块内容）
+		index = loaded_lexical_index(self._js.location)
+		if index is not None:
+			stored = self._js.get_document(document_id)
+			if stored is not None:
+				index.add(document_id, [(c["chunk_id"], c["content"]) for c in stored.get("chunks", [])])
+		self._document_changed(document_id)
+		return document_id, chunk_writer.count
+
+	def reembed_document(self, document_id: str) -> int:
+		"""用当前的向量化实现重新生成已存文档的全部向量（切换 EMBEDDING_PROVIDER 后使用），返回块数。"""
+		record = self._js.get_document(document_id)
+		if not record:
+			return 0
+		chunks = record.get("chunks", [])
+		vectors = self._embedding.embed_chunks([c["content"] for c in chunks])
+		self._vs.upsert_document_vectors(document_id, [c["chunk_id"] for c in chunks], vectors, len(vectors[0]) if vectors else 0)
+		self._document_changed(document_id)
+		return len(chunks)
 
 	def load_text_file(self, filepath: str) -> str:
 		with open(filepath, "r", encoding="utf-8") as f:
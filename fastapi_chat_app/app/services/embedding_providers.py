@@ -0,0 +1,151 @@
+import argparse
+import asyncio
+from typing import List, Optional, Protocol, Sequence
+
+import numpy as np
+
+from ..config import AppConfig, load_config
+from .openai_client import OpenAIClientService, ProgressCallback
+from .query_cache import normalize_query
+
+
+class EmbeddingProvider(Protocol):
+	"""
+	EmbeddingService 使用的向量化接口。remote 为 True 时向量化有网络开销，
+	EmbeddingService 才启用块向量缓存与查询合并请求。
+	"""
+
+	remote: bool
+
+	@property
+	def embedding_model(self) -> str: ...
+
+	def embed_texts(self, texts: List[str]) -> List[List[float]]: ...
+
+	async def aembed_texts(self, texts: List[str], on_progress: Optional[ProgressCallback] = None) -> List[List[float]]: ...
+
+
+# 64 位乘法哈希常数（splitmix64），numpy 的 uint64 数组运算按 2^64 取模
+_MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX_2 = np.uint64(0x94D049BB133111EB)
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _mix(h: np.ndarray) -> np.ndarray:
+	h = (h ^ (h >> np.uint64(30))) * _MIX_1
+	h = (h ^ (h >> np.uint64(27))) * _MIX_2
+	return h ^ (h >> np.uint64(31))
+
+
+class LocalHashEmbedder:
+	"""
+	进程内的字符 n-gram 哈希向量化，无外部依赖：文本统一全半角、小写后按字符取 1..ngram_max 元组，
+	用带符号的哈希投影到 dim 维，词频取对数（抑制重复字），按 n-gram 长度加权后 L2 归一化。
+	中文没有空格分词，字符二元组/三元组即可覆盖大部分词语，检索效果明显好于按字匹配。
+
+	整批文本的所有 n-gram 哈希用 numpy 向量运算一次算出，再用一次 bincount 累加成矩阵，
+	单条查询的耗时在毫秒以内。不使用 IDF：语料变化会改变已存向量的含义，而各文档的向量需要长期稳定。
+	"""
+
+	remote = False
+
+	def __init__(self, dim: int = 1024, ngram_max: int = 3, batch_size: int = 256) -> None:
+		self.dim = dim
+		self.ngram_max = max(1, ngram_max)
+		self.batch_size = max(1, batch_size)
+		# 单字区分度低，长 n-gram 权重更高
+		self._weights = [float(n) for n in range(1, self.ngram_max + 1)]
+
+	@classmethod
+	def from_config(cls, cfg: AppConfig) -> "LocalHashEmbedder":
+		return cls(dim=cfg.local_embedding_dim, ngram_max=cfg.local_embedding_ngram_max)
+
+	@property
+	def embedding_model(self) -> str:
+		# 参与缓存键：维度或 n-gram 设置变化后不会命中旧向量
+		return f"local-hash-v1-d{self.dim}-n{self.ngram_max}"
+
+	def embed_matrix(self, texts: Sequence[str]) -> np.ndarray:
+		"""返回 (len(texts), dim) 的 float32 矩阵，每行已 L2 归一化；空文本为零向量。"""
+		matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+		for start in range(0, len(texts), self.batch_size):
+			self._embed_batch(texts[start:start + self.batch_size], matrix[start:start + self.batch_size])
+		return matrix
+
+	def _embed_batch(self, texts: Sequence[str], out: np.ndarray) -> None:
+		codes = [np.frombuffer(normalize_query(t).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64) for t in texts]
+		lengths = np.array([len(c) for c in codes], dtype=np.int64)
+		if not lengths.sum():
+			return
+		# 所有文本首尾相接成一个数组，n-gram 不跨越文本边界
+		flat = np.concatenate(codes)
+		rows = np.repeat(np.arange(len(texts), dtype=np.int64), lengths)
+		offsets = np.concatenate(([0], np.cumsum(lengths)))
+		position = np.arange(len(flat), dtype=np.int64) - np.repeat(offsets[:-1], lengths)
+		row_length = np.repeat(lengths, lengths)
+		counts = np.zeros(len(texts) * self.dim, dtype=np.float32)
+		h = np.zeros(len(flat), dtype=np.uint64)
+		for n in range(1, self.ngram_max + 1):
+			size = len(flat) - n + 1
+			if size <= 0:
+				break
+			# 以 n-1 元组的哈希滚动得到 n 元组的哈希
+			h = _mix(h[:size] * _GOLDEN + flat[n - 1:] + np.uint64(n))
+			valid = position[:size] + n <= row_length[:size]
+			hv = h[valid]
+			buckets = (hv % np.uint64(self.dim)).astype(np.int64)
+			signs = np.where((hv >> np.uint64(63)) == 0, 1.0, -1.0).astype(np.float32)
+			counts += np.bincount(rows[:size][valid] * self.dim + buckets, weights=signs * self._weights[n - 1], minlength=len(counts)).astype(np.float32)
+		matrix = counts.reshape(len(texts), self.dim)
+		# 词频取对数：符号保留，绝对值按 log(1 + x) 压缩
+		np.copyto(out, np.sign(matrix) * np.log1p(np.abs(matrix)))
+		norms = np.linalg.norm(out, axis=1, keepdims=True)
+		np.divide(out, norms, out=out, where=norms > 0)
+
+	def embed_texts(self, texts: List[str]) -> List[List[float]]:
+		return self.embed_matrix(texts).tolist()
+
+	async def aembed_texts(self, texts: List[str], on_progress: Optional[ProgressCallback] = None) -> List[List[float]]:
+		"""少量文本（查询）直接计算；大批量（文档入库）放到线程中按批计算，避免阻塞事件循环。"""
+		if len(texts) <= self.batch_size:
+			vectors = self.embed_texts(texts)
+			if on_progress and texts:
+				on_progress(len(texts), len(texts))
+			return vectors
+		results: List[List[float]] = []
+		for start in range(0, len(texts), self.batch_size):
+			batch = texts[start:start + self.batch_size]
+			results.extend(await asyncio.to_thread(self.embed_texts, batch))
+			if on_progress:
+				on_progress(len(results), len(texts))
+		return results
+
+
+def create_embedding_provider(cfg: Optional[AppConfig] = None, client: Optional[OpenAIClientService] = None) -> EmbeddingProvider:
+	"""根据 EMBEDDING_PROVIDER 选择向量化实现：openai（默认，远程接口）或 local（进程内哈希向量化）。"""
+	cfg = cfg or load_config()
+	if cfg.embedding_provider == "local":
+		return LocalHashEmbedder.from_config(cfg)
+	if cfg.embedding_provider != "openai":
+		raise RuntimeError(f"不支持的 EMBEDDING_PROVIDER: {cfg.embedding_provider}")
+	return client or OpenAIClientService(cfg)
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description="用当前配置的向量化实现重新生成全部文档的向量（切换 EMBEDDING_PROVIDER 后执行）")
+	parser.add_argument("--reembed", action="store_true", help="重新向量化全部已存文档")
+	args = parser.parse_args()
+	if not args.reembed:
+		parser.print_help()
+		return
+	from .document_service import DocumentService
+	from .embedding_service import EmbeddingService
+
+	service = DocumentService(embedding=EmbeddingService(create_embedding_provider()))
+	for record in service.list_documents(include_chunks=False):
+		chunks = service.reembed_document(record["document_id"])
+		print(f"[INFO] Re-embedded {record.get('filename', record['document_id'])}: {chunks} chunks")
+
+
+if __name__ == "__main__":
+	main()
@@ -1,30 +1,148 @@
-from typing import List, Tuple
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
 import numpy as np
-from .openai_client import OpenAIClientService
+from ..config import load_config
+from .embedding_providers import EmbeddingProvider, create_embedding_provider
+from .openai_client import ProgressCallback
+from .query_batcher import QueryEmbeddingBatcher
+from .query_cache import QueryEmbeddingCache
+from ..storage.embedding_cache import SQLiteEmbeddingCache, embedding_cache_key
+from ..storage.quantization import QuantizedMatrix, normalize_vector, search_rows
+from ..utils.metrics import RETRIEVAL_SCORING_SECONDS
+
+
+# 既可以是旧的 List[List[float]]，也可以是向量存储直接返回的 float32 矩阵（含 np.memmap）
+VectorMatrix = Union[Sequence[Sequence[float]], np.ndarray]
+
+_DOCUMENT_SCORING = RETRIEVAL_SCORING_SECONDS.labels("document")
 
 
 class EmbeddingService:
-	def __init__(self, client: OpenAIClientService | None = None) -> None:
-		self._client = client or OpenAIClientService()
+	def __init__(self, client: EmbeddingProvider | None = None, query_cache: QueryEmbeddingCache | None = None, chunk_cache: SQLiteEmbeddingCache | None = None, query_batcher: QueryEmbeddingBatcher | None = None) -> None:
+		"""client 为向量化实现（见 embedding_providers），默认按 EMBEDDING_PROVIDER 创建。"""
+		cfg = load_config()
+		self._cfg = cfg
+		self._client = client or create_embedding_provider(cfg)
+		self._query_cache = query_cache or QueryEmbeddingCache.from_config(cfg)
+		# 本地向量化只需毫秒级，合并窗口与块向量缓存反而增加开销，只对远程接口启用
+		if query_batcher is None and cfg.query_batch_enabled and self._client.remote:
+			query_batcher = QueryEmbeddingBatcher(self._client, window=cfg.query_batch_window_ms / 1000, max_batch=cfg.query_batch_max_size)
+		self._query_batcher = query_batcher
+		if chunk_cache is None and cfg.embed_cache_enabled and self._client.remote:
+			chunk_cache = SQLiteEmbeddingCache(cfg.embed_cache_path, cfg.embed_cache_max_entries)
+		self._chunk_cache = chunk_cache
+
+	@property
+	def embedding_model(self) -> str:
+		return self._client.embedding_model
+
+	def _lookup_cached(self, chunks: List[str]) -> Tuple[List[str], Dict[str, np.ndarray], Dict[str, str]]:
+		"""返回 (每个块的 key, 命中的 key -> 向量, 需要向量化的 key -> 文本)，未命中的相同文本只请求一次。"""
+		model = self._client.embedding_model
+		keys = [embedding_cache_key(model, c) for c in chunks]
+		found = self._chunk_cache.get_many(list(set(keys)))
+		missing: Dict[str, str] = {}
+		for key, text in zip(keys, chunks):
+			if key not in found and key not in missing:
+				missing[key] = text
+		return keys, found, missing
+
+	def _merge_cached(self, keys: List[str], found: Dict[str, np.ndarray], missing: Dict[str, str], vectors: List[List[float]], stats: Optional[Dict[str, int]]) -> List[List[float]]:
+		fresh = {key: np.asarray(vec, dtype=np.float32) for key, vec in zip(missing, vectors)}
+		if fresh:
+			self._chunk_cache.put_many(fresh)
+		if stats is not None:
+			stats["cache_hits"] = stats.get("cache_hits", 0) + len(keys) - len(missing)
+			stats["cache_misses"] = stats.get("cache_misses", 0) + len(missing)
+		found.update(fresh)
+		return [found[key].tolist() for key in keys]
+
+	def embed_chunks(self, chunks: List[str], stats: Optional[Dict[str, int]] = None) -> List[List[float]]:
+		"""stats 可选：累加本次调用的缓存命中数 cache_hits 与实际向量化数 cache_misses。"""
+		if self._chunk_cache is None or not chunks:
+			return self._client.embed_texts(chunks)
+		keys, found, missing = self._lookup_cached(chunks)
+		vectors = self._client.embed_texts(list(missing.values())) if missing else []
+		return self._merge_cached(keys, found, missing, vectors, stats)
 
-	def embed_chunks(self, chunks: List[str]) -> List[List[float]]:
-		return self._client.embed_texts(chunks)
+	async def aembed_chunks(self, chunks: List[str], on_progress: Optional[ProgressCallback] = None, stats: Optional[Dict[str, int]] = None) -> List[List[float]]:
+		if self._chunk_cache is None or not chunks:
+			return await self._client.aembed_texts(chunks, on_progress=on_progress)
+		keys, found, missing = self._lookup_cached(chunks)
+		vectors = await self._client.aembed_texts(list(missing.values()), on_progress=on_progress) if missing else []
+		return self._merge_cached(keys, found, missing, vectors, stats)
+
+	def embed_query(self, query: str) -> np.ndarray:
+		"""查询向量走缓存，重复问题不再发起远程调用。"""
+		model = self._client.embedding_model
+		cached = self._query_cache.get(model, query)
+		if cached is not None:
+			return cached
+		start = time.perf_counter()
+		# 直接调用接口，查询文本不进入文档块缓存
+		vector = self._client.embed_texts([query])[0]
+		return self._query_cache.put(model, query, vector, time.perf_counter() - start)
+
+	async def aembed_query(self, query: str) -> np.ndarray:
+		"""异步版本：未命中缓存的查询交给 QueryEmbeddingBatcher，与同一时间窗口内的其他查询合并请求。"""
+		model = self._client.embedding_model
+		cached = self._query_cache.get(model, query)
+		if cached is not None:
+			return cached
+		start = time.perf_counter()
+		if self._query_batcher is not None:
+			vector = await self._query_batcher.embed(query)
+		else:
+			vector = (await self._client.aembed_texts([query]))[0]
+		return self._query_cache.put(model, query, vector, time.perf_counter() - start)
+
+	def query_cache_stats(self) -> Dict[str, Any]:
+		return self._query_cache.stats()
+
+	def query_batch_stats(self) -> Dict[str, Any]:
+		if self._query_batcher is None:
+			return {"enabled": False}
+		return self._query_batcher.stats()
 
 	@staticmethod
-	def cosine_similarities(query_vector: List[float], matrix: List[List[float]]) -> List[float]:
-		if not matrix:
+	def cosine_similarities(query_vector: List[float], matrix: VectorMatrix) -> List[float]:
+		if len(matrix) == 0:
 			return []
-		a = np.array(query_vector, dtype=np.float32)
-		b = np.array(matrix, dtype=np.float32)
+		a = np.asarray(query_vector, dtype=np.float32)
+		# float32 矩阵（含内存映射）不会被复制
+		b = np.asarray(matrix, dtype=np.float32)
 		a_norm = a / (np.linalg.norm(a) + 1e-8)
 		b_norm = b / (np.linalg.norm(b, axis=1, keepdims=True) + 1e-8)
 		scores = b_norm @ a_norm
 		return scores.tolist()
 
-	def top_k(self, query: str, vectors: List[List[float]], chunks: List[str], k: int = 5) -> List[Tuple[str, float]]:
-		qv = self.embed_chunks([query])[0] if query else [0.0] * (len(vectors[0]) if vectors else 0)
-		scores = self.cosine_similarities(qv, vectors)
-		idxs = np.argsort(scores)[::-1][:k]
-		return [(chunks[i], float(scores[i])) for i in idxs]
+	def top_k(self, query: str, vectors: VectorMatrix, chunks: List[str], k: int = 5, quantized: Optional[QuantizedMatrix] = None) -> List[Tuple[str, float]]:
+		"""
+		vectors 须为按行归一化的矩阵（VectorStorage.get_document_matrix 的返回值），打分即一次矩阵-向量乘法，
+		只对前 k 个结果排序。传入 quantized 时先在量化副本上粗排，再用 vectors 中的候选行重排。
+		"""
+		if len(vectors) == 0:
+			return []
+		qv = self.embed_query(query) if query else None
+		return self.rank(qv, vectors, chunks, k=k, quantized=quantized)
 
+	async def atop_k(self, query: str, vectors: VectorMatrix, chunks: List[str], k: int = 5, quantized: Optional[QuantizedMatrix] = None) -> List[Tuple[str, float]]:
+		if len(vectors) == 0:
+			return []
+		qv = await self.aembed_query(query) if query else None
+		return self.rank(qv, vectors, chunks, k=k, quantized=quantized)
 
+	def rank(self, query_vector: Optional[np.ndarray], vectors: VectorMatrix, chunks: List[str], k: int = 5, quantized: Optional[QuantizedMatrix] = None) -> List[Tuple[str, float]]:
+		"""用已得到的查询向量打分排序；query_vector 为 None 时所有片段得分为 0。"""
+		if len(vectors) == 0:
+			return []
+		if query_vector is not None and len(query_vector) != len(vectors[0]):
+			raise ValueError(
+				f"查询向量维度 {len(query_vector)} 与已存向量维度 {len(vectors[0])} 不一致；"
+				"切换 EMBEDDING_PROVIDER 后请执行 python -m app.services.embedding_providers --reembed"
+			)
+		start = time.perf_counter()
+		qv = normalize_vector(query_vector) if query_vector is not None else np.zeros(len(vectors[0]), dtype=np.float32)
+		idxs, scores = search_rows(qv, vectors, k, quantized=quantized, rescore_factor=self._cfg.vector_rescore_factor)
+		_DOCUMENT_SCORING.observe(time.perf_counter() - start)
+		return [(chunks[i], float(s)) for i, s in zip(idxs, scores)]
@@ -0,0 +1,207 @@
+import asyncio
+import os
+import uuid
+from datetime import datetime
+from typing import Any, Awaitable, BinaryIO, Callable, Dict, Iterator, List, Optional
+
+from ..storage.file_lock import FileLock
+from ..storage.json_storage import JSONStorage, create_storage
+from ..utils.metrics import UPLOAD_BYTES
+from ..utils.text_processor import count_chunks, iter_decoded_blocks, utf8_char_count
+from .document_service import DocumentService
+
+
+_ACTIVE_STATUSES = ("queued", "running")
+
+# 异步按块读取上传内容，例如 UploadFile.read
+AsyncByteReader = Callable[[int], Awaitable[bytes]]
+
+
+def _now() -> str:
+	return datetime.utcnow().isoformat() + "Z"
+
+
+class IngestionQueue:
+	"""
+	文档入库任务队列：上传接口只负责暂存原文并登记任务，由后台 worker 调用
+	DocumentService.aprocess_stream 流式完成切分、向量化与持久化。
+	任务记录保存在 jobs.json，未完成的任务在重启后会从暂存文件重新执行。
+
+	多 worker 部署时每个进程运行自己的队列，任务记录 owner 为登记它的进程；进程存活期间持有
+	workers/<owner>.lock，启动时只接管锁已释放（进程已退出）的未完成任务。
+	"""
+
+	def __init__(self, doc_service: DocumentService, storage: Optional[JSONStorage] = None) -> None:
+		self._docs = doc_service
+		self._js = storage or create_storage()
+		self._cfg = self._js._cfg
+		self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+		self._workers: List[asyncio.Task] = []
+		# 本进程运行中的任务；读取的字节数随时更新，进度每个向量化窗口写盘一次，其他 worker 查询时也能看到
+		self._live: Dict[str, Dict[str, Any]] = {}
+		# 进程 id 加随机串：容器重启后 pid 可能与上次相同，不能据此认定任务仍有人处理
+		self._owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+		self._owner_lock: Optional[FileLock] = None
+		os.makedirs(self._cfg.uploads_dir, exist_ok=True)
+
+	def _owner_lock_path(self, owner: str) -> str:
+		return os.path.join(self._cfg.data_dir, "workers", f"{owner}.lock")
+
+	def _owner_alive(self, owner: Optional[str]) -> bool:
+		if not owner:
+			return False
+		if owner == self._owner:
+			return True
+		probe = FileLock(self._owner_lock_path(owner))
+		if not probe.acquire(blocking=False):
+			return True
+		probe.release()
+		probe.close()
+		try:
+			os.remove(probe.path)
+		except OSError:
+			pass
+		return False
+
+	def _load_jobs(self) -> List[Dict[str, Any]]:
+		return self._js.read_jobs().get("jobs", [])
+
+	def _save_job(self, job: Dict[str, Any]) -> None:
+		with self._js.lock("jobs"):
+			jobs = [j for j in self._load_jobs() if j["job_id"] != job["job_id"]]
+			jobs.append(dict(job))
+			finished = [j for j in jobs if j["status"] not in _ACTIVE_STATUSES]
+			if len(finished) > self._cfg.ingest_job_history:
+				drop = {j["job_id"] for j in finished[: len(finished) - self._cfg.ingest_job_history]}
+				jobs = [j for j in jobs if j["job_id"] not in drop]
+			self._js.write_jobs({"jobs": jobs})
+
+	def _update(self, job: Dict[str, Any], **changes: Any) -> None:
+		job.update(changes, updated_at=_now())
+		self._save_job(job)
+
+	async def start(self) -> None:
+		if self._workers:
+			return
+		self._owner_lock = FileLock(self._owner_lock_path(self._owner))
+		self._owner_lock.acquire()
+		# 恢复已退出进程未完成的任务（运行中的任务从头重做，文档 id 不变，重复写入是幂等的）
+		with self._js.lock("jobs"):
+			for job in self._load_jobs():
+				if job["status"] in _ACTIVE_STATUSES and not self._owner_alive(job.get("owner")):
+					job = dict(job)
+					self._live[job["job_id"]] = job
+					self._update(job, status="queued", chunks_embedded=0, bytes_processed=0, owner=self._owner)
+					self._queue.put_nowait(job["job_id"])
+		self._workers = [asyncio.create_task(self._worker()) for _ in range(self._cfg.ingest_workers)]
+
+	async def stop(self) -> None:
+		for task in self._workers:
+			task.cancel()
+		await asyncio.gather(*self._workers, return_exceptions=True)
+		self._workers = []
+		if self._owner_lock is not None:
+			self._owner_lock.release()
+			self._owner_lock.close()
+			try:
+				os.remove(self._owner_lock.path)
+			except OSError:
+				pass
+			self._owner_lock = None
+
+	async def submit(self, filename: str, read: AsyncByteReader) -> Dict[str, Any]:
+		"""
+		把上传内容按块写入暂存文件后登记任务，整个文件不会一次性读入内存。
+		暂存时顺带统计字符数，登记时即给出总块数（文件含无效 UTF-8 字节时为估算值，完成时更正）。
+		"""
+		job_id = str(uuid.uuid4())
+		staged_path = os.path.join(self._cfg.uploads_dir, f"{job_id}.txt")
+		size = 0
+		chars = 0
+		with open(staged_path, "wb") as f:
+			while True:
+				block = await read(self._cfg.upload_read_block)
+				if not block:
+					break
+				f.write(block)
+				size += len(block)
+				chars += utf8_char_count(block)
+		UPLOAD_BYTES.observe(size)
+		now = _now()
+		job = {
+			"job_id": job_id,
+			"document_id": str(uuid.uuid4()),
+			"filename": filename,
+			"status": "queued",
+			"chunks_total": count_chunks(chars),
+			"chunks_embedded": 0,
+			"bytes_total": size,
+			"bytes_processed": 0,
+			"error": None,
+			"staged_path": staged_path,
+			"owner": self._owner,
+			"created_at": now,
+			"updated_at": now,
+		}
+		self._live[job_id] = job
+		self._save_job(job)
+		self._queue.put_nowait(job_id)
+		return job
+
+	def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+		job = self._live.get(job_id)
+		if job is None:
+			job = next((j for j in self._load_jobs() if j["job_id"] == job_id), None)
+		if job is None:
+			return None
+		public = {k: v for k, v in job.items() if k not in ("staged_path", "owner")}
+		if job["status"] == "completed":
+			public["progress"] = 1.0
+		elif job.get("chunks_total"):
+			# 已向量化块数 / 总块数；总块数为估算值时不超过 1
+			public["progress"] = min(job.get("chunks_embedded", 0) / job["chunks_total"], 1.0)
+		else:
+			total = job.get("bytes_total") or 0
+			public["progress"] = job.get("bytes_processed", 0) / total if total else 0.0
+		return public
+
+	async def _worker(self) -> None:
+		while True:
+			job_id = await self._queue.get()
+			try:
+				await self._run(job_id)
+			finally:
+				self._queue.task_done()
+
+	async def _run(self, job_id: str) -> None:
+		job = self._live.get(job_id)
+		if job is None:
+			return
+		self._update(job, status="running")
+
+		def on_progress(done: int, total: int) -> None:
+			# 每个窗口完成时调用一次，写盘频率随窗口大小受限
+			self._update(job, chunks_embedded=done)
+
+		def read_pieces(f: BinaryIO) -> Iterator[str]:
+			for piece in iter_decoded_blocks(f, self._cfg.upload_read_block):
+				job["bytes_processed"] = f.tell()
+				yield piece
+
+		# 本次入库的向量缓存统计，随任务进度一起返回
+		job["embedding_cache"] = {"cache_hits": 0, "cache_misses": 0}
+		try:
+			with open(job["staged_path"], "rb") as f:
+				_, chunks_count = await self._docs.aprocess_stream(job["filename"], read_pieces(f), on_progress=on_progress, document_id=job["document_id"], stats=job["embedding_cache"])
+			self._update(job, status="completed", chunks_total=chunks_count, chunks_embedded=chunks_count)
+		except asyncio.CancelledError:
+			# 关闭时中断的任务保持 running 状态，下次启动自动恢复
+			raise
+		except Exception as exc:
+			self._docs.delete_document(job["document_id"])
+			self._update(job, status="failed", error=str(exc))
+		self._live.pop(job_id, None)
+		try:
+			os.remove(job["staged_path"])
+		except OSError:
+			pass
@@ -1,30 +1,202 @@
-from typing import AsyncIterator, List
+import asyncio
+import importlib.util
+import time
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+import httpx
+import openai
 from openai import OpenAI, AsyncOpenAI
-from ..config import load_config
+from ..config import AppConfig, load_config
+from ..utils.metrics import (
+	EMBEDDING_BATCH_SIZE,
+	EMBEDDING_REQUEST_SECONDS,
+	EMBEDDING_RETRIES,
+	LLM_STREAM_SECONDS,
+	LLM_STREAM_TOKENS,
+	LLM_TIME_TO_FIRST_TOKEN_SECONDS,
+	LLM_TOKENS_PER_SECOND,
+)
+
+
+# 可重试的错误：网络/超时、限流、服务端 5xx；参数错误等直接抛出
+_RETRYABLE_ERRORS = (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+
+ProgressCallback = Callable[[int, int], None]
+
+
+def http2_available() -> bool:
+	return importlib.util.find_spec("h2") is not None
+
+
+def _pool_options(cfg: AppConfig) -> dict:
+	return {
+		"limits": httpx.Limits(
+			max_connections=cfg.http_max_connections,
+			max_keepalive_connections=cfg.http_max_keepalive,
+			keepalive_expiry=cfg.http_keepalive_expiry,
+		),
+		"timeout": httpx.Timeout(cfg.http_timeout, connect=cfg.http_connect_timeout),
+		# HTTP/2 需要可选依赖 h2，未安装时退回 HTTP/1.1 keep-alive
+		"http2": cfg.http2 and http2_available(),
+	}
+
+
+def create_http_client(cfg: AppConfig) -> httpx.Client:
+	return openai.DefaultHttpxClient(**_pool_options(cfg))
+
+
+def create_async_http_client(cfg: AppConfig) -> httpx.AsyncClient:
+	return openai.DefaultAsyncHttpxClient(**_pool_options(cfg))
 
 
 class OpenAIClientService:
-	def __init__(self) -> None:
-		cfg = load_config()
+	# 向量化走远程接口（见 embedding_providers.EmbeddingProvider）
+	remote = True
+
+	def __init__(self, cfg: Optional[AppConfig] = None, http_client: Optional[httpx.Client] = None, async_http_client: Optional[httpx.AsyncClient] = None) -> None:
+		"""未传入连接池时各自创建（独立使用时的兼容行为）；应用内由 ServiceContainer 统一创建并关闭。"""
+		cfg = cfg or load_config()
 		self._cfg = cfg
-		self._client = OpenAI(api_key=cfg.api_key, base_url=cfg.base_url)
-		self._aclient = AsyncOpenAI(api_key=cfg.api_key, base_url=cfg.base_url)
+		self._http = http_client or create_http_client(cfg)
+		self._ahttp = async_http_client or create_async_http_client(cfg)
+		# 向量化按 EMBED_MAX_RETRIES 在本类中重试，客户端自身不再重试，避免两层重试次数相乘
+		self._client = OpenAI(api_key=cfg.api_key, base_url=cfg.base_url, http_client=self._http, max_retries=0)
+		self._aclient = AsyncOpenAI(api_key=cfg.api_key, base_url=cfg.base_url, http_client=self._ahttp, max_retries=0)
+		# 聊天补全没有应用层重试，保留 SDK 默认的重试
+		self._achat = self._aclient.with_options(max_retries=openai.DEFAULT_MAX_RETRIES)
+
+	async def warmup(self) -> int:
+		"""
+		预先建立到 base_url 的连接（TCP/TLS，以及可用时的 HTTP/2），返回成功的连接数。
+		只发送不带凭据的 GET，响应状态不重要；失败不影响启动。
+		"""
+		# HTTP/2 在一条连接上多路复用，只需预热一条
+		count = 1 if _pool_options(self._cfg)["http2"] else self._cfg.http_warmup_connections
+
+		async def probe() -> bool:
+			try:
+				await self._ahttp.get(self._cfg.base_url, timeout=self._cfg.http_connect_timeout)
+				return True
+			except Exception as exc:
+				print(f"[WARN] Connection warmup failed: {exc}")
+				return False
+
+		results = await asyncio.gather(*(probe() for _ in range(count)))
+		return sum(results)
+
+	async def aclose(self) -> None:
+		await self._ahttp.aclose()
+		self._http.close()
+
+	@property
+	def embedding_model(self) -> str:
+		return self._cfg.embedding_model
+
+	def _batches(self, texts: List[str]) -> List[Tuple[int, List[str]]]:
+		"""按条数与字符数上限切分批次，返回 (起始下标, 批内文本)。单条超长文本独占一批。"""
+		batches: List[Tuple[int, List[str]]] = []
+		start, current, chars = 0, [], 0
+		for idx, text in enumerate(texts):
+			if current and (len(current) >= self._cfg.embed_batch_size or chars + len(text) > self._cfg.embed_batch_max_chars):
+				batches.append((start, current))
+				start, current, chars = idx, [], 0
+			current.append(text)
+			chars += len(text)
+		if current:
+			batches.append((start, current))
+		return batches
+
+	def _backoff(self, attempt: int) -> float:
+		return self._cfg.embed_retry_backoff * (2 ** attempt)
 
 	def embed_texts(self, texts: List[str]) -> List[List[float]]:
 		if not texts:
 			return []
-		resp = self._client.embeddings.create(model=self._cfg.embedding_model, input=texts)
-		return [d.embedding for d in resp.data]
+		results: List[List[float]] = []
+		for _, batch in self._batches(texts):
+			for attempt in range(self._cfg.embed_max_retries + 1):
+				requested = time.perf_counter()
+				try:
+					resp = self._client.embeddings.create(model=self._cfg.embedding_model, input=batch)
+					break
+				except _RETRYABLE_ERRORS:
+					if attempt == self._cfg.embed_max_retries:
+						raise
+					EMBEDDING_RETRIES.labels("sync").inc()
+					time.sleep(self._backoff(attempt))
+			EMBEDDING_REQUEST_SECONDS.labels("sync").observe(time.perf_counter() - requested)
+			EMBEDDING_BATCH_SIZE.labels("sync").observe(len(batch))
+			results.extend(d.embedding for d in resp.data)
+		return results
+
+	async def aembed_texts(self, texts: List[str], on_progress: Optional[ProgressCallback] = None) -> List[List[float]]:
+		"""
+		异步批量向量化：批次并发执行（受 embed_concurrency 限制），每批独立重试，结果保持输入顺序。
+		on_progress(已完成条数, 总条数) 在每批完成后调用。
+		"""
+		if not texts:
+			return []
+		results: List[Optional[List[float]]] = [None] * len(texts)
+		semaphore = asyncio.Semaphore(self._cfg.embed_concurrency)
+		done = 0
+
+		async def run_batch(start: int, batch: List[str]) -> None:
+			nonlocal done
+			async with semaphore:
+				for attempt in range(self._cfg.embed_max_retries + 1):
+					requested = time.perf_counter()
+					try:
+						resp = await self._aclient.embeddings.create(model=self._cfg.embedding_model, input=batch)
+						break
+					except _RETRYABLE_ERRORS:
+						if attempt == self._cfg.embed_max_retries:
+							raise
+						EMBEDDING_RETRIES.labels("async").inc()
+						await asyncio.sleep(self._backoff(attempt))
+				EMBEDDING_REQUEST_SECONDS.labels("async").observe(time.perf_counter() - requested)
+				EMBEDDING_BATCH_SIZE.labels("async").observe(len(batch))
+			for offset, item in enumerate(resp.data):
+				results[start + offset] = item.embedding
+			done += len(batch)
+			if on_progress:
+				on_progress(done, len(texts))
+
+		tasks = [asyncio.create_task(run_batch(start, batch)) for start, batch in self._batches(texts)]
+		try:
+			await asyncio.gather(*tasks)
+		except BaseException:
+			for task in tasks:
+				task.cancel()
+			raise
+		return results  # type: ignore[return-value]
+
+	async def complete_chat(self, messages: List[dict], max_tokens: Optional[int] = None) -> str:
+		"""非流式补全，供后台任务（如会话摘要）使用。"""
+		options = {"max_tokens": max_tokens} if max_tokens else {}
+		resp = await self._achat.chat.completions.create(model=self._cfg.llm_model, messages=messages, **options)
+		return (resp.choices[0].message.content or "") if resp.choices else ""
 
 	async def stream_chat(self, messages: List[dict]) -> AsyncIterator[str]:
-		stream = await self._aclient.chat.completions.create(
+		"""流式输出，记录首 token 延迟与之后的输出速率（按内容增量计数，近似 token 数）。"""
+		start = time.perf_counter()
+		first: Optional[float] = None
+		tokens = 0
+		stream = await self._achat.chat.completions.create(
 			model=self._cfg.llm_model,
 			messages=messages,
 			stream=True,
 		)
-		async for event in stream:
-			delta = event.choices[0].delta
-			if delta and delta.content:
-				yield delta.content
-
-
+		try:
+			async for event in stream:
+				delta = event.choices[0].delta if event.choices else None
+				if delta and delta.content:
+					if first is None:
+						first = time.perf_counter()
+						LLM_TIME_TO_FIRST_TOKEN_SECONDS.observe(first - start)
+					tokens += 1
+					yield delta.content
+		finally:
+			end = time.perf_counter()
+			LLM_STREAM_SECONDS.observe(end - start)
+			LLM_STREAM_TOKENS.inc(tokens)
+			if first is not None and tokens > 1 and end > first:
+				LLM_TOKENS_PER_SECOND.observe((tokens - 1) / (end - first))
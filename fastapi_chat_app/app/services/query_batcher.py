@@ -0,0 +1,110 @@
+import asyncio
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from .openai_client import OpenAIClientService
+
+
+# 批大小分布的统计区间上界
+_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+class QueryEmbeddingBatcher:
+	"""
+	跨请求合并查询向量化：在 window 秒内（或凑满 max_batch 条）到达的查询合并为一次接口调用，
+	结果再分发给各自等待的调用方。同一批内相同的文本只请求一次。
+	统计批大小分布与排队等待时间（从提交到所在批次发出请求）。
+	"""
+
+	def __init__(self, client: OpenAIClientService, window: float = 0.005, max_batch: int = 32) -> None:
+		self._client = client
+		self._window = window
+		self._max_batch = max(1, max_batch)
+		self._pending: List[Tuple[str, "asyncio.Future[List[float]]", float]] = []
+		self._timer: Optional[asyncio.TimerHandle] = None
+		# 进行中的批次任务；事件循环只保留任务的弱引用，这里持有引用直到完成
+		self._tasks: Set["asyncio.Task[None]"] = set()
+		self._lock = threading.Lock()
+		self.batches = 0
+		self.requests = 0
+		self.errors = 0
+		self.max_batch_seen = 0
+		self._size_counts = [0] * (len(_SIZE_BUCKETS) + 1)
+		self._wait_seconds = 0.0
+		self.max_wait_seconds = 0.0
+
+	async def embed(self, text: str) -> List[float]:
+		loop = asyncio.get_running_loop()
+		future: "asyncio.Future[List[float]]" = loop.create_future()
+		self._pending.append((text, future, time.perf_counter()))
+		if len(self._pending) >= self._max_batch:
+			self._flush_now(loop)
+		elif self._timer is None:
+			self._timer = loop.call_later(self._window, self._flush_now, loop)
+		return await future
+
+	def _flush_now(self, loop: asyncio.AbstractEventLoop) -> None:
+		if self._timer is not None:
+			self._timer.cancel()
+			self._timer = None
+		while self._pending:
+			batch, self._pending = self._pending[: self._max_batch], self._pending[self._max_batch:]
+			task = loop.create_task(self._send(batch))
+			self._tasks.add(task)
+			task.add_done_callback(self._tasks.discard)
+
+	async def _send(self, batch: List[Tuple[str, "asyncio.Future[List[float]]", float]]) -> None:
+		started = time.perf_counter()
+		texts = list(dict.fromkeys(text for text, _, _ in batch))
+		self._record(batch, started)
+		try:
+			vectors = await self._client.aembed_texts(texts)
+		except BaseException as exc:
+			with self._lock:
+				self.errors += 1
+			# 批次任务被取消（如关闭事件循环）时同样通知等待的调用方，不让它们一直挂起
+			for _, future, _ in batch:
+				if not future.done():
+					if isinstance(exc, asyncio.CancelledError):
+						future.cancel()
+					else:
+						future.set_exception(exc)
+			if not isinstance(exc, Exception):
+				raise
+			return
+		by_text = dict(zip(texts, vectors))
+		for text, future, _ in batch:
+			# 调用方已取消（如客户端断开）时直接丢弃结果
+			if not future.done():
+				future.set_result(by_text[text])
+
+	def _record(self, batch: List[Tuple[str, Any, float]], started: float) -> None:
+		size = len(batch)
+		with self._lock:
+			self.batches += 1
+			self.requests += size
+			self.max_batch_seen = max(self.max_batch_seen, size)
+			bucket = next((i for i, bound in enumerate(_SIZE_BUCKETS) if size <= bound), len(_SIZE_BUCKETS))
+			self._size_counts[bucket] += 1
+			for _, _, enqueued in batch:
+				wait = started - enqueued
+				self._wait_seconds += wait
+				self.max_wait_seconds = max(self.max_wait_seconds, wait)
+
+	def stats(self) -> Dict[str, Any]:
+		with self._lock:
+			labels = [f"<={bound}" for bound in _SIZE_BUCKETS] + [f">{_SIZE_BUCKETS[-1]}"]
+			return {
+				"enabled": True,
+				"window_ms": self._window * 1000,
+				"max_batch": self._max_batch,
+				"batches": self.batches,
+				"requests": self.requests,
+				"errors": self.errors,
+				"avg_batch_size": self.requests / self.batches if self.batches else 0.0,
+				"max_batch_size": self.max_batch_seen,
+				"batch_size_histogram": dict(zip(labels, self._size_counts)),
+				"avg_queue_wait_ms": self._wait_seconds / self.requests * 1000 if self.requests else 0.0,
+				"max_queue_wait_ms": self.max_wait_seconds * 1000,
+			}
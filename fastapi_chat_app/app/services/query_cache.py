@@ -0,0 +1,100 @@
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from ..config import AppConfig
+from ..storage.embedding_cache import SQLiteEmbeddingCache, embedding_cache_key
+
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+	"""全角/半角统一、去首尾空白、折叠连续空白并转小写，使等价的问题命中同一缓存项。"""
+	return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip().lower()
+
+
+class QueryEmbeddingCache:
+	"""
+	查询向量缓存：内存 LRU + TTL，可选 SQLite 持久层。
+	同时统计命中率，并用未命中调用的平均耗时估算节省的网络时间。
+	"""
+
+	def __init__(self, max_entries: int, ttl: float, persistent: Optional[SQLiteEmbeddingCache] = None) -> None:
+		self._max_entries = max_entries
+		self._ttl = ttl
+		self._persistent = persistent
+		self._entries: "OrderedDict[str, Tuple[np.ndarray, float]]" = OrderedDict()
+		self._lock = threading.Lock()
+		self.memory_hits = 0
+		self.disk_hits = 0
+		self.misses = 0
+		self._miss_seconds = 0.0
+
+	@classmethod
+	def from_config(cls, cfg: AppConfig) -> "QueryEmbeddingCache":
+		persistent = SQLiteEmbeddingCache(cfg.query_cache_path, cfg.query_cache_persist_max) if cfg.query_cache_persist else None
+		return cls(cfg.query_cache_size, cfg.query_cache_ttl, persistent)
+
+	def get(self, model: str, text: str) -> Optional[np.ndarray]:
+		key = embedding_cache_key(model, normalize_query(text))
+		now = time.monotonic()
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is not None:
+				if entry[1] > now:
+					self._entries.move_to_end(key)
+					self.memory_hits += 1
+					return entry[0]
+				del self._entries[key]
+		if self._persistent is not None:
+			vector = self._persistent.get(key, max_age=self._ttl)
+			if vector is not None:
+				self._remember(key, vector)
+				with self._lock:
+					self.disk_hits += 1
+				return vector
+		with self._lock:
+			self.misses += 1
+		return None
+
+	def put(self, model: str, text: str, vector: Any, elapsed: float) -> np.ndarray:
+		"""写入一次未命中后得到的向量，elapsed 为该次远程调用耗时（秒）。"""
+		key = embedding_cache_key(model, normalize_query(text))
+		array = np.asarray(vector, dtype=np.float32)
+		array.setflags(write=False)
+		self._remember(key, array)
+		if self._persistent is not None:
+			self._persistent.put(key, array)
+		with self._lock:
+			self._miss_seconds += elapsed
+		return array
+
+	def _remember(self, key: str, vector: np.ndarray) -> None:
+		with self._lock:
+			self._entries[key] = (vector, time.monotonic() + self._ttl)
+			self._entries.move_to_end(key)
+			while len(self._entries) > self._max_entries:
+				self._entries.popitem(last=False)
+
+	def stats(self) -> Dict[str, Any]:
+		with self._lock:
+			hits = self.memory_hits + self.disk_hits
+			total = hits + self.misses
+			avg_miss = self._miss_seconds / self.misses if self.misses else 0.0
+			return {
+				"hits": hits,
+				"memory_hits": self.memory_hits,
+				"disk_hits": self.disk_hits,
+				"misses": self.misses,
+				"hit_rate": hits / total if total else 0.0,
+				"entries": len(self._entries),
+				"avg_miss_latency_ms": avg_miss * 1000,
+				"saved_latency_seconds": hits * avg_miss,
+				"persistent": self._persistent is not None,
+			}
@@ -0,0 +1,213 @@
+import asyncio
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from ..config import AppConfig
+from ..models.chat import ChatMessage, ChatSession
+from ..storage.json_storage import JSONStorage, create_storage
+from ..utils.metrics import CHAT_HISTORY_TOKENS, CHAT_SUMMARIES
+from ..utils.text_processor import estimate_tokens
+from .openai_client import OpenAIClientService
+
+
+# 每条消息在提示中除正文外的开销（角色与分隔符），按估算 token 计
+_MESSAGE_OVERHEAD = 4
+
+_SUMMARY_PROMPT = "你负责压缩一段对话的历史。请把已有摘要与新增的对话合并成一份新的摘要：保留用户的目标和问题、已经给出的关键事实与结论、尚未解决的事项，省略寒暄与重复内容。只输出摘要正文。"
+
+
+def _now() -> str:
+	return datetime.utcnow().isoformat() + "Z"
+
+
+def _message_tokens(content: str) -> int:
+	return estimate_tokens(content) + _MESSAGE_OVERHEAD
+
+
+def _age_seconds(timestamp: str) -> float:
+	return (datetime.utcnow() - datetime.fromisoformat(timestamp.rstrip("Z"))).total_seconds()
+
+
+class SessionService:
+	"""
+	服务端聊天会话：保存每轮问答，组装提示时只放入滚动摘要与预算内最近的轮次。
+	未摘要的历史超出 chat_history_max_tokens 时，后台把较早的轮次合并进摘要（合并到最近的轮次只占约一半预算），
+	因此对话再长，提示中的历史也不超过预算；摘要完成前超出预算的较早轮次直接不放入提示。
+	合并进摘要的消息从会话文件中移除，会话超过 chat_session_ttl 秒没有新问答即失效，由 expire 定期清理。
+	"""
+
+	def __init__(self, storage: Optional[JSONStorage] = None, client: Optional[OpenAIClientService] = None, cfg: Optional[AppConfig] = None) -> None:
+		self._js = storage or create_storage()
+		self._client = client or OpenAIClientService()
+		self._cfg = cfg or self._js._cfg
+		# session_id -> 进行中的摘要任务，同一会话同时只有一个
+		self._pending: Dict[str, asyncio.Task] = {}
+		# session_id -> 尚未写入的会话（new 创建，第一轮问答记录时写入）
+		self._unsaved: Dict[str, Dict[str, Any]] = {}
+		self.summaries = 0
+		self.expired = 0
+
+	def create(self, user_id: str, document_id: Optional[str] = None) -> Dict[str, Any]:
+		session = ChatSession(user_id=user_id, document_id=document_id).model_dump()
+		self._js.put_session(session)
+		return session
+
+	def new(self, user_id: str, document_id: Optional[str] = None) -> Dict[str, Any]:
+		"""创建会话但暂不写入，第一轮问答记录时才保存；没有完成问答的连接不留下会话文件。用完需调用 release。"""
+		session = ChatSession(user_id=user_id, document_id=document_id).model_dump()
+		self._unsaved[session["session_id"]] = session
+		return session
+
+	def release(self, session_id: str) -> None:
+		"""丢弃 new 创建后仍未写入的会话。"""
+		self._unsaved.pop(session_id, None)
+
+	def get(self, session_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+		"""只返回属于该用户且未过期的会话。"""
+		session = self._js.get_session(session_id) or self._unsaved.get(session_id)
+		if session is None or session.get("user_id") != user_id or self._expired(session):
+			return None
+		return session
+
+	def _expired(self, session: Dict[str, Any]) -> bool:
+		ttl = self._cfg.chat_session_ttl
+		return ttl > 0 and _age_seconds(session["updated_time"]) > ttl
+
+	def expire(self) -> int:
+		"""删除超过 chat_session_ttl 秒没有新问答的会话文件，返回删除数。"""
+		if self._cfg.chat_session_ttl <= 0:
+			return 0
+		removed = self._js.expire_sessions(self._cfg.chat_session_ttl)
+		self.expired += removed
+		return removed
+
+	def delete(self, session_id: str, user_id: str) -> bool:
+		with self._js.lock("sessions"):
+			if self.get(session_id, user_id) is None:
+				return False
+			self._js.delete_session(session_id)
+		self._unsaved.pop(session_id, None)
+		task = self._pending.pop(session_id, None)
+		if task is not None:
+			task.cancel()
+		return True
+
+	def prompt_history(self, session: Dict[str, Any]) -> List[Dict[str, str]]:
+		"""组装提示中的历史：摘要作为一条 system 消息，其后是从最新往前、能放进剩余预算的连续轮次。"""
+		history: List[Dict[str, str]] = []
+		used = 0
+		summary = session.get("summary")
+		if summary:
+			history.append({"role": "system", "content": f"此前对话的摘要：\n{summary}"})
+			used = _message_tokens(history[0]["content"])
+		recent: List[Dict[str, str]] = []
+		for message in reversed(session.get("messages", [])[session.get("summarized_count", 0):]):
+			cost = _message_tokens(message["content"])
+			if used + cost > self._cfg.chat_history_max_tokens:
+				break
+			used += cost
+			recent.append({"role": message["role"], "content": message["content"]})
+		# 历史从一轮问答的开头开始，不放入缺少对应问题的回答
+		if recent and recent[-1]["role"] == "assistant":
+			used -= _message_tokens(recent.pop()["content"])
+		CHAT_HISTORY_TOKENS.observe(used)
+		return history + recent[::-1]
+
+	def record_turn(self, session: Dict[str, Any], user_message: str, answer: str) -> None:
+		"""追加一轮问答；未摘要的历史超出预算时在后台开始摘要。需在事件循环中调用。"""
+		if not answer:
+			return
+		with self._js.lock("sessions"):
+			# 文件不存在时只写入 new 创建的会话，不重新创建已删除或已过期清理的会话
+			current = self._js.get_session(session["session_id"]) or self._unsaved.get(session["session_id"])
+			if current is None:
+				return
+			# 读缓存中的快照是共享的，这里构造新列表而不是原地追加
+			messages = current.get("messages", []) + [
+				ChatMessage(role="user", content=user_message).model_dump(),
+				ChatMessage(role="assistant", content=answer).model_dump(),
+			]
+			current = {**current, "messages": messages, "updated_time": _now()}
+			self._js.put_session(current)
+		self._unsaved.pop(current["session_id"], None)
+		if self._fold_point(current) > current.get("summarized_count", 0):
+			self._schedule_summary(current["session_id"])
+
+	def _fold_point(self, session: Dict[str, Any]) -> int:
+		"""返回应合并进摘要的消息结尾位置；历史仍在预算内时返回 summarized_count。"""
+		start = session.get("summarized_count", 0)
+		messages = session.get("messages", [])
+		summary = session.get("summary")
+		costs = [_message_tokens(m["content"]) for m in messages[start:]]
+		budget = self._cfg.chat_history_max_tokens
+		if (_message_tokens(summary) if summary else 0) + sum(costs) <= budget:
+			return start
+		# 从最新往前保留约一半预算的轮次（至少保留最后一轮），其余合并进摘要
+		kept, kept_tokens = len(costs), 0
+		while kept > 0:
+			cost = costs[kept - 1]
+			if kept_tokens + cost > budget // 2 and len(costs) - kept >= 2:
+				break
+			kept_tokens += cost
+			kept -= 1
+		end = start + kept
+		# 在用户消息处切分，保留的部分从一轮问答的开头开始
+		while end < len(messages) and messages[end]["role"] != "user":
+			end += 1
+		return end
+
+	def _schedule_summary(self, session_id: str) -> None:
+		if session_id in self._pending:
+			return
+		task = asyncio.get_running_loop().create_task(self._summarize(session_id))
+		self._pending[session_id] = task
+		task.add_done_callback(lambda _: self._pending.pop(session_id, None))
+
+	async def _summarize(self, session_id: str) -> None:
+		session = self._js.get_session(session_id)
+		if session is None:
+			return
+		start = session.get("summarized_count", 0)
+		end = self._fold_point(session)
+		if end <= start:
+			return
+		transcript = "\n".join(f"{'用户' if m['role'] == 'user' else '助手'}：{m['content']}" for m in session["messages"][start:end])
+		prompt = [
+			{"role": "system", "content": _SUMMARY_PROMPT},
+			{"role": "user", "content": f"已有摘要：\n{session.get('summary') or '（无）'}\n\n新增的对话：\n{transcript}"},
+		]
+		try:
+			summary = (await self._client.complete_chat(prompt, self._cfg.chat_summary_max_tokens)).strip()
+		except Exception as exc:
+			# 摘要失败不影响对话：提示仍按预算截断，下一轮再重试
+			CHAT_SUMMARIES.labels("error").inc()
+			print(f"[WARN] Failed to summarize chat session {session_id}: {exc}")
+			return
+		if not summary:
+			CHAT_SUMMARIES.labels("error").inc()
+			return
+		with self._js.lock("sessions"):
+			current = self._js.get_session(session_id)
+			# 会话已删除，或其他 worker 已先完成了这一段的摘要（已合并的消息被移除）：丢弃本次结果
+			if current is None or current.get("summarized_count", 0) != start or current["messages"][start:end] != session["messages"][start:end]:
+				CHAT_SUMMARIES.labels("stale").inc()
+				return
+			# 已合并进摘要的消息不再保留，会话文件大小随摘要滚动而有上限
+			self._js.put_session({**current, "summary": summary, "messages": current["messages"][end:], "summarized_count": 0})
+		CHAT_SUMMARIES.labels("ok").inc()
+		self.summaries += 1
+
+	def stats(self) -> Dict[str, Any]:
+		return {
+			"history_max_tokens": self._cfg.chat_history_max_tokens,
+			"summaries": self.summaries,
+			"pending_summaries": len(self._pending),
+			"session_ttl": self._cfg.chat_session_ttl,
+			"expired_sessions": self.expired,
+		}
+
+	async def close(self) -> None:
+		tasks = list(self._pending.values())
+		for task in tasks:
+			task.cancel()
+		await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,194 @@
+import math
+import threading
+from array import array
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+	from .vector_storage import VectorStorage
+
+
+class IVFIndex:
+	"""
+	纯 NumPy 的 IVF（倒排文件）近似最近邻索引，按余弦相似度检索全部文档的 chunk 向量。
+	条目数未达到 train_threshold 时直接精确扫描；达到后用球面 k-means 训练 nlist 个中心，
+	查询只扫描离查询最近的 nprobe 个倒排列表，nprobe 越大召回越高、耗时越长。
+	删除采用墓碑标记，墓碑过多时压缩；规模增长到训练时的 4 倍后自动重新训练。
+	"""
+
+	def __init__(self, nprobe: int = 16, train_threshold: int = 4096, kmeans_iters: int = 8) -> None:
+		self.nprobe = nprobe
+		self._train_threshold = train_threshold
+		self._kmeans_iters = kmeans_iters
+		self._lock = threading.RLock()
+		self._vectors = np.empty((0, 0), dtype=np.float32)
+		self._size = 0
+		self._alive = np.empty(0, dtype=bool)
+		self._dead = 0
+		self._keys: List[Tuple[str, str]] = []
+		self._doc_rows: Dict[str, List[int]] = {}
+		self._centroids: Optional[np.ndarray] = None
+		self._lists: List[array] = []
+		self._trained_size = 0
+
+	def __len__(self) -> int:
+		return self._size - self._dead
+
+	def _reserve(self, extra: int, dim: int) -> None:
+		if self._vectors.shape[1] != dim:
+			if self._size:
+				raise ValueError(f"向量维度不一致：索引为 {self._vectors.shape[1]}，新向量为 {dim}")
+			self._vectors = np.empty((0, dim), dtype=np.float32)
+		needed = self._size + extra
+		if needed <= self._vectors.shape[0]:
+			return
+		capacity = max(needed, self._vectors.shape[0] * 2, 1024)
+		grown = np.empty((capacity, dim), dtype=np.float32)
+		grown[: self._size] = self._vectors[: self._size]
+		alive = np.zeros(capacity, dtype=bool)
+		alive[: self._size] = self._alive[: self._size]
+		self._vectors, self._alive = grown, alive
+
+	def add(self, document_id: str, chunk_ids: List[str], matrix: np.ndarray, train: bool = True) -> None:
+		"""写入（或替换）一个文档的全部向量；批量构建时传 train=False，最后统一训练。"""
+		with self._lock:
+			self.remove(document_id)
+			if len(chunk_ids) == 0:
+				return
+			rows = np.asarray(matrix, dtype=np.float32)
+			rows = rows / (np.linalg.norm(rows, axis=1, keepdims=True) + 1e-8)
+			self._reserve(len(chunk_ids), rows.shape[1])
+			start = self._size
+			self._vectors[start:start + len(chunk_ids)] = rows
+			self._alive[start:start + len(chunk_ids)] = True
+			self._keys.extend((document_id, cid) for cid in chunk_ids)
+			self._doc_rows[document_id] = list(range(start, start + len(chunk_ids)))
+			self._size += len(chunk_ids)
+			if self._centroids is not None:
+				for row, list_id in zip(range(start, self._size), self._assign(rows)):
+					self._lists[list_id].append(row)
+			if train:
+				self.maybe_train()
+
+	def remove(self, document_id: str) -> None:
+		with self._lock:
+			rows = self._doc_rows.pop(document_id, None)
+			if not rows:
+				return
+			self._alive[rows] = False
+			self._dead += len(rows)
+			if self._dead > 1024 and self._dead > self._size // 3:
+				self._compact()
+
+	def _compact(self) -> None:
+		keep = np.flatnonzero(self._alive[: self._size])
+		self._vectors = self._vectors[keep].copy()
+		self._alive = np.ones(len(keep), dtype=bool)
+		self._keys = [self._keys[i] for i in keep]
+		self._size, self._dead = len(keep), 0
+		self._doc_rows = {}
+		for row, (doc_id, _) in enumerate(self._keys):
+			self._doc_rows.setdefault(doc_id, []).append(row)
+		if self._centroids is not None:
+			self._build_lists()
+
+	def _assign(self, rows: np.ndarray, batch: int = 8192) -> np.ndarray:
+		out = np.empty(len(rows), dtype=np.int32)
+		for start in range(0, len(rows), batch):
+			out[start:start + batch] = np.argmax(rows[start:start + batch] @ self._centroids.T, axis=1)
+		return out
+
+	def _build_lists(self) -> None:
+		alive_rows = np.flatnonzero(self._alive[: self._size])
+		assignment = self._assign(self._vectors[alive_rows])
+		order = np.argsort(assignment, kind="stable")
+		bounds = np.searchsorted(assignment[order], np.arange(len(self._centroids) + 1))
+		self._lists = [array("i", alive_rows[order[bounds[i]:bounds[i + 1]]].astype(np.int32).tobytes()) for i in range(len(self._centroids))]
+
+	def maybe_train(self) -> None:
+		n = len(self)
+		if n < self._train_threshold:
+			return
+		if self._centroids is not None and n < self._trained_size * 4:
+			return
+		self.train()
+
+	def train(self) -> None:
+		"""球面 k-means：nlist ≈ sqrt(N)，只在最多 32 * nlist 个采样点上迭代。"""
+		with self._lock:
+			alive_rows = np.flatnonzero(self._alive[: self._size])
+			n = len(alive_rows)
+			if n == 0:
+				return
+			nlist = int(min(4096, max(16, math.sqrt(n))))
+			nlist = min(nlist, n)
+			rng = np.random.default_rng(0)
+			sample = self._vectors[rng.choice(alive_rows, size=min(n, 32 * nlist), replace=False)]
+			centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+			for _ in range(self._kmeans_iters):
+				labels = np.argmax(sample @ centroids.T, axis=1)
+				sums = np.zeros_like(centroids)
+				np.add.at(sums, labels, sample)
+				counts = np.bincount(labels, minlength=nlist)
+				empty = counts == 0
+				# 空簇重新随机取点，避免中心塌缩
+				sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+				centroids = sums / (np.linalg.norm(sums, axis=1, keepdims=True) + 1e-8)
+			self._centroids = centroids.astype(np.float32)
+			self._trained_size = n
+			self._build_lists()
+
+	def search(self, query: np.ndarray, k: int = 10, nprobe: Optional[int] = None, document_ids: Optional[List[str]] = None) -> List[Tuple[str, str, float]]:
+		"""返回 [(document_id, chunk_id, 相似度)]，按相似度降序。"""
+		with self._lock:
+			if len(self) == 0 or k <= 0:
+				return []
+			q = np.asarray(query, dtype=np.float32)
+			q = q / (np.linalg.norm(q) + 1e-8)
+			if document_ids is not None:
+				candidates = np.asarray([r for d in document_ids for r in self._doc_rows.get(d, [])], dtype=np.int64)
+			elif self._centroids is None:
+				candidates = np.flatnonzero(self._alive[: self._size])
+			else:
+				probe = min(nprobe or self.nprobe, len(self._centroids))
+				nearest = np.argpartition(-(self._centroids @ q), probe - 1)[:probe]
+				candidates = np.concatenate([np.frombuffer(self._lists[i], dtype=np.int32) for i in nearest]).astype(np.int64)
+				candidates = candidates[self._alive[candidates]]
+			if len(candidates) == 0:
+				return []
+			scores = self._vectors[candidates] @ q
+			top = min(k, len(candidates))
+			best = np.argpartition(-scores, top - 1)[:top]
+			best = best[np.argsort(-scores[best])]
+			return [(*self._keys[candidates[i]], float(scores[i])) for i in best]
+
+
+_indexes: Dict[str, IVFIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def loaded_index(location: str) -> Optional[IVFIndex]:
+	"""已加载的共享索引；尚未加载时返回 None，写入钩子因此无需承担构建成本。"""
+	return _indexes.get(location)
+
+
+def discard_index(location: str) -> None:
+	"""丢弃已加载的索引，下次使用时从向量存储重新构建（其他进程的变更无法逐条追上时使用）。"""
+	with _indexes_lock:
+		_indexes.pop(location, None)
+
+
+def shared_index(storage: "VectorStorage") -> IVFIndex:
+	"""进程内按向量存储位置共享一个索引，首次使用时从向量存储全量构建。"""
+	location = storage.location
+	with _indexes_lock:
+		index = _indexes.get(location)
+		if index is None:
+			cfg = storage._js._cfg
+			index = IVFIndex(nprobe=cfg.ann_nprobe, train_threshold=cfg.ann_train_threshold)
+			for document_id, chunk_ids, matrix in storage.iter_document_matrices():
+				index.add(document_id, chunk_ids, matrix, train=False)
+			index.maybe_train()
+			_indexes[location] = index
+		return index
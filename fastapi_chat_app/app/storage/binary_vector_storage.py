@@ -0,0 +1,306 @@
+import json
+import os
+import shutil
+import threading
+import uuid
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from ..config import load_config
+from .json_storage import JSONStorage
+from .quantization import VECTOR_DTYPES, QuantizedMatrix, normalize_rows, quantize_rows
+from .vector_storage import VectorStorage, VectorWriter
+
+
+_SIDECAR_SUFFIX = ".ids.json"
+_DATA_SUFFIX = ".f32"
+# 量化副本：int8 文件在数据之后追加每行的 float32 缩放系数
+_QUANTIZED_SUFFIXES = {"float16": ".f16", "int8": ".i8"}
+_QUANTIZE_BLOCK_ROWS = 8192
+
+
+class BinaryVectorWriter(VectorWriter):
+	"""边向量化边把归一化后的 float32 行追加写入新的数据文件，内存中只保留 chunk_id。"""
+
+	def __init__(self, storage: "BinaryVectorStorage", document_id: str) -> None:
+		self._storage = storage
+		self._document_id = document_id
+		self._chunk_ids: List[str] = []
+		self._dim: Optional[int] = None
+		self._data_name = f"{document_id}.{uuid.uuid4().hex[:8]}{_DATA_SUFFIX}"
+		self._file = open(os.path.join(storage._dir, self._data_name), "wb")
+
+	def append(self, chunk_ids: List[str], vectors: List[List[float]]) -> None:
+		matrix = normalize_rows(vectors)
+		if matrix.size == 0:
+			return
+		self._dim = int(matrix.shape[1])
+		self._file.write(np.ascontiguousarray(matrix).tobytes())
+		self._chunk_ids.extend(chunk_ids)
+
+	def commit(self, dimension: int = 0) -> None:
+		self._file.close()
+		self._storage._commit(self._document_id, self._data_name, self._chunk_ids, self._dim or dimension)
+
+	def abort(self) -> None:
+		self._file.close()
+		try:
+			os.remove(os.path.join(self._storage._dir, self._data_name))
+		except OSError:
+			pass
+
+
+def _write_quantized(source_path: str, target_path: str, count: int, dim: int, dtype: str) -> None:
+	"""分块读取 float32 数据文件生成量化副本，内存中只保留一个块。"""
+	source = np.memmap(source_path, dtype=np.float32, mode="r", shape=(count, dim))
+	scales = []
+	with open(target_path, "wb") as f:
+		for start in range(0, count, _QUANTIZE_BLOCK_ROWS):
+			data, block_scales = quantize_rows(source[start:start + _QUANTIZE_BLOCK_ROWS], dtype)
+			f.write(np.ascontiguousarray(data).tobytes())
+			if block_scales is not None:
+				scales.append(block_scales)
+		if scales:
+			f.write(np.concatenate(scales).astype(np.float32).tobytes())
+	del source
+
+
+class BinaryVectorStorage(VectorStorage):
+	"""
+	二进制向量存储：每个文档一段连续的 float32 矩阵（行 = chunk，写入时已归一化），通过 np.memmap 零拷贝读取。
+	同目录下的 `<document_id>.ids.json` 记录维度、行数、chunk_id 顺序以及当前数据文件名。
+	写入时先落盘新数据文件，再原子替换 sidecar，读者永远看到一致的快照。
+	vector_dtype 为 float16/int8 时额外写入量化副本，检索先扫描量化副本，再只读取候选行的 float32 数据重排。
+	"""
+
+	def __init__(self, json_storage: JSONStorage | None = None, vectors_dir: str | None = None) -> None:
+		self._js = json_storage or JSONStorage()
+		cfg = load_config()
+		self._dir = vectors_dir or cfg.vectors_dir
+		self._dtype = cfg.vector_dtype
+		if self._dtype not in VECTOR_DTYPES:
+			raise ValueError(f"不支持的 VECTOR_DTYPE：{self._dtype}")
+		self._lock = threading.Lock()
+		# document_id -> (sidecar 签名, chunk_ids, 矩阵, 量化矩阵)
+		self._maps: Dict[str, Tuple[Tuple[int, int, int], List[str], np.ndarray, Optional[QuantizedMatrix]]] = {}
+		if not os.path.isdir(self._dir):
+			# 首次启用二进制后端时，从旧的 vectors.json 一次性迁移；多个 worker 同时启动时只由一个迁移
+			with self._js.lock("vectors"):
+				if not os.path.isdir(self._dir):
+					self._migrate()
+
+	def _migrate(self) -> None:
+		"""迁移到临时目录，完成后整体改名就位：中途失败不会留下不完整的向量目录，下次启动重新迁移。需持有 vectors 锁。"""
+		staging_dir = self._dir + ".migrating"
+		shutil.rmtree(staging_dir, ignore_errors=True)
+		os.makedirs(staging_dir)
+		migrate_json_vectors(self._js, BinaryVectorStorage(self._js, staging_dir))
+		os.rename(staging_dir, self._dir)
+
+	def _sidecar_path(self, document_id: str) -> str:
+		return os.path.join(self._dir, document_id + _SIDECAR_SUFFIX)
+
+	def _drop_cached(self, document_id: str) -> None:
+		with self._lock:
+			self._maps.pop(document_id, None)
+
+	def _replaced_files(self, document_id: str) -> Optional[Tuple[int, Tuple[str, ...]]]:
+		"""即将被替换的 sidecar 的 (修改时间纳秒, 引用的数据文件)；不存在时返回 None。"""
+		try:
+			with open(self._sidecar_path(document_id), "r", encoding="utf-8") as f:
+				mtime = os.fstat(f.fileno()).st_mtime_ns
+				meta = json.load(f)
+		except (FileNotFoundError, ValueError):
+			return None
+		names = tuple(n for n in (meta.get("data_file"), (meta.get("quantized") or {}).get("data_file")) if n)
+		return mtime, names
+
+	def _remove_stale_files(self, document_id: str, replaced: Optional[Tuple[int, Tuple[str, ...]]], keep: Tuple[str, ...] = ()) -> None:
+		"""
+		删除该文档不再被引用的数据文件，须持有 vectors 锁。被替换的 sidecar 引用的文件直接删除；
+		其他文件只删除修改时间早于该 sidecar 的（崩溃的写入者留下的），更晚的文件属于仍在追加或刚提交的其他写入者
+		（其他 worker、重新向量化、恢复的入库任务），保留给它们。
+		"""
+		if replaced is None:
+			return
+		mtime, referenced = replaced
+		prefix = document_id + "."
+		suffixes = (_DATA_SUFFIX, *_QUANTIZED_SUFFIXES.values())
+		for name in os.listdir(self._dir):
+			if name.startswith(prefix) and name.endswith(suffixes) and name not in keep:
+				path = os.path.join(self._dir, name)
+				try:
+					if name in referenced or os.stat(path).st_mtime_ns < mtime:
+						os.remove(path)
+				except OSError:
+					# Windows 下仍被映射的文件无法删除，留待下次写入时清理
+					pass
+
+	def open_writer(self, document_id: str) -> BinaryVectorWriter:
+		return BinaryVectorWriter(self, document_id)
+
+	def upsert_document_vectors(self, document_id: str, chunk_ids: List[str], vectors: List[List[float]], dimension: int) -> None:
+		writer = self.open_writer(document_id)
+		writer.append(chunk_ids, vectors)
+		writer.commit(dimension)
+
+	def _commit(self, document_id: str, data_name: str, chunk_ids: List[str], dimension: int) -> None:
+		sidecar: Dict[str, Any] = {
+			"document_id": document_id,
+			"dimension": dimension,
+			"count": len(chunk_ids),
+			"dtype": "float32",
+			"normalized": True,
+			"data_file": data_name,
+			"chunk_ids": list(chunk_ids),
+		}
+		keep: Tuple[str, ...] = (data_name,)
+		if self._dtype in _QUANTIZED_SUFFIXES and chunk_ids:
+			quantized_name = data_name[: -len(_DATA_SUFFIX)] + _QUANTIZED_SUFFIXES[self._dtype]
+			_write_quantized(os.path.join(self._dir, data_name), os.path.join(self._dir, quantized_name), len(chunk_ids), dimension, self._dtype)
+			sidecar["quantized"] = {"dtype": self._dtype, "data_file": quantized_name}
+			keep += (quantized_name,)
+		sidecar_path = self._sidecar_path(document_id)
+		tmp_path = f"{sidecar_path}.{os.getpid()}.tmp"
+		# 替换 sidecar 与清理旧文件在跨进程锁内完成，同一文档的多个写入者不会删掉彼此的数据文件
+		with self._js.lock("vectors"):
+			replaced = self._replaced_files(document_id)
+			with open(tmp_path, "w", encoding="utf-8") as f:
+				json.dump(sidecar, f, ensure_ascii=False)
+			self._drop_cached(document_id)
+			os.replace(tmp_path, sidecar_path)
+			self._remove_stale_files(document_id, replaced, keep=keep)
+		found = self.get_document_matrix(document_id)
+		if found is not None:
+			self._publish_upsert(document_id, found[0], found[1])
+
+	def _load(self, document_id: str) -> Optional[Tuple[Tuple[int, int, int], List[str], np.ndarray, Optional[QuantizedMatrix]]]:
+		sidecar_path = self._sidecar_path(document_id)
+		try:
+			st = os.stat(sidecar_path)
+		except FileNotFoundError:
+			self._drop_cached(document_id)
+			return None
+		signature = (st.st_ino, st.st_mtime_ns, st.st_size)
+		cached = self._maps.get(document_id)
+		if cached and cached[0] == signature:
+			return cached
+
+		with open(sidecar_path, "r", encoding="utf-8") as f:
+			meta = json.load(f)
+		count, dim = int(meta["count"]), int(meta["dimension"])
+		quantized: Optional[QuantizedMatrix] = None
+		if count == 0:
+			matrix = np.empty((0, dim), dtype=np.float32)
+		else:
+			matrix = np.memmap(os.path.join(self._dir, meta["data_file"]), dtype=np.float32, mode="r", shape=(count, dim))
+			if not meta.get("normalized"):
+				# 旧版文件未归一化：读入内存归一化，下次写入该文档时落盘为新格式
+				matrix = normalize_rows(matrix)
+			q_meta = meta.get("quantized")
+			if q_meta and q_meta["dtype"] == self._dtype:
+				q_path = os.path.join(self._dir, q_meta["data_file"])
+				if self._dtype == "int8":
+					data = np.memmap(q_path, dtype=np.int8, mode="r", shape=(count, dim))
+					scales = np.memmap(q_path, dtype=np.float32, mode="r", offset=count * dim, shape=(count,))
+					quantized = QuantizedMatrix(data, scales)
+				else:
+					quantized = QuantizedMatrix(np.memmap(q_path, dtype=np.float16, mode="r", shape=(count, dim)))
+		entry = (signature, meta["chunk_ids"], matrix, quantized)
+		with self._lock:
+			self._maps[document_id] = entry
+		return entry
+
+	def get_document_matrix(self, document_id: str) -> Optional[Tuple[List[str], np.ndarray]]:
+		entry = self._load(document_id)
+		if entry is None:
+			return None
+		return entry[1], entry[2]
+
+	def get_quantized_matrix(self, document_id: str) -> Optional[QuantizedMatrix]:
+		# 在切换 VECTOR_DTYPE 之前写入的文档没有对应的量化副本，返回 None 时按 float32 检索
+		entry = self._load(document_id)
+		return entry[3] if entry is not None else None
+
+	def get_document_vectors(self, document_id: str) -> Dict[str, Any] | None:
+		# 兼容旧接口：会构造 Python 列表，热路径请使用 get_document_matrix
+		found = self.get_document_matrix(document_id)
+		if found is None:
+			return None
+		chunk_ids, matrix = found
+		dim = int(matrix.shape[1])
+		return {
+			"document_id": document_id,
+			"chunk_vectors": [
+				{"chunk_id": cid, "vector": row.tolist(), "dimension": dim} for cid, row in zip(chunk_ids, matrix)
+			],
+		}
+
+	def delete_document_vectors(self, document_id: str) -> None:
+		with self._js.lock("vectors"):
+			replaced = self._replaced_files(document_id)
+			self._drop_cached(document_id)
+			try:
+				os.remove(self._sidecar_path(document_id))
+			except FileNotFoundError:
+				pass
+			self._remove_stale_files(document_id, replaced)
+		self._publish_delete(document_id)
+
+	def list_document_ids(self) -> List[str]:
+		return [name[: -len(_SIDECAR_SUFFIX)] for name in os.listdir(self._dir) if name.endswith(_SIDECAR_SUFFIX)]
+
+	@property
+	def location(self) -> str:
+		return os.path.abspath(self._dir)
+
+	def iter_document_matrices(self) -> Iterator[Tuple[str, List[str], np.ndarray]]:
+		for document_id in self.list_document_ids():
+			found = self.get_document_matrix(document_id)
+			if found is not None:
+				yield document_id, found[0], found[1]
+
+
+def migrate_json_vectors(json_storage: JSONStorage, target: BinaryVectorStorage) -> int:
+	"""把 vectors.json 中的全部文档向量写入二进制存储，返回迁移的文档数。原文件保持不变。"""
+	data = json_storage.read_vectors()
+	migrated = 0
+	for item in data.get("vectors", []):
+		chunk_vectors = item.get("chunk_vectors", [])
+		dim = chunk_vectors[0].get("dimension", len(chunk_vectors[0]["vector"])) if chunk_vectors else 0
+		target.upsert_document_vectors(
+			item["document_id"],
+			[x["chunk_id"] for x in chunk_vectors],
+			[x["vector"] for x in chunk_vectors],
+			dim,
+		)
+		migrated += 1
+	return migrated
+
+
+def rewrite_vectors(storage: BinaryVectorStorage) -> int:
+	"""按当前格式重写全部文档：补齐归一化标记，并按 VECTOR_DTYPE 生成量化副本。返回重写的文档数。"""
+	rewritten = 0
+	for document_id in storage.list_document_ids():
+		found = storage.get_document_matrix(document_id)
+		if found is None:
+			continue
+		chunk_ids, matrix = found
+		storage.upsert_document_vectors(document_id, list(chunk_ids), np.array(matrix), int(matrix.shape[1]))
+		rewritten += 1
+	return rewritten
+
+
+if __name__ == "__main__":
+	# 用法：python -m app.storage.binary_vector_storage            （重新执行 vectors.json -> 二进制迁移）
+	#       python -m app.storage.binary_vector_storage --rewrite  （切换 VECTOR_DTYPE 后重写已有向量）
+	import sys
+
+	storage = BinaryVectorStorage()
+	if "--rewrite" in sys.argv[1:]:
+		count = rewrite_vectors(storage)
+		print(f"[INFO] Rewrote {count} documents in {storage._dir} as {storage._dtype}")
+	else:
+		count = migrate_json_vectors(storage._js, storage)
+		print(f"[INFO] Migrated {count} documents into {storage._dir}")
@@ -0,0 +1,79 @@
+import json
+import os
+import uuid
+from typing import Any, Dict, List, Optional
+
+from .file_lock import file_lock
+
+
+# 进程标识：pid 加启动时的随机串（多个容器共享数据目录时 pid 可能相同；fork 出的子进程 pid 不同）
+_INSTANCE = uuid.uuid4().hex[:8]
+
+
+def _source() -> str:
+	return f"{os.getpid()}-{_INSTANCE}"
+
+
+class ChangeFeed:
+	"""
+	进程间的文档变更通知：共享的只追加日志（changes.jsonl），每行 {"source", "op": "put"/"delete", "document_id"}。
+	写入方在文件锁内追加；各进程定期 poll，读取自上次位置以来其他进程写入的完整行。
+	文件超过 max_bytes 时整体替换为新文件，读者发现 inode 变化后无法确定错过了哪些变更，poll 返回 None 表示需要全量重建。
+	"""
+
+	def __init__(self, path: str, max_bytes: int = 1024 * 1024) -> None:
+		self._path = path
+		self._max_bytes = max_bytes
+		self._lock = file_lock(path + ".lock")
+		if not os.path.exists(path):
+			with self._lock:
+				open(path, "ab").close()
+		st = os.stat(path)
+		# 只关心之后的变更：此前的内容已反映在存储中，进程内索引首次使用时从存储构建
+		self._ino, self._offset = st.st_ino, st.st_size
+
+	def publish(self, op: str, document_id: str) -> None:
+		line = (json.dumps({"source": _source(), "op": op, "document_id": document_id}, separators=(",", ":")) + "\n").encode("utf-8")
+		with self._lock:
+			try:
+				size = os.path.getsize(self._path)
+			except FileNotFoundError:
+				size = 0
+			if size >= self._max_bytes:
+				tmp_path = f"{self._path}.{os.getpid()}.tmp"
+				open(tmp_path, "wb").close()
+				os.replace(tmp_path, self._path)
+			fd = os.open(self._path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+			try:
+				os.write(fd, line)
+			finally:
+				os.close(fd)
+
+	def poll(self) -> Optional[List[Dict[str, Any]]]:
+		"""返回其他进程新写入的变更（本进程自己的变更已在写入时处理）；日志被替换过时返回 None。"""
+		try:
+			st = os.stat(self._path)
+		except FileNotFoundError:
+			return []
+		if st.st_ino != self._ino or st.st_size < self._offset:
+			self._ino, self._offset = st.st_ino, 0
+			self.poll()
+			return None
+		if st.st_size == self._offset:
+			return []
+		with open(self._path, "rb") as f:
+			f.seek(self._offset)
+			data = f.read(st.st_size - self._offset)
+		# 只消费完整的行，未写完的行留到下次
+		end = data.rfind(b"\n") + 1
+		self._offset += end
+		source = _source()
+		events = []
+		for line in data[:end].splitlines():
+			try:
+				event = json.loads(line)
+			except ValueError:
+				continue
+			if event.get("source") != source:
+				events.append(event)
+		return events
@@ -0,0 +1,107 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+def embedding_cache_key(model: str, text: str) -> str:
+	return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+class SQLiteEmbeddingCache:
+	"""
+	持久化的向量缓存：key 为 hash(model, text)，向量以 float32 BLOB 保存。
+	条目数超过上限时按 last_used 淘汰最久未使用的部分。
+	"""
+
+	_TRIM_EVERY = 256
+
+	def __init__(self, path: str, max_entries: int) -> None:
+		self._max_entries = max_entries
+		self._lock = threading.Lock()
+		self._conn = sqlite3.connect(path, check_same_thread=False)
+		self._conn.execute("PRAGMA journal_mode=WAL")
+		self._conn.execute("PRAGMA synchronous=NORMAL")
+		self._conn.execute(
+			"CREATE TABLE IF NOT EXISTS embeddings ("
+			"key TEXT PRIMARY KEY, vector BLOB NOT NULL, created_at REAL NOT NULL, last_used REAL NOT NULL)"
+		)
+		self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+		self._conn.commit()
+		self._puts = 0
+
+	def get(self, key: str, max_age: Optional[float] = None) -> Optional[np.ndarray]:
+		now = time.time()
+		with self._lock:
+			row = self._conn.execute("SELECT vector, created_at FROM embeddings WHERE key = ?", (key,)).fetchone()
+			if row is None:
+				return None
+			if max_age is not None and now - row[1] > max_age:
+				self._conn.execute("DELETE FROM embeddings WHERE key = ?", (key,))
+				self._conn.commit()
+				return None
+			self._conn.execute("UPDATE embeddings SET last_used = ? WHERE key = ?", (now, key))
+			self._conn.commit()
+		return np.frombuffer(row[0], dtype=np.float32)
+
+	def put(self, key: str, vector: np.ndarray) -> None:
+		now = time.time()
+		blob = np.asarray(vector, dtype=np.float32).tobytes()
+		with self._lock:
+			self._conn.execute(
+				"INSERT OR REPLACE INTO embeddings (key, vector, created_at, last_used) VALUES (?, ?, ?, ?)",
+				(key, blob, now, now),
+			)
+			self._puts += 1
+			if self._puts % self._TRIM_EVERY == 0:
+				self._trim()
+			self._conn.commit()
+
+	def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+		"""批量查询，返回命中的 key -> 向量，并刷新命中项的 last_used。"""
+		found: Dict[str, np.ndarray] = {}
+		now = time.time()
+		with self._lock:
+			for start in range(0, len(keys), 500):
+				batch = keys[start:start + 500]
+				placeholders = ",".join("?" * len(batch))
+				for key, blob in self._conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch):
+					found[key] = np.frombuffer(blob, dtype=np.float32)
+			if found:
+				self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key in found])
+				self._conn.commit()
+		return found
+
+	def put_many(self, items: Dict[str, np.ndarray]) -> None:
+		now = time.time()
+		rows = [(key, np.asarray(vec, dtype=np.float32).tobytes(), now, now) for key, vec in items.items()]
+		with self._lock:
+			self._conn.executemany(
+				"INSERT OR REPLACE INTO embeddings (key, vector, created_at, last_used) VALUES (?, ?, ?, ?)",
+				rows,
+			)
+			before = self._puts
+			self._puts += len(rows)
+			if self._puts // self._TRIM_EVERY != before // self._TRIM_EVERY:
+				self._trim()
+			self._conn.commit()
+
+	def _trim(self) -> None:
+		count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+		excess = count - self._max_entries
+		if excess > 0:
+			self._conn.execute(
+				"DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+				(excess,),
+			)
+
+	def __len__(self) -> int:
+		with self._lock:
+			return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+	def close(self) -> None:
+		with self._lock:
+			self._conn.close()
@@ -0,0 +1,108 @@
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+try:
+	import fcntl
+except ImportError:  # Windows
+	fcntl = None
+	import msvcrt
+
+
+def _try_lock(fd: int) -> bool:
+	try:
+		if fcntl is not None:
+			fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+		else:
+			os.lseek(fd, 0, os.SEEK_SET)
+			msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+		return True
+	except OSError:
+		return False
+
+
+def _lock(fd: int) -> None:
+	if fcntl is not None:
+		fcntl.flock(fd, fcntl.LOCK_EX)
+		return
+	# msvcrt 没有无限期阻塞的加锁方式，短暂休眠后重试
+	while not _try_lock(fd):
+		time.sleep(0.01)
+
+
+def _unlock(fd: int) -> None:
+	if fcntl is not None:
+		fcntl.flock(fd, fcntl.LOCK_UN)
+	else:
+		os.lseek(fd, 0, os.SEEK_SET)
+		msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+class FileLock:
+	"""
+	跨进程互斥锁：对锁文件加排他锁（POSIX 用 flock，Windows 用 msvcrt.locking），进程退出时由系统释放。
+	同一进程内先经线程锁串行化，并且可重入：已持有时再次获取只增加计数。
+	"""
+
+	def __init__(self, path: str) -> None:
+		self.path = path
+		self._thread_lock = threading.RLock()
+		self._depth = 0
+		self._fd: Optional[int] = None
+
+	def _open(self) -> int:
+		if self._fd is None:
+			os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+			self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+		return self._fd
+
+	def acquire(self, blocking: bool = True) -> bool:
+		if not self._thread_lock.acquire(blocking):
+			return False
+		if self._depth == 0:
+			try:
+				fd = self._open()
+				if blocking:
+					_lock(fd)
+				elif not _try_lock(fd):
+					self._thread_lock.release()
+					return False
+			except BaseException:
+				self._thread_lock.release()
+				raise
+		self._depth += 1
+		return True
+
+	def release(self) -> None:
+		self._depth -= 1
+		if self._depth == 0:
+			_unlock(self._fd)
+		self._thread_lock.release()
+
+	def close(self) -> None:
+		with self._thread_lock:
+			if self._fd is not None and self._depth == 0:
+				os.close(self._fd)
+				self._fd = None
+
+	def __enter__(self) -> "FileLock":
+		self.acquire()
+		return self
+
+	def __exit__(self, exc_type, exc, tb) -> None:
+		self.release()
+
+
+_locks: Dict[str, FileLock] = {}
+_locks_lock = threading.Lock()
+
+
+def file_lock(path: str) -> FileLock:
+	"""进程内每个锁文件只对应一个 FileLock：flock 按打开的文件计，同一进程重复打开会互相阻塞。"""
+	path = os.path.abspath(path)
+	with _locks_lock:
+		lock = _locks.get(path)
+		if lock is None:
+			lock = _locks[path] = FileLock(path)
+		return lock
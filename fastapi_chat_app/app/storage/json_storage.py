@@ -1,35 +1,227 @@
 import json
 import os
-from typing import Any, Dict
+import re
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
 from ..config import load_config
+from ..utils.metrics import STORAGE_READ_SECONDS, STORAGE_WRITE_BYTES, STORAGE_WRITE_SECONDS
+from .file_lock import FileLock, file_lock
+from .read_cache import shared_snapshot_cache
+
+
+# 会话文件名来自客户端传入的 session_id，只接受 UUID 形式
+_SESSION_ID = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
+
+
+class ChunkWriter:
+	"""
+	按窗口追加单个文档的分块：分块直接序列化写入临时文件，内存中只保留计数；
+	commit(record) 写入文档头信息（不含 chunks）后才对读者可见。文件内容为 {"chunks": [...] 加上 _tail 的其余字段}。
+	"""
+
+	def __init__(self, storage: "JSONStorage", document_id: str, path: str) -> None:
+		self._storage = storage
+		self._document_id = document_id
+		self._path = path
+		self._file = open(path, "w", encoding="utf-8")
+		self._file.write('{"chunks":[')
+		self.count = 0
+
+	def append(self, chunks: List[Dict[str, Any]]) -> None:
+		for chunk in chunks:
+			if self.count:
+				self._file.write(",")
+			json.dump(chunk, self._file, ensure_ascii=False, separators=(",", ":"))
+			self.count += 1
+
+	def _tail(self, record: Dict[str, Any]) -> Dict[str, Any]:
+		"""写在 chunks 之后的其他字段；分块文件只保存 chunks。"""
+		return {}
+
+	def commit(self, record: Dict[str, Any]) -> None:
+		tail = self._tail(record)
+		self._file.write("]")
+		for key, value in tail.items():
+			self._file.write(f",{json.dumps(key, ensure_ascii=False)}:{json.dumps(value, ensure_ascii=False, separators=(',', ':'))}")
+		self._file.write("}")
+		self._file.close()
+		try:
+			self._publish(record)
+		finally:
+			self._discard()
+
+	def _publish(self, record: Dict[str, Any]) -> None:
+		self._storage._commit_chunks(record, self._path)
+
+	def abort(self) -> None:
+		self._file.close()
+		self._discard()
+
+	def _discard(self) -> None:
+		try:
+			os.remove(self._path)
+		except OSError:
+			pass
 
 
 class JSONStorage:
 	def __init__(self) -> None:
 		self._cfg = load_config()
+		self._cache = shared_snapshot_cache(self._cfg.storage_cache_max_bytes) if self._cfg.storage_cache_enabled else None
 		os.makedirs(self._cfg.data_dir, exist_ok=True)
-		if not os.path.exists(self._cfg.documents_path):
-			self._write_file(self._cfg.documents_path, {"documents": []})
-		if not os.path.exists(self._cfg.vectors_path):
-			self._write_file(self._cfg.vectors_path, {"vectors": []})
-		if not os.path.exists(self._cfg.users_path):
-			self._write_file(self._cfg.users_path, {"users": []})
-
-	def _read_file(self, path: str) -> Dict[str, Any]:
-		with open(path, "r", encoding="utf-8") as f:
-			return json.load(f)
-
-	def _write_file(self, path: str, data: Dict[str, Any]) -> None:
-		tmp_path = path + ".tmp"
+		self._manifest_path = os.path.join(self._cfg.documents_dir, "manifest.json")
+		# 清单中 document_id -> 条目的索引，清单快照（documents 列表对象）变化时重建
+		self._manifest_index: Dict[str, Dict[str, Any]] = {}
+		self._manifest_source: Optional[List[Dict[str, Any]]] = None
+		self._versions: Dict[str, int] = {}
+		self._versions_source: Optional[List[Dict[str, Any]]] = None
+		for path, name, empty in ((self._cfg.vectors_path, "vectors", {"vectors": []}), (self._cfg.users_path, "users", {"users": []}), (self._cfg.jobs_path, "jobs", {"jobs": []})):
+			if not os.path.exists(path):
+				# 多个 worker 同时启动时只由一个创建，避免覆盖其他进程刚写入的内容
+				with self.lock(name):
+					if not os.path.exists(path):
+						self._write_file(path, empty)
+
+	@property
+	def location(self) -> str:
+		"""文档记录的存储位置，用于在进程内共享同一份词法索引。"""
+		return os.path.abspath(self._manifest_path)
+
+	def lock(self, name: str) -> FileLock:
+		"""
+		按名称（users / documents / vectors / jobs / revoked / sessions）取跨进程文件锁。
+		多 worker 部署时所有“读取-修改-写回”都在对应的锁内完成，避免并发写入丢失更新；锁可重入。
+		"""
+		return file_lock(os.path.join(self._cfg.data_dir, f"{name}.lock"))
+
+	def _read_file(self, path: str, label: Optional[str] = None) -> Dict[str, Any]:
+		start = time.perf_counter()
+		name = label or os.path.basename(path)
+		if self._cache is None:
+			with open(path, "r", encoding="utf-8") as f:
+				data = json.load(f)
+			STORAGE_READ_SECONDS.labels(name, "disabled").observe(time.perf_counter() - start)
+			return data
+		st = os.stat(path)
+		data = self._cache.get(path, (st.st_ino, st.st_mtime_ns, st.st_size))
+		outcome = "hit"
+		if data is None:
+			outcome = "miss"
+			with open(path, "r", encoding="utf-8") as f:
+				# 以已打开文件的签名入缓存，避免 stat 与读取之间文件被替换造成错配
+				fst = os.fstat(f.fileno())
+				data = json.load(f)
+			self._cache.put(path, (fst.st_ino, fst.st_mtime_ns, fst.st_size), data, fst.st_size)
+		STORAGE_READ_SECONDS.labels(name, outcome).observe(time.perf_counter() - start)
+		# 浅拷贝顶层：调用方可以安全地替换顶层键，嵌套对象仍与快照共享，只读使用
+		return dict(data)
+
+	def _write_file(self, path: str, data: Dict[str, Any], label: Optional[str] = None) -> None:
+		start = time.perf_counter()
+		# 临时文件名带 pid，不同进程写同一文件时互不覆盖各自的临时文件
+		tmp_path = f"{path}.{os.getpid()}.tmp"
 		with open(tmp_path, "w", encoding="utf-8") as f:
 			json.dump(data, f, ensure_ascii=False, indent=2)
 		os.replace(tmp_path, path)
+		st = os.stat(path)
+		if self._cache is not None:
+			self._cache.put(path, (st.st_ino, st.st_mtime_ns, st.st_size), data, st.st_size)
+		name = label or os.path.basename(path)
+		STORAGE_WRITE_SECONDS.labels(name).observe(time.perf_counter() - start)
+		STORAGE_WRITE_BYTES.labels(name).inc(st.st_size)
+
+	def cache_stats(self) -> Dict[str, Any]:
+		return self._cache.stats() if self._cache is not None else {"enabled": False}
 
+	# 文档拆成清单（documents/manifest.json，只含文件名、上传时间、metadata 与版本号）和每个文档一个分块文件，
+	# 列表、推荐与单文档查找只读清单，分块内容按需读取并经读缓存复用
 	def read_documents(self) -> Dict[str, Any]:
-		return self._read_file(self._cfg.documents_path)
+		"""兼容整文件接口：返回包含分块内容的全部文档。"""
+		return {"documents": self.list_documents()}
 
 	def write_documents(self, data: Dict[str, Any]) -> None:
-		self._write_file(self._cfg.documents_path, data)
+		records = data.get("documents", [])
+		with self.lock("documents"):
+			previous = {e["document_id"]: e for e in self._read_manifest().get("documents", [])}
+			for record in records:
+				self._write_chunks(record)
+			self._write_manifest([self._manifest_entry(r, previous.get(r["document_id"])) for r in records])
+			kept = {r["document_id"] for r in records}
+			for document_id in previous.keys() - kept:
+				self._remove_chunks(document_id)
+
+	def _chunks_path(self, document_id: str) -> str:
+		return os.path.join(self._cfg.documents_dir, document_id + ".chunks.json")
+
+	def _read_manifest(self) -> Dict[str, Any]:
+		if not os.path.exists(self._manifest_path):
+			with self.lock("documents"):
+				if not os.path.exists(self._manifest_path):
+					os.makedirs(self._cfg.documents_dir, exist_ok=True)
+					# 首次使用时从旧版 documents.json 一次性拆分，源文件保持不变
+					legacy = self._read_file(self._cfg.documents_path).get("documents", []) if os.path.exists(self._cfg.documents_path) else []
+					for record in legacy:
+						self._write_chunks(record)
+					self._write_manifest([self._manifest_entry(r, None) for r in legacy])
+		return self._read_file(self._manifest_path)
+
+	def _write_manifest(self, entries: List[Dict[str, Any]]) -> None:
+		# 按上传时间倒序预先排好，推荐问题等只取最近几个文档时无需排序
+		recent = [e["document_id"] for e in sorted(entries, key=lambda e: e.get("upload_time", ""), reverse=True)]
+		self._write_file(self._manifest_path, {"documents": entries, "recent": recent})
+
+	@staticmethod
+	def _manifest_entry(record: Dict[str, Any], previous: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+		entry = {k: v for k, v in record.items() if k != "chunks"}
+		# 同一文档每次写入版本号加一
+		entry["version"] = previous.get("version", 0) + 1 if previous else 1
+		return entry
+
+	def _write_chunks(self, record: Dict[str, Any]) -> None:
+		self._write_file(self._chunks_path(record["document_id"]), {"chunks": record.get("chunks", [])}, label="chunks")
+
+	def _read_chunks(self, document_id: str) -> List[Dict[str, Any]]:
+		path = self._chunks_path(document_id)
+		if not os.path.exists(path):
+			return []
+		return self._read_file(path, label="chunks").get("chunks", [])
+
+	def open_chunk_writer(self, document_id: str) -> ChunkWriter:
+		"""流式写入一个文档的分块，供大文件入库使用；提交时的效果与 put_document 相同。"""
+		os.makedirs(self._cfg.documents_dir, exist_ok=True)
+		path = f"{self._chunks_path(document_id)}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+		return ChunkWriter(self, document_id, path)
+
+	def _commit_chunks(self, record: Dict[str, Any], chunks_path: str) -> None:
+		document_id = record["document_id"]
+		with self.lock("documents"):
+			entries = self._read_manifest().get("documents", [])
+			# 与 put_document 相同：先替换分块文件再更新清单
+			target = self._chunks_path(document_id)
+			if self._cache is not None:
+				self._cache.invalidate(target)
+			os.replace(chunks_path, target)
+			previous = next((e for e in entries if e["document_id"] == document_id), None)
+			self._write_manifest([e for e in entries if e["document_id"] != document_id] + [self._manifest_entry(record, previous)])
+
+	def _remove_chunks(self, document_id: str) -> None:
+		path = self._chunks_path(document_id)
+		if self._cache is not None:
+			self._cache.invalidate(path)
+		try:
+			os.remove(path)
+		except FileNotFoundError:
+			pass
+
+	def _manifest_entries(self) -> Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]:
+		"""返回 (清单, document_id -> 条目)；清单未变化时复用已建好的索引。"""
+		manifest = self._read_manifest()
+		entries = manifest.get("documents", [])
+		if entries is not self._manifest_source:
+			self._manifest_index = {e["document_id"]: e for e in entries}
+			self._manifest_source = entries
+		return manifest, self._manifest_index
 
 	def read_vectors(self) -> Dict[str, Any]:
 		return self._read_file(self._cfg.vectors_path)
@@ -43,4 +235,140 @@ class JSONStorage:
 	def write_users(self, data: Dict[str, Any]) -> None:
 		self._write_file(self._cfg.users_path, data)
 
+	def read_jobs(self) -> Dict[str, Any]:
+		return self._read_file(self._cfg.jobs_path)
+
+	def write_jobs(self, data: Dict[str, Any]) -> None:
+		self._write_file(self._cfg.jobs_path, data)
+
+	# 记录级接口：服务层通过这些方法读写单个文档/用户，其他存储后端可以只改写这些方法
+	def list_documents(self, include_chunks: bool = True) -> List[Dict[str, Any]]:
+		"""include_chunks 为 False 时调用方只需要文档头信息，支持的后端可以跳过分块内容。"""
+		entries = self._read_manifest().get("documents", [])
+		if not include_chunks:
+			return entries
+		return [{**e, "chunks": self._read_chunks(e["document_id"])} for e in entries]
+
+	def get_document(self, document_id: str) -> Optional[Dict[str, Any]]:
+		entry = self._manifest_entries()[1].get(document_id)
+		if entry is None:
+			return None
+		return {**entry, "chunks": self._read_chunks(document_id)}
+
+	def document_versions(self) -> Dict[str, int]:
+		"""
+		document_id -> 持久化的版本号，文档每次写入都会改变，其他进程的写入同样可见；供回答缓存判断文档是否变化。
+		内容未变化时返回同一个对象，返回值只读。
+		"""
+		entries = self._read_manifest().get("documents", [])
+		if entries is not self._versions_source:
+			self._versions = {e["document_id"]: e.get("version", 0) for e in entries}
+			self._versions_source = entries
+		return self._versions
+
+	def recent_documents(self, limit: int) -> List[Dict[str, Any]]:
+		"""按上传时间倒序的最近 limit 个文档（不含分块内容）。"""
+		manifest, index = self._manifest_entries()
+		return [index[document_id] for document_id in manifest.get("recent", [])[:limit] if document_id in index]
+
+	def put_document(self, record: Dict[str, Any]) -> None:
+		with self.lock("documents"):
+			entries = self._read_manifest().get("documents", [])
+			# 先写分块文件再更新清单：读者在清单中看到新条目时分块已经就绪
+			self._write_chunks(record)
+			previous = next((e for e in entries if e["document_id"] == record["document_id"]), None)
+			self._write_manifest([e for e in entries if e["document_id"] != record["document_id"]] + [self._manifest_entry(record, previous)])
+
+	def delete_document(self, document_id: str) -> None:
+		with self.lock("documents"):
+			entries = self._read_manifest().get("documents", [])
+			self._write_manifest([e for e in entries if e["document_id"] != document_id])
+			self._remove_chunks(document_id)
+
+	def list_users(self) -> List[Dict[str, Any]]:
+		return self.read_users().get("users", [])
+
+	def get_user(self, user_id: str) -> Optional[Dict[str, Any]]:
+		return next((u for u in self.list_users() if u["user_id"] == user_id), None)
+
+	def find_user(self, username: str) -> Optional[Dict[str, Any]]:
+		"""按用户名查找（不区分大小写）。"""
+		username = username.strip().lower()
+		return next((u for u in self.list_users() if u["username"].lower() == username), None)
+
+	def put_user(self, user: Dict[str, Any]) -> None:
+		with self.lock("users"):
+			data = self.read_users()
+			users = data.get("users", [])
+			# 读缓存中的快照是共享的，这里构造新列表而不是原地修改
+			if any(u["user_id"] == user["user_id"] for u in users):
+				data["users"] = [user if u["user_id"] == user["user_id"] else u for u in users]
+			else:
+				data["users"] = users + [user]
+			self.write_users(data)
+
+	# 聊天会话：所有存储后端都保存为 sessions_dir 下每个会话一个 JSON 文件（与 jobs.json 一样不随 STORAGE_BACKEND 切换）
+	def _session_path(self, session_id: str) -> Optional[str]:
+		if not _SESSION_ID.fullmatch(session_id):
+			return None
+		return os.path.join(self._cfg.sessions_dir, session_id + ".json")
+
+	def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+		path = self._session_path(session_id)
+		if path is None or not os.path.exists(path):
+			return None
+		return self._read_file(path, label="sessions")
+
+	def put_session(self, session: Dict[str, Any]) -> None:
+		path = self._session_path(session["session_id"])
+		if path is None:
+			raise ValueError("无效的会话ID")
+		os.makedirs(self._cfg.sessions_dir, exist_ok=True)
+		self._write_file(path, session, label="sessions")
+
+	def expire_sessions(self, max_age: float) -> int:
+		"""删除超过 max_age 秒未写入的会话文件（按文件修改时间），返回删除数。"""
+		try:
+			entries = list(os.scandir(self._cfg.sessions_dir))
+		except FileNotFoundError:
+			return 0
+		cutoff = time.time() - max_age
+		removed = 0
+		for entry in entries:
+			session_id, ext = os.path.splitext(entry.name)
+			if ext != ".json" or not _SESSION_ID.fullmatch(session_id):
+				continue
+			try:
+				if entry.stat().st_mtime >= cutoff:
+					continue
+				# 锁内重新检查，不删除其他 worker 刚写入的会话
+				with self.lock("sessions"):
+					if os.stat(entry.path).st_mtime < cutoff:
+						self.delete_session(session_id)
+						removed += 1
+			except FileNotFoundError:
+				continue
+		return removed
+
+	def delete_session(self, session_id: str) -> None:
+		path = self._session_path(session_id)
+		if path is None:
+			return
+		if self._cache is not None:
+			self._cache.invalidate(path)
+		try:
+			os.remove(path)
+		except FileNotFoundError:
+			pass
+
 
+def create_storage() -> JSONStorage:
+	"""按配置 STORAGE_BACKEND 选择文档/用户存储：json（默认，整文件读写）、log（只追加日志）或 sqlite。"""
+	cfg = load_config()
+	if cfg.storage_backend == "log":
+		from .log_storage import LogStorage
+		return LogStorage()
+	if cfg.storage_backend == "sqlite":
+		from .sqlite_storage import SQLiteStorage
+		return SQLiteStorage()
+	return JSONStorage()
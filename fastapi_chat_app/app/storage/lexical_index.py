@@ -0,0 +1,205 @@
+import math
+import re
+import threading
+import unicodedata
+from array import array
+from collections import Counter
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+	from .json_storage import JSONStorage
+
+
+# 连续的中日韩文字，或连续的字母数字（英文单词、数字、编号）
+_TOKEN_RUNS = re.compile(r"[㐀-䶿一-鿿豈-﫿]+|[a-z0-9]+(?:[._-][a-z0-9]+)*")
+_CJK = re.compile(r"[㐀-䶿一-鿿豈-﫿]")
+
+
+def tokenize(text: str) -> List[str]:
+	"""中文按字符二元组切分（单字的片段保留单字），字母数字按整词切分；统一全半角与大小写。"""
+	tokens: List[str] = []
+	for run in _TOKEN_RUNS.findall(unicodedata.normalize("NFKC", text).lower()):
+		if _CJK.match(run):
+			if len(run) == 1:
+				tokens.append(run)
+			else:
+				tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+		else:
+			tokens.append(run)
+	return tokens
+
+
+class BM25Index:
+	"""
+	chunk 级 BM25 倒排索引。词项映射为整数 id，每个词项的倒排表是两个紧凑数组：
+	行号 array('i') 与词频 array('H')，每条记录 6 字节；行号对应 (document_id, chunk_id)。
+	文档增删是增量的：新增追加倒排记录，删除只打墓碑，墓碑过多时压缩。
+	df 在查询时按存活行统计，删除后无需回写倒排表。
+	"""
+
+	def __init__(self, k1: float = 1.2, b: float = 0.75) -> None:
+		self.k1 = k1
+		self.b = b
+		self._lock = threading.RLock()
+		self._vocab: Dict[str, int] = {}
+		self._rows: List[array] = []
+		self._freqs: List[array] = []
+		self._keys: List[Tuple[str, str]] = []
+		self._lengths = array("i")
+		self._alive = bytearray()
+		self._doc_rows: Dict[str, range] = {}
+		self._dead = 0
+		self._total_length = 0
+
+	def __len__(self) -> int:
+		return len(self._keys) - self._dead
+
+	def add(self, document_id: str, chunks: Iterable[Tuple[str, str]]) -> None:
+		"""写入（或替换）一个文档的全部 chunk，chunks 为 [(chunk_id, 文本)]。"""
+		tokenized = [(chunk_id, Counter(tokenize(content))) for chunk_id, content in chunks]
+		with self._lock:
+			self.remove(document_id)
+			start = len(self._keys)
+			for row, (chunk_id, counts) in enumerate(tokenized, start):
+				for term, freq in counts.items():
+					term_id = self._vocab.get(term)
+					if term_id is None:
+						term_id = self._vocab[term] = len(self._rows)
+						self._rows.append(array("i"))
+						self._freqs.append(array("H"))
+					self._rows[term_id].append(row)
+					self._freqs[term_id].append(min(freq, 65535))
+				length = sum(counts.values())
+				self._keys.append((document_id, chunk_id))
+				self._lengths.append(length)
+				self._alive.append(1)
+				self._total_length += length
+			if tokenized:
+				self._doc_rows[document_id] = range(start, len(self._keys))
+
+	def remove(self, document_id: str) -> None:
+		with self._lock:
+			rows = self._doc_rows.pop(document_id, None)
+			if not rows:
+				return
+			for row in rows:
+				self._alive[row] = 0
+				self._total_length -= self._lengths[row]
+			self._dead += len(rows)
+			if self._dead > 1024 and self._dead > len(self._keys) // 3:
+				self._compact()
+
+	def _compact(self) -> None:
+		"""丢弃墓碑行并重新编号，倒排表中失效的记录与不再出现的词项一并清理。"""
+		alive = np.frombuffer(bytes(self._alive), dtype=np.uint8).astype(bool)
+		remap = np.cumsum(alive, dtype=np.int64) - 1
+		vocab: Dict[str, int] = {}
+		rows: List[array] = []
+		freqs: List[array] = []
+		for term, term_id in self._vocab.items():
+			old_rows = np.frombuffer(self._rows[term_id], dtype=np.int32)
+			keep = alive[old_rows]
+			if not keep.any():
+				continue
+			vocab[term] = len(rows)
+			rows.append(array("i", remap[old_rows[keep]].astype(np.int32).tobytes()))
+			freqs.append(array("H", np.frombuffer(self._freqs[term_id], dtype=np.uint16)[keep].tobytes()))
+		keep_rows = np.flatnonzero(alive)
+		self._vocab, self._rows, self._freqs = vocab, rows, freqs
+		self._keys = [self._keys[i] for i in keep_rows]
+		self._lengths = array("i", np.frombuffer(self._lengths, dtype=np.int32)[keep_rows].tobytes())
+		self._alive = bytearray(b"\x01" * len(self._keys))
+		self._dead = 0
+		self._doc_rows = {}
+		for row, (document_id, _) in enumerate(self._keys):
+			current = self._doc_rows.get(document_id)
+			self._doc_rows[document_id] = range(current.start if current else row, row + 1)
+
+	def search(self, query: str, k: int = 10, document_ids: Optional[List[str]] = None) -> List[Tuple[str, str, float]]:
+		"""返回 [(document_id, chunk_id, BM25 分数)]，按分数降序；没有任何词项命中时返回空列表。"""
+		terms = Counter(tokenize(query))
+		with self._lock:
+			n = len(self)
+			if n == 0 or k <= 0 or not terms:
+				return []
+			alive = np.frombuffer(self._alive, dtype=np.uint8)
+			lengths = np.frombuffer(self._lengths, dtype=np.int32)
+			avgdl = self._total_length / n if self._total_length else 1.0
+			allowed = None
+			if document_ids is not None:
+				allowed = np.zeros(len(self._keys), dtype=bool)
+				for document_id in document_ids:
+					rows = self._doc_rows.get(document_id)
+					if rows:
+						allowed[rows.start:rows.stop] = True
+			hit_rows: List[np.ndarray] = []
+			hit_scores: List[np.ndarray] = []
+			for term, query_freq in terms.items():
+				term_id = self._vocab.get(term)
+				if term_id is None:
+					continue
+				rows = np.frombuffer(self._rows[term_id], dtype=np.int32)
+				keep = alive[rows].astype(bool)
+				df = int(keep.sum())
+				if df == 0:
+					continue
+				if allowed is not None:
+					keep &= allowed[rows]
+				rows = rows[keep]
+				if len(rows) == 0:
+					continue
+				tf = np.frombuffer(self._freqs[term_id], dtype=np.uint16)[keep].astype(np.float32)
+				idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+				norm = self.k1 * (1 - self.b + self.b * lengths[rows] / avgdl)
+				hit_rows.append(rows)
+				hit_scores.append(query_freq * idf * tf * (self.k1 + 1) / (tf + norm))
+			if not hit_rows:
+				return []
+			# 只在命中的行上累加，耗时与命中的倒排记录数成正比，与索引总规模无关
+			candidates, inverse = np.unique(np.concatenate(hit_rows), return_inverse=True)
+			scores = np.bincount(inverse, weights=np.concatenate(hit_scores), minlength=len(candidates))
+			top = min(k, len(candidates))
+			best = np.argpartition(-scores, top - 1)[:top]
+			best = best[np.argsort(-scores[best], kind="stable")]
+			return [(*self._keys[candidates[i]], float(scores[i])) for i in best]
+
+	def stats(self) -> Dict[str, int]:
+		with self._lock:
+			postings = sum(len(r) for r in self._rows)
+			return {
+				"chunks": len(self),
+				"terms": len(self._vocab),
+				"postings": postings,
+				"postings_bytes": postings * 6,
+				"tombstones": self._dead,
+			}
+
+
+_indexes: Dict[str, BM25Index] = {}
+_indexes_lock = threading.Lock()
+
+
+def loaded_lexical_index(location: str) -> Optional[BM25Index]:
+	"""已加载的共享索引；尚未加载时返回 None，写入时无需承担构建成本（首次查询时全量构建）。"""
+	return _indexes.get(location)
+
+
+def discard_lexical_index(location: str) -> None:
+	"""丢弃已加载的索引，下次使用时从文档记录重新构建。"""
+	with _indexes_lock:
+		_indexes.pop(location, None)
+
+
+def shared_lexical_index(storage: "JSONStorage") -> BM25Index:
+	"""进程内按文档存储位置共享一个索引，首次使用时从全部文档记录构建。"""
+	location = storage.location
+	with _indexes_lock:
+		index = _indexes.get(location)
+		if index is None:
+			index = BM25Index()
+			for record in storage.list_documents():
+				index.add(record["document_id"], [(c["chunk_id"], c["content"]) for c in record.get("chunks", [])])
+			_indexes[location] = index
+		return index
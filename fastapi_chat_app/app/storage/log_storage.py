@@ -0,0 +1,394 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .file_lock import file_lock
+from .json_storage import ChunkWriter, JSONStorage
+
+
+class RecordLog:
+	"""
+	只追加的记录日志（JSONL）：每行是 {"op": "put", "key": ..., "record": {...}} 或 {"op": "del", "key": ...}。
+	打开时顺序回放建立 key -> (偏移, 长度) 的内存索引，写入只追加一行，成本与单条记录大小相关。
+	读取只回放完整的行；末尾不完整的行（写入时崩溃）只在持有文件锁时（打开、追加前）截断。其他进程追加的内容通过文件大小变化增量回放。
+	删除写墓碑，失效字节超过存活字节且超过 compact_min_bytes 时在后台线程压缩。
+	追加、整体替换与压缩的替换阶段都持有跨进程文件锁，多个 worker 共用同一日志时不会写入已被替换的旧文件。
+	"""
+
+	_RECORD_CACHE_SIZE = 256
+
+	def __init__(self, path: str, compact_min_bytes: int = 1024 * 1024, fsync: bool = False) -> None:
+		self._path = path
+		self._compact_min_bytes = compact_min_bytes
+		self._fsync = fsync
+		self._lock = threading.RLock()
+		self._file_lock = file_lock(path + ".lock")
+		self._index: Dict[str, Tuple[int, int]] = {}
+		self._end = 0
+		self._ino = 0
+		self._dead_bytes = 0
+		self._values: Optional[List[Dict[str, Any]]] = None
+		# 解析后的记录按 (key, 偏移) 缓存，返回的对象在读者之间共享，只读使用
+		self._records: "OrderedDict[Tuple[str, int], Dict[str, Any]]" = OrderedDict()
+		self._compacting: Optional[threading.Thread] = None
+		self.compactions = 0
+		if not os.path.exists(path):
+			open(path, "ab").close()
+		self._fd = os.open(path, os.O_RDWR | os.O_APPEND)
+		with self._lock, self._file_lock:
+			self._repair_tail()
+			self._reload()
+
+	@property
+	def path(self) -> str:
+		return self._path
+
+	def _reload(self) -> None:
+		self._index, self._end, self._dead_bytes = {}, 0, 0
+		self._records.clear()
+		self._values = None
+		self._ino = os.fstat(self._fd).st_ino
+		self._replay()
+
+	def _replay(self) -> None:
+		"""从 self._end 回放到最后一个完整行，无法解析的行跳过；不修改文件。"""
+		size = os.fstat(self._fd).st_size
+		if size <= self._end:
+			return
+		data = os.pread(self._fd, size - self._end, self._end)
+		offset = self._end
+		# 只回放完整的行：末尾未写完的行可能是其他进程正在追加，留到下次
+		for line in data[:data.rfind(b"\n") + 1].splitlines(keepends=True):
+			try:
+				entry = json.loads(line)
+				op, key = entry["op"], entry["key"]
+			except (ValueError, KeyError, TypeError):
+				# 完整但无法解析的行只跳过（计为失效字节，压缩时丢弃），之后的记录照常回放
+				print(f"[WARN] Skipped malformed record at offset {offset} in {self._path}")
+				self._dead_bytes += len(line)
+			else:
+				self._apply(op, key, offset, len(line))
+			offset += len(line)
+		self._end = offset
+		self._values = None
+
+	def _repair_tail(self) -> None:
+		"""
+		截掉末尾不完整的行（写入时崩溃留下的）。须持有文件锁：追加都在锁内完成，
+		此时不完整的行不可能属于正在写入的进程。
+		"""
+		size = os.fstat(self._fd).st_size
+		if size <= self._end:
+			return
+		start = max(self._end, size - 64 * 1024)
+		while True:
+			tail = os.pread(self._fd, size - start, start)
+			newline = tail.rfind(b"\n")
+			if newline >= 0 or start == 0:
+				break
+			start = max(start - 64 * 1024, 0)
+		end = start + newline + 1
+		if end < size:
+			os.ftruncate(self._fd, end)
+			print(f"[WARN] Truncated incomplete record at offset {end} in {self._path}")
+
+	def _apply(self, op: str, key: str, offset: int, length: int) -> None:
+		old = self._index.pop(key, None)
+		if old is not None:
+			self._dead_bytes += old[1]
+		if op == "put":
+			self._index[key] = (offset, length)
+		else:
+			self._dead_bytes += length
+
+	def _refresh(self) -> None:
+		"""对齐磁盘：文件被其他进程压缩替换时全量重载，被追加时只回放新增部分。"""
+		try:
+			st = os.stat(self._path)
+		except FileNotFoundError:
+			return
+		if st.st_ino != self._ino:
+			os.close(self._fd)
+			self._fd = os.open(self._path, os.O_RDWR | os.O_APPEND)
+			self._reload()
+		elif st.st_size > self._end:
+			self._replay()
+
+	def _append(self, entry: Dict[str, Any]) -> None:
+		line = (json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+		with self._lock, self._file_lock:
+			self._refresh()
+			# 打开之后有进程在写入中途崩溃时，先截掉残行，新记录不会与其拼成一行
+			self._repair_tail()
+			os.write(self._fd, line)
+			if self._fsync:
+				os.fsync(self._fd)
+			self._replay()
+		self._maybe_compact()
+
+	def _read(self, key: str, location: Tuple[int, int]) -> Dict[str, Any]:
+		cache_key = (key, location[0])
+		record = self._records.get(cache_key)
+		if record is not None:
+			self._records.move_to_end(cache_key)
+			return record
+		record = json.loads(os.pread(self._fd, location[1], location[0]))["record"]
+		self._records[cache_key] = record
+		while len(self._records) > self._RECORD_CACHE_SIZE:
+			self._records.popitem(last=False)
+		return record
+
+	def get(self, key: str) -> Optional[Dict[str, Any]]:
+		with self._lock:
+			self._refresh()
+			location = self._index.get(key)
+			return self._read(key, location) if location is not None else None
+
+	def put(self, key: str, record: Dict[str, Any]) -> None:
+		self._append({"op": "put", "key": key, "record": record})
+
+	def put_file(self, key: str, record_path: str) -> None:
+		"""
+		追加一条 put，记录内容为 record_path 中已序列化的单行 JSON；按块复制，不整体读入内存。
+		写入期间持有文件锁，其他进程只回放完整的行，看不到写了一半的记录。
+		"""
+		prefix = json.dumps({"op": "put", "key": key}, ensure_ascii=False, separators=(",", ":"))[:-1] + ',"record":'
+		with self._lock, self._file_lock:
+			self._refresh()
+			self._repair_tail()
+			offset = os.fstat(self._fd).st_size
+			os.write(self._fd, prefix.encode("utf-8"))
+			with open(record_path, "rb") as f:
+				for block in iter(lambda: f.read(1024 * 1024), b""):
+					os.write(self._fd, block)
+			os.write(self._fd, b"}\n")
+			if self._fsync:
+				os.fsync(self._fd)
+			# 锁内且已截掉残行，写入前文件已全部回放：直接登记新记录，不为更新索引把整条记录读回内存
+			end = os.fstat(self._fd).st_size
+			if self._end == offset:
+				self._apply("put", key, offset, end - offset)
+				self._end = end
+				self._values = None
+			else:
+				self._replay()
+		self._maybe_compact()
+
+	def delete(self, key: str) -> bool:
+		with self._lock:
+			self._refresh()
+			if key not in self._index:
+				return False
+		self._append({"op": "del", "key": key})
+		return True
+
+	def keys(self) -> List[str]:
+		with self._lock:
+			self._refresh()
+			return list(self._index)
+
+	def values(self) -> List[Dict[str, Any]]:
+		"""按写入顺序返回全部存活记录；内容未变化时返回同一个列表对象，调用方只读使用。"""
+		with self._lock:
+			self._refresh()
+			if self._values is None:
+				ordered = sorted(self._index.items(), key=lambda item: item[1][0])
+				self._values = [self._read(key, location) for key, location in ordered]
+			return self._values
+
+	def __iter__(self) -> Iterator[Dict[str, Any]]:
+		return iter(self.values())
+
+	def __len__(self) -> int:
+		with self._lock:
+			self._refresh()
+			return len(self._index)
+
+	def replace_all(self, records: List[Tuple[str, Dict[str, Any]]]) -> None:
+		"""整体替换内容（兼容整文件写入接口），写入新文件后原子替换。"""
+		tmp_path = f"{self._path}.{os.getpid()}.tmp"
+		with open(tmp_path, "wb") as f:
+			for key, record in records:
+				f.write((json.dumps({"op": "put", "key": key, "record": record}, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8"))
+		with self._lock, self._file_lock:
+			os.replace(tmp_path, self._path)
+			self._refresh()
+
+	def _maybe_compact(self) -> None:
+		with self._lock:
+			live_bytes = self._end - self._dead_bytes
+			if self._dead_bytes < self._compact_min_bytes or self._dead_bytes <= live_bytes:
+				return
+			if self._compacting is not None and self._compacting.is_alive():
+				return
+			self._compacting = threading.Thread(target=self.compact, name="record-log-compact", daemon=True)
+			self._compacting.start()
+
+	def compact(self) -> None:
+		"""
+		把存活记录复制到新文件后原子替换。复制期间不持锁，写入照常追加到旧文件；
+		替换前在锁内补上复制期间新增的部分。复制使用单独打开的描述符：self._fd 可能在此期间因其他进程压缩而被 _refresh 关闭重开。
+		"""
+		with self._lock:
+			self._refresh()
+			snapshot = sorted(self._index.items(), key=lambda item: item[1][0])
+			start_end, ino = self._end, self._ino
+			fd = os.open(self._path, os.O_RDONLY)
+		try:
+			if os.fstat(fd).st_ino == ino:
+				self._compact_from(fd, ino, snapshot, start_end)
+		finally:
+			os.close(fd)
+
+	def _compact_from(self, fd: int, ino: int, snapshot: List[Tuple[str, Tuple[int, int]]], start_end: int) -> None:
+		tmp_path = f"{self._path}.{os.getpid()}.compact"
+		moved: Dict[str, Tuple[int, int]] = {}
+		with open(tmp_path, "wb") as out:
+			for key, (offset, length) in snapshot:
+				moved[key] = (out.tell(), length)
+				out.write(os.pread(fd, length, offset))
+			with self._lock, self._file_lock:
+				self._refresh()
+				if self._ino != ino:
+					# 期间文件已被整体替换，放弃本次压缩
+					out.close()
+					os.remove(tmp_path)
+					return
+				tail = os.pread(fd, self._end - start_end, start_end) if self._end > start_end else b""
+				base = out.tell()
+				out.write(tail)
+				out.flush()
+				if self._fsync:
+					os.fsync(out.fileno())
+				os.replace(tmp_path, self._path)
+				old_index = self._index
+				new_fd = os.open(self._path, os.O_RDWR | os.O_APPEND)
+				os.close(self._fd)
+				self._fd = new_fd
+				self._ino = os.fstat(new_fd).st_ino
+				# 复制前的记录换算到新偏移，复制期间被覆盖或删除的记录在新文件中已是失效字节
+				self._index, self._dead_bytes = {}, 0
+				for key, location in snapshot:
+					if old_index.get(key) == location:
+						self._index[key] = moved[key]
+					else:
+						self._dead_bytes += location[1]
+				self._end = base
+				self._records.clear()
+				self._values = None
+				self._replay()
+				self.compactions += 1
+
+	def stats(self) -> Dict[str, Any]:
+		with self._lock:
+			return {
+				"records": len(self._index),
+				"file_bytes": self._end,
+				"dead_bytes": self._dead_bytes,
+				"compactions": self.compactions,
+			}
+
+	def close(self) -> None:
+		with self._lock:
+			os.close(self._fd)
+
+
+class _LogChunkWriter(ChunkWriter):
+	"""临时文件中直接是完整的文档记录（chunks 在前），提交时整条追加到日志。"""
+
+	def _tail(self, record: Dict[str, Any]) -> Dict[str, Any]:
+		return {**{k: v for k, v in record.items() if k != "chunks"}, "version": time.time_ns()}
+
+	def _publish(self, record: Dict[str, Any]) -> None:
+		self._storage._documents.put_file(record["document_id"], self._path)
+
+
+class LogStorage(JSONStorage):
+	"""
+	文档与用户保存在只追加日志中（documents.jsonl / users.jsonl），新增、更新、删除都只追加一行；
+	向量与任务记录仍使用 JSONStorage 的文件。首次启用时从 documents.json / users.json 导入。
+	"""
+
+	def __init__(self) -> None:
+		super().__init__()
+		cfg = self._cfg
+		documents_new = not os.path.exists(cfg.documents_log_path)
+		users_new = not os.path.exists(cfg.users_log_path)
+		self._documents = RecordLog(cfg.documents_log_path, cfg.log_compact_min_bytes, cfg.log_fsync)
+		self._users = RecordLog(cfg.users_log_path, cfg.log_compact_min_bytes, cfg.log_fsync)
+		self._usernames: Dict[str, str] = {}
+		self._usernames_source: Optional[List[Dict[str, Any]]] = None
+		if documents_new:
+			# 直接读取 json 后端的文档（本类的 list_documents 读的是日志）
+			self._documents.replace_all([(d["document_id"], d) for d in JSONStorage.list_documents(self)])
+		if users_new:
+			self._users.replace_all([(u["user_id"], u) for u in super().read_users().get("users", [])])
+
+	@property
+	def location(self) -> str:
+		return os.path.abspath(self._documents.path)
+
+	def cache_stats(self) -> Dict[str, Any]:
+		return {**super().cache_stats(), "logs": {"documents": self._documents.stats(), "users": self._users.stats()}}
+
+	# 兼容整文件接口
+	def read_documents(self) -> Dict[str, Any]:
+		return {"documents": self._documents.values()}
+
+	def write_documents(self, data: Dict[str, Any]) -> None:
+		self._documents.replace_all([(d["document_id"], d) for d in data.get("documents", [])])
+
+	def read_users(self) -> Dict[str, Any]:
+		return {"users": self._users.values()}
+
+	def write_users(self, data: Dict[str, Any]) -> None:
+		self._users.replace_all([(u["user_id"], u) for u in data.get("users", [])])
+
+	# 记录级接口
+	def list_documents(self, include_chunks: bool = True) -> List[Dict[str, Any]]:
+		return self._documents.values()
+
+	def get_document(self, document_id: str) -> Optional[Dict[str, Any]]:
+		return self._documents.get(document_id)
+
+	def recent_documents(self, limit: int) -> List[Dict[str, Any]]:
+		return sorted(self._documents.values(), key=lambda d: d.get("upload_time", ""), reverse=True)[:limit]
+
+	def document_versions(self) -> Dict[str, int]:
+		records = self._documents.values()
+		if records is not self._versions_source:
+			self._versions = {d["document_id"]: d.get("version", 0) for d in records}
+			self._versions_source = records
+		return self._versions
+
+	def put_document(self, record: Dict[str, Any]) -> None:
+		# 版本号取写入时的纳秒时间戳：每次写入都不同，且无需先读出旧记录
+		self._documents.put(record["document_id"], {**record, "version": time.time_ns()})
+
+	def open_chunk_writer(self, document_id: str) -> ChunkWriter:
+		path = f"{self._documents.path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.chunks"
+		return _LogChunkWriter(self, document_id, path)
+
+	def delete_document(self, document_id: str) -> None:
+		self._documents.delete(document_id)
+
+	def list_users(self) -> List[Dict[str, Any]]:
+		return self._users.values()
+
+	def get_user(self, user_id: str) -> Optional[Dict[str, Any]]:
+		return self._users.get(user_id)
+
+	def find_user(self, username: str) -> Optional[Dict[str, Any]]:
+		users = self._users.values()
+		if users is not self._usernames_source:
+			self._usernames = {u["username"].lower(): u["user_id"] for u in users}
+			self._usernames_source = users
+		user_id = self._usernames.get(username.strip().lower())
+		return self._users.get(user_id) if user_id else None
+
+	def put_user(self, user: Dict[str, Any]) -> None:
+		self._users.put(user["user_id"], user)
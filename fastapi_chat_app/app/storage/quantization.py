@@ -0,0 +1,144 @@
+import argparse
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+
+# 支持的向量存储精度：float32 不量化；float16 半精度；int8 为每行独立缩放的标量量化
+VECTOR_DTYPES = ("float32", "float16", "int8")
+
+_BLOCK_ROWS = 8192
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+	"""返回按行 L2 归一化后的 float32 矩阵，写入时做一次，检索时打分只需一次矩阵-向量乘法。"""
+	rows = np.asarray(matrix, dtype=np.float32)
+	if rows.size == 0:
+		return rows.reshape(len(rows), rows.shape[1] if rows.ndim == 2 else 0)
+	return rows / (np.linalg.norm(rows, axis=1, keepdims=True) + 1e-8)
+
+
+def normalize_vector(vector) -> np.ndarray:
+	v = np.asarray(vector, dtype=np.float32)
+	return v / (np.linalg.norm(v) + 1e-8)
+
+
+def quantize_rows(matrix: np.ndarray, dtype: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+	"""把（已归一化的）float32 行量化为 (数据, 每行缩放系数)；float16 不需要缩放系数。"""
+	rows = np.asarray(matrix, dtype=np.float32)
+	if dtype == "float16":
+		return rows.astype(np.float16), None
+	if dtype == "int8":
+		scales = np.abs(rows).max(axis=1) / 127.0 if len(rows) else np.empty(0, dtype=np.float32)
+		scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+		data = np.clip(np.rint(rows / scales[:, None]), -127, 127).astype(np.int8)
+		return data, scales
+	raise ValueError(f"不支持的向量精度：{dtype}")
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+	"""部分选择出分数最高的 k 个下标（降序），只对这 k 个排序。"""
+	k = min(k, len(scores))
+	if k <= 0:
+		return np.empty(0, dtype=np.int64)
+	if k < len(scores):
+		best = np.argpartition(-scores, k - 1)[:k]
+	else:
+		best = np.arange(len(scores))
+	return best[np.argsort(-scores[best], kind="stable")]
+
+
+class QuantizedMatrix:
+	"""只读的量化矩阵（可为 np.memmap），按块反量化打分，临时内存不超过 _BLOCK_ROWS 行。"""
+
+	def __init__(self, data: np.ndarray, scales: Optional[np.ndarray] = None) -> None:
+		self.data = data
+		self.scales = scales
+
+	def __len__(self) -> int:
+		return len(self.data)
+
+	@property
+	def dtype(self) -> str:
+		return str(self.data.dtype)
+
+	def scores(self, query_unit: np.ndarray) -> np.ndarray:
+		out = np.empty(len(self.data), dtype=np.float32)
+		for start in range(0, len(self.data), _BLOCK_ROWS):
+			block = np.asarray(self.data[start:start + _BLOCK_ROWS], dtype=np.float32)
+			out[start:start + len(block)] = block @ query_unit
+		if self.scales is not None:
+			out *= self.scales
+		return out
+
+
+def search_rows(query_unit: np.ndarray, full: np.ndarray, k: int, quantized: Optional[QuantizedMatrix] = None, rescore_factor: int = 4) -> Tuple[np.ndarray, np.ndarray]:
+	"""
+	在归一化矩阵中检索 top-k，返回 (行下标, 相似度)。
+	提供量化矩阵时先用它粗排出 k * rescore_factor 个候选，再用 full 中的 float32 行精确重排；
+	rescore_factor <= 1 时不重排，直接返回量化分数。
+	"""
+	if len(full) == 0 or k <= 0:
+		return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+	if quantized is None:
+		scores = np.asarray(full, dtype=np.float32) @ query_unit
+		best = top_k_indices(scores, k)
+		return best, scores[best]
+	approx = quantized.scores(query_unit)
+	if rescore_factor <= 1:
+		best = top_k_indices(approx, k)
+		return best, approx[best]
+	candidates = np.sort(top_k_indices(approx, k * rescore_factor))
+	exact = np.asarray(full[candidates], dtype=np.float32) @ query_unit
+	best = top_k_indices(exact, k)
+	return candidates[best], exact[best]
+
+
+def measure_recall(full: np.ndarray, dtype: str, queries: np.ndarray, k: int = 5, rescore_factor: int = 4) -> dict:
+	"""以 float32 精确检索为基准，统计量化检索（重排前后）的 recall@k。"""
+	full = normalize_rows(full)
+	data, scales = quantize_rows(full, dtype)
+	quantized = QuantizedMatrix(data, scales)
+	hits_raw = hits_rescored = total = 0
+	for q in queries:
+		q = normalize_vector(q)
+		truth = set(search_rows(q, full, k)[0].tolist())
+		hits_raw += len(truth & set(search_rows(q, full, k, quantized, rescore_factor=1)[0].tolist()))
+		hits_rescored += len(truth & set(search_rows(q, full, k, quantized, rescore_factor)[0].tolist()))
+		total += len(truth)
+	return {
+		"dtype": dtype,
+		"k": k,
+		"rescore_factor": rescore_factor,
+		"queries": len(queries),
+		"recall": hits_raw / total if total else 1.0,
+		"recall_rescored": hits_rescored / total if total else 1.0,
+		"bytes_per_vector": int(data[0].nbytes + (4 if scales is not None else 0)) if len(data) else 0,
+	}
+
+
+def _stored_matrix() -> np.ndarray:
+	from .vector_storage import create_vector_storage
+
+	blocks: List[np.ndarray] = [np.asarray(m, dtype=np.float32) for _, _, m in create_vector_storage().iter_document_matrices() if len(m)]
+	return np.concatenate(blocks) if blocks else np.empty((0, 0), dtype=np.float32)
+
+
+if __name__ == "__main__":
+	# 用法：python -m app.storage.quantization --k 5 --queries 200
+	# 以已存储的向量（加噪声）为查询，比较 float16/int8 相对 float32 的召回率
+	parser = argparse.ArgumentParser(description="测量量化向量存储的召回率")
+	parser.add_argument("--k", type=int, default=5)
+	parser.add_argument("--queries", type=int, default=200)
+	parser.add_argument("--rescore-factor", type=int, default=4)
+	parser.add_argument("--noise", type=float, default=0.05)
+	args = parser.parse_args()
+	matrix = _stored_matrix()
+	if len(matrix) == 0:
+		print("[WARN] 没有已存储的向量")
+	else:
+		rng = np.random.default_rng(0)
+		picks = matrix[rng.choice(len(matrix), size=min(args.queries, len(matrix)), replace=False)]
+		queries = normalize_rows(picks) + rng.normal(0, args.noise / np.sqrt(matrix.shape[1]), picks.shape).astype(np.float32)
+		for dtype in ("float16", "int8"):
+			print(measure_recall(matrix, dtype, queries, k=args.k, rescore_factor=args.rescore_factor))
@@ -0,0 +1,87 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+# (st_ino, st_mtime_ns, st_size)：原子替换写入会生成新 inode，其他进程的改动也会改变 mtime/size
+FileSignature = Tuple[int, int, int]
+
+
+class SnapshotCache:
+	"""
+	进程内 JSON 快照缓存（LRU）。以文件签名校验有效性，按文件字节数计入内存上限。
+	缓存的对象在多个读者之间共享，调用方不得原地修改嵌套结构。
+	"""
+
+	def __init__(self, max_bytes: int) -> None:
+		self._max_bytes = max_bytes
+		self._entries: "OrderedDict[str, Tuple[FileSignature, Any, int]]" = OrderedDict()
+		self._bytes = 0
+		self._lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+		self.invalidations = 0
+		self.evictions = 0
+
+	def get(self, path: str, signature: FileSignature) -> Optional[Any]:
+		with self._lock:
+			entry = self._entries.get(path)
+			if entry is None:
+				self.misses += 1
+				return None
+			if entry[0] != signature:
+				self._drop(path)
+				self.invalidations += 1
+				self.misses += 1
+				return None
+			self._entries.move_to_end(path)
+			self.hits += 1
+			return entry[1]
+
+	def put(self, path: str, signature: FileSignature, data: Any, size: int) -> None:
+		with self._lock:
+			self._drop(path)
+			if size > self._max_bytes:
+				return
+			self._entries[path] = (signature, data, size)
+			self._bytes += size
+			while self._bytes > self._max_bytes and self._entries:
+				oldest = next(iter(self._entries))
+				self._drop(oldest)
+				self.evictions += 1
+
+	def invalidate(self, path: str) -> None:
+		with self._lock:
+			self._drop(path)
+
+	def _drop(self, path: str) -> None:
+		entry = self._entries.pop(path, None)
+		if entry is not None:
+			self._bytes -= entry[2]
+
+	def stats(self) -> Dict[str, Any]:
+		with self._lock:
+			total = self.hits + self.misses
+			return {
+				"hits": self.hits,
+				"misses": self.misses,
+				"hit_rate": self.hits / total if total else 0.0,
+				"invalidations": self.invalidations,
+				"evictions": self.evictions,
+				"entries": len(self._entries),
+				"bytes": self._bytes,
+				"max_bytes": self._max_bytes,
+			}
+
+
+_shared_cache: Optional[SnapshotCache] = None
+_shared_lock = threading.Lock()
+
+
+def shared_snapshot_cache(max_bytes: int) -> SnapshotCache:
+	"""同一进程内的所有 JSONStorage 共用一个缓存，避免同一文件被重复缓存。"""
+	global _shared_cache
+	with _shared_lock:
+		if _shared_cache is None:
+			_shared_cache = SnapshotCache(max_bytes)
+		return _shared_cache
@@ -0,0 +1,438 @@
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .json_storage import ChunkWriter, JSONStorage
+from .quantization import normalize_rows
+from .vector_storage import VectorStorage
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+	document_id TEXT PRIMARY KEY,
+	filename TEXT NOT NULL,
+	upload_time TEXT NOT NULL,
+	metadata TEXT NOT NULL DEFAULT '{}',
+	-- 每次写入加一，供回答缓存判断文档是否变化
+	version INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_documents_upload_time ON documents(upload_time);
+CREATE TABLE IF NOT EXISTS chunks (
+	chunk_id TEXT PRIMARY KEY,
+	document_id TEXT NOT NULL REFERENCES documents(document_id) ON DELETE CASCADE,
+	chunk_index INTEGER NOT NULL,
+	content TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_chunks_document ON chunks(document_id, chunk_index);
+CREATE TABLE IF NOT EXISTS staged_chunks (
+	writer_id TEXT NOT NULL,
+	chunk_id TEXT NOT NULL,
+	chunk_index INTEGER NOT NULL,
+	content TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_staged_chunks_writer ON staged_chunks(writer_id);
+CREATE TABLE IF NOT EXISTS vectors (
+	document_id TEXT NOT NULL,
+	position INTEGER NOT NULL,
+	chunk_id TEXT NOT NULL,
+	dimension INTEGER NOT NULL,
+	vector BLOB NOT NULL,
+	PRIMARY KEY (document_id, position)
+);
+CREATE TABLE IF NOT EXISTS users (
+	user_id TEXT PRIMARY KEY,
+	username TEXT NOT NULL,
+	-- 按 Python str.lower() 归一化的用户名，与 json/log 后端的不区分大小写规则一致（NOCASE 只折叠 ASCII）
+	username_lower TEXT NOT NULL,
+	password_hash TEXT NOT NULL,
+	salt TEXT NOT NULL,
+	created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tokens (
+	token TEXT PRIMARY KEY,
+	user_id TEXT NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+	created_at INTEGER NOT NULL,
+	expires_at INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_tokens_user ON tokens(user_id);
+"""
+
+
+class SQLiteDatabase:
+	"""
+	进程内共享的 SQLite 连接（WAL 模式）。语句均为固定 SQL，由 sqlite3 的语句缓存复用预编译结果。
+	data_version() 在其他连接（包括其他进程）提交后变化，用于判断内存中的派生数据是否过期。
+	"""
+
+	def __init__(self, path: str) -> None:
+		self.path = path
+		self.lock = threading.RLock()
+		self.conn = sqlite3.connect(path, check_same_thread=False, cached_statements=256)
+		self.conn.execute("PRAGMA journal_mode=WAL")
+		self.conn.execute("PRAGMA synchronous=NORMAL")
+		self.conn.execute("PRAGMA foreign_keys=ON")
+		self.conn.executescript(_SCHEMA)
+		self._upgrade()
+		self.conn.commit()
+		self._local_writes = 0
+
+	def _upgrade(self) -> None:
+		"""旧版数据库补上新增的列：documents.version，以及 users.username_lower（按 Python 规则回填）。"""
+		if "version" not in {row[1] for row in self.conn.execute("PRAGMA table_info(documents)")}:
+			self.conn.execute("ALTER TABLE documents ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+		columns = {row[1] for row in self.conn.execute("PRAGMA table_info(users)")}
+		if "username_lower" not in columns:
+			self.conn.execute("ALTER TABLE users ADD COLUMN username_lower TEXT NOT NULL DEFAULT ''")
+			rows = self.conn.execute("SELECT user_id, username FROM users").fetchall()
+			self.conn.executemany("UPDATE users SET username_lower = ? WHERE user_id = ?", ((username.lower(), user_id) for user_id, username in rows))
+		# 不设唯一约束：与其他后端一样由注册时在 users 锁内查重保证
+		self.conn.execute("CREATE INDEX IF NOT EXISTS idx_users_username_lower ON users(username_lower)")
+
+	def data_version(self) -> Tuple[int, int]:
+		with self.lock:
+			return self.conn.execute("PRAGMA data_version").fetchone()[0], self._local_writes
+
+	def write(self) -> "_WriteTransaction":
+		return _WriteTransaction(self)
+
+	def close(self) -> None:
+		with self.lock:
+			self.conn.close()
+
+
+class _WriteTransaction:
+	def __init__(self, db: SQLiteDatabase) -> None:
+		self._db = db
+
+	def __enter__(self) -> sqlite3.Connection:
+		self._db.lock.acquire()
+		return self._db.conn
+
+	def __exit__(self, exc_type, exc, tb) -> None:
+		try:
+			if exc_type is None:
+				self._db.conn.commit()
+				self._db._local_writes += 1
+			else:
+				self._db.conn.rollback()
+		finally:
+			self._db.lock.release()
+
+
+_databases: Dict[str, SQLiteDatabase] = {}
+_databases_lock = threading.Lock()
+
+
+def shared_database(path: str) -> SQLiteDatabase:
+	path = os.path.abspath(path)
+	with _databases_lock:
+		db = _databases.get(path)
+		if db is None:
+			db = _databases[path] = SQLiteDatabase(path)
+		return db
+
+
+class _SQLiteChunkWriter(ChunkWriter):
+	"""分块按窗口写入 staged_chunks，提交时在一个事务内写入文档行并移入 chunks 表。"""
+
+	def __init__(self, storage: "SQLiteStorage", document_id: str) -> None:
+		self._storage = storage
+		self._document_id = document_id
+		self._writer_id = uuid.uuid4().hex
+		self.count = 0
+
+	def append(self, chunks: List[Dict[str, Any]]) -> None:
+		with self._storage.database.write() as conn:
+			conn.executemany(
+				"INSERT INTO staged_chunks (writer_id, chunk_id, chunk_index, content) VALUES (?, ?, ?, ?)",
+				((self._writer_id, c["chunk_id"], c["chunk_index"], c["content"]) for c in chunks),
+			)
+		self.count += len(chunks)
+
+	def commit(self, record: Dict[str, Any]) -> None:
+		with self._storage.database.write() as conn:
+			SQLiteStorage._insert_document(conn, {**record, "chunks": []})
+			conn.execute(
+				"INSERT INTO chunks (chunk_id, document_id, chunk_index, content) SELECT chunk_id, ?, chunk_index, content FROM staged_chunks WHERE writer_id = ?",
+				(self._document_id, self._writer_id),
+			)
+			conn.execute("DELETE FROM staged_chunks WHERE writer_id = ?", (self._writer_id,))
+
+	def abort(self) -> None:
+		with self._storage.database.write() as conn:
+			conn.execute("DELETE FROM staged_chunks WHERE writer_id = ?", (self._writer_id,))
+
+
+class SQLiteStorage(JSONStorage):
+	"""
+	文档、分块、用户与令牌保存在 SQLite 的带索引表中：按 id / 用户名查找走索引，写入只涉及相关的行。
+	任务记录仍使用 jobs.json。首次创建数据库时从 JSON 文件导入。
+	"""
+
+	def __init__(self) -> None:
+		super().__init__()
+		is_new = not os.path.exists(self._cfg.sqlite_path)
+		self._db = shared_database(self._cfg.sqlite_path)
+		self._users_cache: Optional[Tuple[Tuple[int, int], List[Dict[str, Any]]]] = None
+		self._versions_cache: Optional[Tuple[Tuple[int, int], Dict[str, int]]] = None
+		if is_new:
+			# 首次启用时导入 JSON 文件；向量只在 VECTOR_BACKEND=sqlite 时一并导入
+			migrate_json_to_sqlite(JSONStorage(), self, include_vectors=self._cfg.vector_backend == "sqlite")
+
+	@property
+	def database(self) -> SQLiteDatabase:
+		return self._db
+
+	@property
+	def location(self) -> str:
+		return self._db.path
+
+	# 兼容整文件接口
+	def read_documents(self) -> Dict[str, Any]:
+		return {"documents": self.list_documents()}
+
+	def write_documents(self, data: Dict[str, Any]) -> None:
+		with self._db.write() as conn:
+			conn.execute("DELETE FROM documents")
+			for record in data.get("documents", []):
+				self._insert_document(conn, record)
+
+	def read_users(self) -> Dict[str, Any]:
+		return {"users": self.list_users()}
+
+	def write_users(self, data: Dict[str, Any]) -> None:
+		with self._db.write() as conn:
+			conn.execute("DELETE FROM users")
+			for user in data.get("users", []):
+				self._insert_user(conn, user)
+
+	# 文档
+	@staticmethod
+	def _insert_document(conn: sqlite3.Connection, record: Dict[str, Any]) -> None:
+		previous = conn.execute("SELECT version FROM documents WHERE document_id = ?", (record["document_id"],)).fetchone()
+		conn.execute("DELETE FROM documents WHERE document_id = ?", (record["document_id"],))
+		conn.execute(
+			"INSERT INTO documents (document_id, filename, upload_time, metadata, version) VALUES (?, ?, ?, ?, ?)",
+			(record["document_id"], record["filename"], record["upload_time"], json.dumps(record.get("metadata", {}), ensure_ascii=False), (previous[0] if previous else 0) + 1),
+		)
+		conn.executemany(
+			"INSERT INTO chunks (chunk_id, document_id, chunk_index, content) VALUES (?, ?, ?, ?)",
+			((c["chunk_id"], record["document_id"], c["chunk_index"], c["content"]) for c in record.get("chunks", [])),
+		)
+
+	def _load_chunks(self, document_id: str) -> List[Dict[str, Any]]:
+		rows = self._db.conn.execute(
+			"SELECT chunk_id, content, chunk_index FROM chunks WHERE document_id = ? ORDER BY chunk_index", (document_id,)
+		).fetchall()
+		return [{"chunk_id": r[0], "content": r[1], "chunk_index": r[2]} for r in rows]
+
+	@staticmethod
+	def _document_row(row: Tuple[Any, ...]) -> Dict[str, Any]:
+		return {"document_id": row[0], "filename": row[1], "upload_time": row[2], "metadata": json.loads(row[3])}
+
+	def list_documents(self, include_chunks: bool = True) -> List[Dict[str, Any]]:
+		with self._db.lock:
+			rows = self._db.conn.execute("SELECT document_id, filename, upload_time, metadata FROM documents ORDER BY upload_time").fetchall()
+			docs = [self._document_row(row) for row in rows]
+			if include_chunks:
+				for doc in docs:
+					doc["chunks"] = self._load_chunks(doc["document_id"])
+		return docs
+
+	def get_document(self, document_id: str) -> Optional[Dict[str, Any]]:
+		with self._db.lock:
+			row = self._db.conn.execute(
+				"SELECT document_id, filename, upload_time, metadata FROM documents WHERE document_id = ?", (document_id,)
+			).fetchone()
+			if row is None:
+				return None
+			doc = self._document_row(row)
+			doc["chunks"] = self._load_chunks(document_id)
+		return doc
+
+	def recent_documents(self, limit: int) -> List[Dict[str, Any]]:
+		with self._db.lock:
+			rows = self._db.conn.execute(
+				"SELECT document_id, filename, upload_time, metadata FROM documents ORDER BY upload_time DESC LIMIT ?", (limit,)
+			).fetchall()
+		return [self._document_row(row) for row in rows]
+
+	def document_versions(self) -> Dict[str, int]:
+		version = self._db.data_version()
+		cached = self._versions_cache
+		if cached is not None and cached[0] == version:
+			return cached[1]
+		with self._db.lock:
+			versions = dict(self._db.conn.execute("SELECT document_id, version FROM documents").fetchall())
+		self._versions_cache = (version, versions)
+		return versions
+
+	def put_document(self, record: Dict[str, Any]) -> None:
+		with self._db.write() as conn:
+			self._insert_document(conn, record)
+
+	def open_chunk_writer(self, document_id: str) -> ChunkWriter:
+		return _SQLiteChunkWriter(self, document_id)
+
+	def delete_document(self, document_id: str) -> None:
+		with self._db.write() as conn:
+			conn.execute("DELETE FROM documents WHERE document_id = ?", (document_id,))
+
+	# 用户与旧版令牌
+	@staticmethod
+	def _insert_user(conn: sqlite3.Connection, user: Dict[str, Any]) -> None:
+		conn.execute(
+			"INSERT INTO users (user_id, username, username_lower, password_hash, salt, created_at) VALUES (?, ?, ?, ?, ?, ?) "
+			"ON CONFLICT(user_id) DO UPDATE SET username = excluded.username, username_lower = excluded.username_lower, password_hash = excluded.password_hash, salt = excluded.salt",
+			(user["user_id"], user["username"], user["username"].lower(), user["password_hash"], user["salt"], user["created_at"]),
+		)
+		conn.execute("DELETE FROM tokens WHERE user_id = ?", (user["user_id"],))
+		conn.executemany(
+			"INSERT OR REPLACE INTO tokens (token, user_id, created_at, expires_at) VALUES (?, ?, ?, ?)",
+			((t["token"], user["user_id"], int(t.get("created_at", 0)), t.get("expires_at")) for t in user.get("tokens", [])),
+		)
+
+	def _user_from_row(self, row: Tuple[Any, ...]) -> Dict[str, Any]:
+		tokens = []
+		for token, created_at, expires_at in self._db.conn.execute("SELECT token, created_at, expires_at FROM tokens WHERE user_id = ? ORDER BY created_at", (row[0],)):
+			entry = {"token": token, "created_at": created_at}
+			if expires_at is not None:
+				entry["expires_at"] = expires_at
+			tokens.append(entry)
+		return {"user_id": row[0], "username": row[1], "password_hash": row[2], "salt": row[3], "tokens": tokens, "created_at": row[4]}
+
+	def list_users(self) -> List[Dict[str, Any]]:
+		# 数据库未变化时返回同一个列表对象，AuthService 据此跳过令牌索引重建
+		version = self._db.data_version()
+		cached = self._users_cache
+		if cached is not None and cached[0] == version:
+			return cached[1]
+		with self._db.lock:
+			rows = self._db.conn.execute("SELECT user_id, username, password_hash, salt, created_at FROM users ORDER BY created_at").fetchall()
+			users = [self._user_from_row(row) for row in rows]
+		self._users_cache = (version, users)
+		return users
+
+	def get_user(self, user_id: str) -> Optional[Dict[str, Any]]:
+		with self._db.lock:
+			row = self._db.conn.execute("SELECT user_id, username, password_hash, salt, created_at FROM users WHERE user_id = ?", (user_id,)).fetchone()
+			return self._user_from_row(row) if row else None
+
+	def find_user(self, username: str) -> Optional[Dict[str, Any]]:
+		"""按用户名查找（不区分大小写，与其他后端同样按 str.lower() 比较）。"""
+		with self._db.lock:
+			row = self._db.conn.execute(
+				"SELECT user_id, username, password_hash, salt, created_at FROM users WHERE username_lower = ? ORDER BY created_at LIMIT 1", (username.strip().lower(),)
+			).fetchone()
+			return self._user_from_row(row) if row else None
+
+	def put_user(self, user: Dict[str, Any]) -> None:
+		with self._db.write() as conn:
+			self._insert_user(conn, user)
+
+
+class SQLiteVectorStorage(VectorStorage):
+	"""向量按行保存为 float32 BLOB（写入时已归一化），按 (document_id, position) 主键顺序读取。"""
+
+	def __init__(self, json_storage: JSONStorage | None = None) -> None:
+		super().__init__(json_storage)
+		self._db = shared_database(self._js._cfg.sqlite_path)
+
+	@property
+	def location(self) -> str:
+		return self._db.path + "#vectors"
+
+	def upsert_document_vectors(self, document_id: str, chunk_ids: List[str], vectors: List[List[float]], dimension: int) -> None:
+		matrix = normalize_rows(vectors).reshape(len(chunk_ids), dimension)
+		with self._db.write() as conn:
+			conn.execute("DELETE FROM vectors WHERE document_id = ?", (document_id,))
+			conn.executemany(
+				"INSERT INTO vectors (document_id, position, chunk_id, dimension, vector) VALUES (?, ?, ?, ?, ?)",
+				((document_id, pos, cid, dimension, row.tobytes()) for pos, (cid, row) in enumerate(zip(chunk_ids, matrix))),
+			)
+		self._publish_upsert(document_id, list(chunk_ids), matrix)
+
+	def _matrix(self, rows: List[Tuple[str, int, bytes]]) -> Tuple[List[str], np.ndarray]:
+		if not rows:
+			return [], np.empty((0, 0), dtype=np.float32)
+		dim = rows[0][1]
+		matrix = np.frombuffer(b"".join(r[2] for r in rows), dtype=np.float32).reshape(len(rows), dim)
+		return [r[0] for r in rows], matrix
+
+	def get_document_matrix(self, document_id: str) -> Optional[Tuple[List[str], np.ndarray]]:
+		with self._db.lock:
+			rows = self._db.conn.execute(
+				"SELECT chunk_id, dimension, vector FROM vectors WHERE document_id = ? ORDER BY position", (document_id,)
+			).fetchall()
+		if not rows:
+			return None
+		return self._matrix(rows)
+
+	def get_document_vectors(self, document_id: str) -> Dict[str, Any] | None:
+		found = self.get_document_matrix(document_id)
+		if found is None:
+			return None
+		chunk_ids, matrix = found
+		dim = int(matrix.shape[1])
+		return {
+			"document_id": document_id,
+			"chunk_vectors": [{"chunk_id": cid, "vector": row.tolist(), "dimension": dim} for cid, row in zip(chunk_ids, matrix)],
+		}
+
+	def list_document_ids(self) -> List[str]:
+		with self._db.lock:
+			return [r[0] for r in self._db.conn.execute("SELECT DISTINCT document_id FROM vectors")]
+
+	def iter_document_matrices(self) -> Iterator[Tuple[str, List[str], np.ndarray]]:
+		for document_id in self.list_document_ids():
+			found = self.get_document_matrix(document_id)
+			if found is not None:
+				yield document_id, found[0], found[1]
+
+	def delete_document_vectors(self, document_id: str) -> None:
+		with self._db.write() as conn:
+			conn.execute("DELETE FROM vectors WHERE document_id = ?", (document_id,))
+		self._publish_delete(document_id)
+
+
+def _default_vector_source(source: JSONStorage) -> VectorStorage:
+	# 已有二进制向量目录时以它为准，否则读取旧版 vectors.json
+	if os.path.isdir(source._cfg.vectors_dir):
+		from .binary_vector_storage import BinaryVectorStorage
+		return BinaryVectorStorage(source)
+	return VectorStorage(source)
+
+
+def migrate_json_to_sqlite(source: JSONStorage, target: SQLiteStorage, vectors: Optional[VectorStorage] = None, include_vectors: bool = True) -> Dict[str, int]:
+	"""
+	把 JSON 文件中的文档、用户，以及 vectors（默认为 data/vectors/ 或 vectors.json）中的向量导入 SQLite。
+	已存在的同 id 记录会被覆盖，源文件保持不变。返回各类记录的导入数量。
+	"""
+	documents = source.read_documents().get("documents", [])
+	users = source.read_users().get("users", [])
+	with target.database.write() as conn:
+		for record in documents:
+			SQLiteStorage._insert_document(conn, record)
+		for user in users:
+			SQLiteStorage._insert_user(conn, user)
+	migrated_vectors = 0
+	if include_vectors:
+		vector_source = vectors or _default_vector_source(source)
+		vector_target = SQLiteVectorStorage(target)
+		for document_id, chunk_ids, matrix in vector_source.iter_document_matrices():
+			if len(chunk_ids):
+				vector_target.upsert_document_vectors(document_id, list(chunk_ids), matrix, int(matrix.shape[1]))
+				migrated_vectors += 1
+	return {"documents": len(documents), "users": len(users), "vector_documents": migrated_vectors}
+
+
+if __name__ == "__main__":
+	# 用法：python -m app.storage.sqlite_storage  （从 documents.json / users.json 以及现有向量存储重新导入）
+	target = SQLiteStorage()
+	counts = migrate_json_to_sqlite(JSONStorage(), target)
+	print(f"[INFO] Migrated {counts} into {target._cfg.sqlite_path}")
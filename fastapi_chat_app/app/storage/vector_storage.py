@@ -1,23 +1,70 @@
-from typing import Dict, Any, List
+import os
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+import numpy as np
+from .ann_index import loaded_index
 from .json_storage import JSONStorage
+from .quantization import QuantizedMatrix, normalize_rows
+
+
+class VectorWriter:
+	"""按窗口追加单个文档的向量，commit() 之后才对读者可见。"""
+
+	def __init__(self, storage: "VectorStorage", document_id: str) -> None:
+		self._storage = storage
+		self._document_id = document_id
+		self._chunk_ids: List[str] = []
+		self._vectors: List[List[float]] = []
+
+	def append(self, chunk_ids: List[str], vectors: List[List[float]]) -> None:
+		self._chunk_ids.extend(chunk_ids)
+		self._vectors.extend(vectors)
+
+	def commit(self, dimension: int = 0) -> None:
+		dim = len(self._vectors[0]) if self._vectors else dimension
+		self._storage.upsert_document_vectors(self._document_id, self._chunk_ids, self._vectors, dim)
+
+	def abort(self) -> None:
+		self._chunk_ids, self._vectors = [], []
 
 
 class VectorStorage:
 	def __init__(self, json_storage: JSONStorage | None = None) -> None:
 		self._js = json_storage or JSONStorage()
 
+	@property
+	def location(self) -> str:
+		"""存储位置，用于在进程内共享同一份全局索引。"""
+		return os.path.abspath(self._js._cfg.vectors_path)
+
+	def open_writer(self, document_id: str) -> VectorWriter:
+		return VectorWriter(self, document_id)
+
+	def _publish_upsert(self, document_id: str, chunk_ids: List[str], matrix: np.ndarray) -> None:
+		index = loaded_index(self.location)
+		if index is not None:
+			index.add(document_id, chunk_ids, matrix)
+
+	def _publish_delete(self, document_id: str) -> None:
+		index = loaded_index(self.location)
+		if index is not None:
+			index.remove(document_id)
+
 	def upsert_document_vectors(self, document_id: str, chunk_ids: List[str], vectors: List[List[float]], dimension: int) -> None:
-		data = self._js.read_vectors()
-		data["vectors"] = [v for v in data.get("vectors", []) if v.get("document_id") != document_id]
-		data["vectors"].append(
-			{
-				"document_id": document_id,
-				"chunk_vectors": [
-					{"chunk_id": cid, "vector": vec, "dimension": dimension} for cid, vec in zip(chunk_ids, vectors)
-				],
-			}
-		)
-		self._js.write_vectors(data)
+		matrix = normalize_rows(vectors).reshape(len(chunk_ids), dimension)
+		vectors = matrix.tolist()
+		with self._js.lock("vectors"):
+			data = self._js.read_vectors()
+			data["vectors"] = [v for v in data.get("vectors", []) if v.get("document_id") != document_id]
+			data["vectors"].append(
+				{
+					"document_id": document_id,
+					"chunk_vectors": [
+						{"chunk_id": cid, "vector": vec, "dimension": dimension} for cid, vec in zip(chunk_ids, vectors)
+					],
+				}
+			)
+			self._js.write_vectors(data)
+		self._publish_upsert(document_id, list(chunk_ids), matrix)
 
 	def get_document_vectors(self, document_id: str) -> Dict[str, Any] | None:
 		data = self._js.read_vectors()
@@ -26,9 +73,42 @@ class VectorStorage:
 				return item
 		return None
 
+	def get_document_matrix(self, document_id: str) -> Optional[Tuple[List[str], np.ndarray]]:
+		"""返回 (chunk_ids, 按行归一化的 float32 矩阵)，检索时与归一化后的查询向量相乘即为余弦相似度。"""
+		item = self.get_document_vectors(document_id)
+		if not item:
+			return None
+		chunk_vectors = item.get("chunk_vectors", [])
+		chunk_ids = [x["chunk_id"] for x in chunk_vectors]
+		# 旧版 vectors.json 中的向量未归一化，读取时统一处理
+		matrix = normalize_rows([x["vector"] for x in chunk_vectors])
+		return chunk_ids, matrix
+
+	def get_quantized_matrix(self, document_id: str) -> Optional[QuantizedMatrix]:
+		"""量化后的检索矩阵，行顺序与 get_document_matrix 一致；未启用量化时返回 None。"""
+		return None
+
+	def iter_document_matrices(self) -> Iterator[Tuple[str, List[str], np.ndarray]]:
+		"""遍历全部文档的 (document_id, chunk_ids, 矩阵)，用于构建全局索引。"""
+		for item in self._js.read_vectors().get("vectors", []):
+			chunk_vectors = item.get("chunk_vectors", [])
+			yield item["document_id"], [x["chunk_id"] for x in chunk_vectors], normalize_rows([x["vector"] for x in chunk_vectors])
+
 	def delete_document_vectors(self, document_id: str) -> None:
-		data = self._js.read_vectors()
-		data["vectors"] = [v for v in data.get("vectors", []) if v.get("document_id") != document_id]
-		self._js.write_vectors(data)
+		with self._js.lock("vectors"):
+			data = self._js.read_vectors()
+			data["vectors"] = [v for v in data.get("vectors", []) if v.get("document_id") != document_id]
+			self._js.write_vectors(data)
+		self._publish_delete(document_id)
 
 
+def create_vector_storage(json_storage: JSONStorage | None = None) -> VectorStorage:
+	"""按配置 VECTOR_BACKEND 选择向量存储实现。"""
+	js = json_storage or JSONStorage()
+	if js._cfg.vector_backend == "json":
+		return VectorStorage(js)
+	if js._cfg.vector_backend == "sqlite":
+		from .sqlite_storage import SQLiteVectorStorage
+		return SQLiteVectorStorage(js)
+	from .binary_vector_storage import BinaryVectorStorage
+	return BinaryVectorStorage(js)
@@ -0,0 +1,210 @@
+import bisect
+import math
+import threading
+from typing import Dict, List, Sequence, Tuple
+
+
+# 默认的耗时分桶（秒），覆盖从缓存命中到 LLM 完整回答的量级
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_value(value: float) -> str:
+	if value == math.inf:
+		return "+Inf"
+	if float(value).is_integer():
+		return str(int(value))
+	return repr(float(value))
+
+
+def _escape(value: str) -> str:
+	return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+	pairs = ['%s="%s"' % (n, _escape(str(v))) for n, v in zip(names, values)]
+	if extra:
+		pairs.append(extra)
+	return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+	kind = ""
+
+	def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+		self.name = name
+		self.documentation = documentation
+		self.labelnames = tuple(labelnames)
+		self._lock = threading.Lock()
+		self._children: Dict[Tuple[str, ...], "_Metric"] = {}
+
+	def labels(self, *values: str, **kwargs: str):
+		"""返回对应标签值的子指标；热路径上可以提前取好子指标再反复使用。"""
+		key = tuple(str(v) for v in values) if values else tuple(str(kwargs[n]) for n in self.labelnames)
+		child = self._children.get(key)
+		if child is None:
+			with self._lock:
+				child = self._children.get(key)
+				if child is None:
+					child = self._children[key] = self._new_child()
+		return child
+
+	def _new_child(self) -> "_Metric":
+		raise NotImplementedError
+
+	def _samples(self) -> List[Tuple[Tuple[str, ...], "_Metric"]]:
+		if self.labelnames:
+			return sorted(self._children.items())
+		return [((), self)]
+
+	def render(self) -> List[str]:
+		lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+		for values, child in self._samples():
+			lines.extend(child._render_values(self.name, self.labelnames, values))
+		return lines
+
+
+class Counter(_Metric):
+	kind = "counter"
+
+	def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+		super().__init__(name, documentation, labelnames)
+		self._value = 0.0
+
+	def _new_child(self) -> "Counter":
+		return Counter(self.name, self.documentation)
+
+	def inc(self, amount: float = 1.0) -> None:
+		with self._lock:
+			self._value += amount
+
+	@property
+	def value(self) -> float:
+		return self._value
+
+	def _render_values(self, name: str, labelnames: Sequence[str], values: Sequence[str]) -> List[str]:
+		return [f"{name}{_format_labels(labelnames, values)} {_format_value(self._value)}"]
+
+
+class Gauge(Counter):
+	kind = "gauge"
+
+	def _new_child(self) -> "Gauge":
+		return Gauge(self.name, self.documentation)
+
+	def dec(self, amount: float = 1.0) -> None:
+		self.inc(-amount)
+
+	def set(self, value: float) -> None:
+		with self._lock:
+			self._value = value
+
+
+class Histogram(_Metric):
+	kind = "histogram"
+
+	def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+		super().__init__(name, documentation, labelnames)
+		self._bounds = tuple(sorted(buckets))
+		self._counts = [0] * (len(self._bounds) + 1)
+		self._sum = 0.0
+
+	def _new_child(self) -> "Histogram":
+		return Histogram(self.name, self.documentation, buckets=self._bounds)
+
+	def observe(self, value: float) -> None:
+		index = bisect.bisect_left(self._bounds, value)
+		with self._lock:
+			self._counts[index] += 1
+			self._sum += value
+
+	@property
+	def count(self) -> int:
+		return sum(self._counts)
+
+	def _render_values(self, name: str, labelnames: Sequence[str], values: Sequence[str]) -> List[str]:
+		with self._lock:
+			counts, total = list(self._counts), self._sum
+		lines = []
+		cumulative = 0
+		for bound, count in zip(self._bounds + (math.inf,), counts):
+			cumulative += count
+			le = 'le="%s"' % _format_value(bound)
+			lines.append(f"{name}_bucket{_format_labels(labelnames, values, le)} {cumulative}")
+		lines.append(f"{name}_sum{_format_labels(labelnames, values)} {_format_value(total)}")
+		lines.append(f"{name}_count{_format_labels(labelnames, values)} {cumulative}")
+		return lines
+
+
+class MetricsRegistry:
+	"""进程内指标注册表，按 Prometheus 文本格式（0.0.4）输出。"""
+
+	def __init__(self) -> None:
+		self._metrics: Dict[str, _Metric] = {}
+		self._lock = threading.Lock()
+
+	def _register(self, metric: _Metric) -> _Metric:
+		with self._lock:
+			existing = self._metrics.get(metric.name)
+			if existing is not None:
+				return existing
+			self._metrics[metric.name] = metric
+			return metric
+
+	def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+		return self._register(Counter(name, documentation, labelnames))  # type: ignore[return-value]
+
+	def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+		return self._register(Gauge(name, documentation, labelnames))  # type: ignore[return-value]
+
+	def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+		return self._register(Histogram(name, documentation, labelnames, buckets))  # type: ignore[return-value]
+
+	def render(self) -> str:
+		with self._lock:
+			metrics = list(self._metrics.values())
+		lines: List[str] = []
+		for metric in metrics:
+			lines.extend(metric.render())
+		return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+_BYTES_BUCKETS = (1024, 10 * 1024, 100 * 1024, 1024 ** 2, 10 * 1024 ** 2, 100 * 1024 ** 2, 1024 ** 3)
+
+# 存储
+STORAGE_READ_SECONDS = REGISTRY.histogram("storage_read_seconds", "JSONStorage file read latency.", ("file", "cache"))
+STORAGE_WRITE_SECONDS = REGISTRY.histogram("storage_write_seconds", "JSONStorage file write latency.", ("file",))
+STORAGE_WRITE_BYTES = REGISTRY.counter("storage_write_bytes_total", "Bytes written by JSONStorage.", ("file",))
+
+# 向量化
+EMBEDDING_REQUEST_SECONDS = REGISTRY.histogram("embedding_request_seconds", "Latency of one embeddings API request.", ("mode",))
+EMBEDDING_BATCH_SIZE = REGISTRY.histogram("embedding_batch_size", "Number of texts per embeddings API request.", ("mode",), buckets=_SIZE_BUCKETS)
+EMBEDDING_RETRIES = REGISTRY.counter("embedding_retries_total", "Retried embeddings API requests.", ("mode",))
+
+# 检索
+RETRIEVAL_SCORING_SECONDS = REGISTRY.histogram("retrieval_scoring_seconds", "Time spent scoring and selecting chunks, excluding the query embedding.", ("scope",))
+CONTEXT_TOKENS = REGISTRY.histogram("context_tokens", "Estimated prompt tokens of retrieved context: plain top-k concatenation (baseline) vs. assembled.", ("kind",), buckets=(0, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384))
+ANSWER_CACHE_LOOKUPS = REGISTRY.counter("answer_cache_lookups_total", "Answer cache lookups by result.", ("result",))
+
+# LLM 流式输出
+LLM_TIME_TO_FIRST_TOKEN_SECONDS = REGISTRY.histogram("llm_time_to_first_token_seconds", "Time from request to the first streamed token.")
+LLM_STREAM_SECONDS = REGISTRY.histogram("llm_stream_seconds", "Total duration of a streamed completion.")
+LLM_TOKENS_PER_SECOND = REGISTRY.histogram("llm_tokens_per_second", "Streamed tokens (content deltas) per second after the first token.", buckets=(1, 5, 10, 20, 40, 60, 80, 100, 150, 200, 400))
+LLM_STREAM_TOKENS = REGISTRY.counter("llm_stream_tokens_total", "Streamed content deltas.")
+
+# 会话历史
+_TOKEN_BUCKETS = (0, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+CHAT_HISTORY_TOKENS = REGISTRY.histogram("chat_history_tokens", "Estimated tokens of session history (summary and recent turns) included in a prompt.", buckets=_TOKEN_BUCKETS)
+CHAT_SUMMARIES = REGISTRY.counter("chat_summaries_total", "Background session summarizations by result.", ("result",))
+
+# WebSocket 与上传
+WEBSOCKET_ACTIVE_CONNECTIONS = REGISTRY.gauge("websocket_active_connections", "Open chat WebSocket connections.")
+WEBSOCKET_CONNECTIONS = REGISTRY.counter("websocket_connections_total", "Accepted chat WebSocket connections.")
+WEBSOCKET_FRAMES = REGISTRY.counter("websocket_frames_total", "Frames sent on chat WebSockets.", ("kind",))
+WEBSOCKET_SENT_BYTES = REGISTRY.counter("websocket_sent_bytes_total", "Payload bytes sent on chat WebSockets.", ("kind",))
+WEBSOCKET_SESSION_FRAMES = REGISTRY.histogram("websocket_session_frames", "Frames sent per chat WebSocket session.", buckets=(1, 10, 50, 100, 500, 1000, 5000, 10000, 50000))
+WEBSOCKET_SESSION_BYTES = REGISTRY.histogram("websocket_session_bytes", "Payload bytes sent per chat WebSocket session.", buckets=_BYTES_BUCKETS)
+WEBSOCKET_SLOW_CLIENTS = REGISTRY.counter("websocket_slow_client_closes_total", "Chat WebSockets closed because a send exceeded the timeout.")
+UPLOAD_BYTES = REGISTRY.histogram("upload_bytes", "Size of uploaded documents in bytes.", buckets=_BYTES_BUCKETS)
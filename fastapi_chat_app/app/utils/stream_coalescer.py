@@ -0,0 +1,84 @@
+import asyncio
+from typing import AsyncIterator, List, Optional
+
+
+async def coalesce_stream(tokens: AsyncIterator[str], max_bytes: int = 512, max_delay: float = 0.02, max_pending_bytes: int = 1024 * 1024) -> AsyncIterator[str]:
+	"""
+	把上游逐个到达的小片段合并后输出：缓冲达到 max_bytes（UTF-8 字节）或自缓冲中第一个片段到达起超过
+	max_delay 秒即输出一次。第一个片段立即输出，不增加首 token 延迟。
+
+	上游在后台任务中读取：调用方处理（发送）上一段期间到达的片段会继续进入缓冲，下次一并输出，
+	慢客户端因此收到更少、更大的帧。缓冲超过 max_pending_bytes 时暂停读取上游，内存占用有上限。
+	max_bytes <= 0 时不合并，逐个原样输出。
+	"""
+	if max_bytes <= 0:
+		async for token in tokens:
+			yield token
+		return
+
+	loop = asyncio.get_running_loop()
+	parts: List[str] = []
+	size = 0
+	first_at = 0.0
+	done = False
+	error: Optional[BaseException] = None
+	ready = asyncio.Event()
+	full = asyncio.Event()
+	drained = asyncio.Event()
+
+	async def produce() -> None:
+		nonlocal size, first_at, done, error
+		try:
+			async for token in tokens:
+				if not token:
+					continue
+				while size >= max_pending_bytes:
+					drained.clear()
+					await drained.wait()
+				if not parts:
+					first_at = loop.time()
+				parts.append(token)
+				size += len(token.encode("utf-8"))
+				ready.set()
+				if size >= max_bytes:
+					full.set()
+		except Exception as exc:
+			error = exc
+		finally:
+			done = True
+			ready.set()
+			full.set()
+
+	producer = asyncio.create_task(produce())
+	flushed = False
+	try:
+		while True:
+			await ready.wait()
+			if not parts:
+				if done:
+					break
+				ready.clear()
+				continue
+			if flushed and not done and size < max_bytes:
+				remaining = first_at + max_delay - loop.time()
+				if remaining > 0:
+					try:
+						await asyncio.wait_for(full.wait(), remaining)
+					except asyncio.TimeoutError:
+						pass
+			text = "".join(parts)
+			parts.clear()
+			size = 0
+			if not done:
+				ready.clear()
+				full.clear()
+			drained.set()
+			flushed = True
+			yield text
+		if error is not None:
+			raise error
+	finally:
+		# 调用方提前结束（如客户端断开）时取消读取，上游生成器随之关闭
+		if not producer.done():
+			producer.cancel()
+		await asyncio.gather(producer, return_exceptions=True)
@@ -1,18 +1,78 @@
-from typing import List
+import codecs
+import re
+from typing import BinaryIO, Iterable, Iterator, List, Tuple
+
+
+# 中日韩文字与全角符号：分词器通常每字约 1 个 token
+_WIDE_CHARS = re.compile(r"[\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+# UTF-8 的后续字节（10xxxxxx），不单独构成字符
+_UTF8_CONTINUATION = bytes(range(0x80, 0xC0))
+
+
+def token_counts(text: str) -> Tuple[int, int]:
+	"""(中日韩字符数, 其余字符数)：estimate_tokens 的输入，分段统计后逐项相加与整体统计的结果相同。"""
+	if not text:
+		return 0, 0
+	wide = len(_WIDE_CHARS.findall(text))
+	return wide, len(text) - wide
+
+
+def estimate_tokens(text: str) -> int:
+	"""不依赖分词器的 token 数估算：中日韩字符每字计 1，其余字符每 4 个计 1。"""
+	wide, other = token_counts(text)
+	return wide + (other + 3) // 4
+
+
+def iter_text_chunks(pieces: Iterable[str], max_chars: int = 800, overlap: int = 100) -> Iterator[str]:
+	"""
+	流式切分：输入任意大小的文本片段，产出与 split_text_into_chunks 完全一致的块。
+	内部只保留不超过一个块加一个输入片段的缓冲。
+	"""
+	buffer = ""
+	for piece in pieces:
+		if not piece:
+			continue
+		buffer += piece
+		start = 0
+		# 只有确定后面还有内容时才切出完整块，最后一块留到输入结束
+		while len(buffer) - start > max_chars:
+			yield buffer[start:start + max_chars]
+			start += max_chars - overlap
+		buffer = buffer[start:]
+	if buffer:
+		yield buffer
+
+
+def count_chunks(chars: int, max_chars: int = 800, overlap: int = 100) -> int:
+	"""长度为 chars 的文本经 iter_text_chunks 切分后的块数。"""
+	if chars <= 0:
+		return 0
+	if chars <= max_chars:
+		return 1
+	step = max_chars - overlap
+	return (chars - max_chars + step - 1) // step + 1
+
+
+def utf8_char_count(block: bytes) -> int:
+	"""不解码统计 UTF-8 字节块中的字符数（只数非后续字节），跨块的多字节字符只计一次。"""
+	return len(block.translate(None, _UTF8_CONTINUATION))
 
 
 def split_text_into_chunks(text: str, max_chars: int = 800, overlap: int = 100) -> List[str]:
-	parts: List[str] = []
-	start = 0
-	n = len(text)
-	if n == 0:
-		return parts
-	while start < n:
-		end = min(n, start + max_chars)
-		parts.append(text[start:end])
-		if end == n:
-			break
-		start = max(0, end - overlap)
-	return parts
+	return list(iter_text_chunks([text], max_chars=max_chars, overlap=overlap))
 
 
+def iter_decoded_blocks(stream: BinaryIO, block_size: int = 64 * 1024) -> Iterator[str]:
+	"""按块读取二进制流并做增量 UTF-8 解码，跨块的多字节字符不会被截断。"""
+	decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+	while True:
+		block = stream.read(block_size)
+		if not block:
+			break
+		text = decoder.decode(block)
+		if text:
+			yield text
+	tail = decoder.decode(b"", final=True)
+	if tail:
+		yield tail
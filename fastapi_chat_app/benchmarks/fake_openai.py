@@ -0,0 +1,142 @@
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import time
+import uuid
+from typing import Any, Dict, List, Union
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+def fake_embedding(text: str, dim: int) -> np.ndarray:
+	"""
+	按字符二元组哈希到固定维度的伪向量：同一文本结果固定，字面相近的文本余弦相似度也更高，
+	检索结果因此有意义，基准测试中的排序与打分路径和真实场景一致。
+	"""
+	vec = np.zeros(dim, dtype=np.float32)
+	padded = f" {text} "
+	for i in range(len(padded) - 1):
+		h = int.from_bytes(hashlib.blake2b(padded[i:i + 2].encode("utf-8"), digest_size=8).digest(), "little")
+		vec[h % dim] += 1.0 if (h >> 63) == 0 else -1.0
+	norm = float(np.linalg.norm(vec))
+	if norm > 0:
+		vec /= norm
+	return vec
+
+
+def create_app(
+	embed_latency: float = 0.02,
+	embed_latency_per_item: float = 0.0005,
+	embed_dim: int = 1536,
+	ttft: float = 0.2,
+	tokens_per_second: float = 50.0,
+	reply_tokens: int = 64,
+) -> FastAPI:
+	"""
+	OpenAI 兼容接口的本地替身，只实现本项目用到的 /v1/embeddings 与 /v1/chat/completions。
+	向量化延迟 = embed_latency + embed_latency_per_item × 条数；流式回答先等待 ttft，再按 tokens_per_second 逐个输出。
+	"""
+	app = FastAPI(title="Fake OpenAI")
+	app.state.counters = {"embedding_requests": 0, "embedding_inputs": 0, "chat_requests": 0}
+
+	@app.get("/v1/models")
+	async def models() -> Dict[str, Any]:
+		return {"object": "list", "data": [{"id": "fake-model", "object": "model"}]}
+
+	@app.get("/v1/stats")
+	async def stats() -> Dict[str, Any]:
+		return app.state.counters
+
+	@app.post("/v1/embeddings")
+	async def embeddings(request: Request) -> Dict[str, Any]:
+		body = await request.json()
+		inputs: Union[str, List[str]] = body.get("input", [])
+		texts = [inputs] if isinstance(inputs, str) else list(inputs)
+		app.state.counters["embedding_requests"] += 1
+		app.state.counters["embedding_inputs"] += len(texts)
+		await asyncio.sleep(embed_latency + embed_latency_per_item * len(texts))
+		# 官方 SDK 默认请求 base64（float32 小端），其余情况返回浮点数组
+		as_base64 = body.get("encoding_format") == "base64"
+		data = []
+		for i, text in enumerate(texts):
+			vec = fake_embedding(text, embed_dim)
+			embedding = base64.b64encode(vec.astype("<f4").tobytes()).decode("ascii") if as_base64 else vec.tolist()
+			data.append({"object": "embedding", "index": i, "embedding": embedding})
+		tokens = sum(len(t) for t in texts)
+		return {"object": "list", "data": data, "model": body.get("model", ""), "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+	@app.post("/v1/chat/completions")
+	async def chat_completions(request: Request):
+		body = await request.json()
+		app.state.counters["chat_requests"] += 1
+		model = body.get("model", "")
+		completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+		created = int(time.time())
+		tokens = [f"词{i} " for i in range(reply_tokens)]
+		if not body.get("stream"):
+			await asyncio.sleep(ttft + reply_tokens / tokens_per_second)
+			return JSONResponse(
+				{
+					"id": completion_id,
+					"object": "chat.completion",
+					"created": created,
+					"model": model,
+					"choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}, "finish_reason": "stop"}],
+				}
+			)
+
+		def chunk(delta: Dict[str, Any], finish_reason: Any = None) -> str:
+			payload = {
+				"id": completion_id,
+				"object": "chat.completion.chunk",
+				"created": created,
+				"model": model,
+				"choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+			}
+			return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+		async def events():
+			await asyncio.sleep(ttft)
+			yield chunk({"role": "assistant", "content": ""})
+			interval = 1.0 / tokens_per_second if tokens_per_second > 0 else 0.0
+			for token in tokens:
+				yield chunk({"content": token})
+				if interval:
+					await asyncio.sleep(interval)
+			yield chunk({}, "stop")
+			yield "data: [DONE]\n\n"
+
+		return StreamingResponse(events(), media_type="text/event-stream")
+
+	return app
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description="本地 OpenAI 兼容替身服务（基准测试用）")
+	parser.add_argument("--host", default="127.0.0.1")
+	parser.add_argument("--port", type=int, default=9100)
+	parser.add_argument("--embed-latency-ms", type=float, default=20.0, help="每次向量化请求的固定延迟")
+	parser.add_argument("--embed-latency-per-item-ms", type=float, default=0.5, help="每条输入追加的延迟")
+	parser.add_argument("--embed-dim", type=int, default=1536)
+	parser.add_argument("--ttft-ms", type=float, default=200.0, help="流式回答首个 token 前的延迟")
+	parser.add_argument("--tokens-per-second", type=float, default=50.0)
+	parser.add_argument("--reply-tokens", type=int, default=64)
+	args = parser.parse_args()
+	app = create_app(
+		embed_latency=args.embed_latency_ms / 1000,
+		embed_latency_per_item=args.embed_latency_per_item_ms / 1000,
+		embed_dim=args.embed_dim,
+		ttft=args.ttft_ms / 1000,
+		tokens_per_second=args.tokens_per_second,
+		reply_tokens=args.reply_tokens,
+	)
+	uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+	main()
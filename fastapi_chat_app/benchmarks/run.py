@@ -0,0 +1,422 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+import websockets
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+SCENARIOS = ("auth", "upload", "chat", "sse", "ws")
+QUESTIONS = ["第12段讲了什么？", "总结一下关键内容。", "文档里提到了哪些风险？", "第3段的主题是什么？", "有哪些需要注意的地方？"]
+
+# 单次操作：返回本次各阶段耗时（秒），至少包含 latency
+Operation = Callable[[int], Awaitable[Dict[str, float]]]
+
+
+def percentile(values: List[float], q: float) -> float:
+	"""线性插值百分位数，q 取 0~100。"""
+	if not values:
+		return 0.0
+	ordered = sorted(values)
+	pos = (len(ordered) - 1) * q / 100
+	lower = int(pos)
+	upper = min(lower + 1, len(ordered) - 1)
+	return ordered[lower] + (ordered[upper] - ordered[lower]) * (pos - lower)
+
+
+def summarize(timings: List[Dict[str, float]], errors: List[str], elapsed: float) -> Dict[str, Any]:
+	summary: Dict[str, Any] = {
+		"requests": len(timings),
+		"errors": len(errors),
+		"elapsed_seconds": round(elapsed, 3),
+		"throughput_rps": round(len(timings) / elapsed, 2) if elapsed > 0 else 0.0,
+	}
+	for key in sorted({k for t in timings for k in t}):
+		values = [t[key] * 1000 for t in timings if key in t]
+		summary[f"{key}_ms"] = {
+			"mean": round(sum(values) / len(values), 2),
+			"p50": round(percentile(values, 50), 2),
+			"p95": round(percentile(values, 95), 2),
+			"p99": round(percentile(values, 99), 2),
+			"max": round(max(values), 2),
+		}
+	if errors:
+		summary["sample_errors"] = sorted(set(errors))[:5]
+	return summary
+
+
+async def drive(worker: Callable[[], Any], concurrency: int, total: int) -> Dict[str, Any]:
+	"""
+	以 concurrency 个并发 worker 共执行 total 次操作。worker() 是异步上下文管理器，
+	产出该 worker 复用的操作函数（例如保持一条 WebSocket 连接）。
+	"""
+	counter = iter(range(total))
+	timings: List[Dict[str, float]] = []
+	errors: List[str] = []
+
+	async def run_worker() -> None:
+		try:
+			async with worker() as op:
+				for i in counter:
+					try:
+						timings.append(await op(i))
+					except Exception as exc:
+						errors.append(f"{type(exc).__name__}: {exc}"[:200])
+		except Exception as exc:
+			errors.append(f"{type(exc).__name__}: {exc}"[:200])
+
+	start = time.perf_counter()
+	await asyncio.gather(*(run_worker() for _ in range(concurrency)))
+	return summarize(timings, errors, time.perf_counter() - start)
+
+
+def make_document(index: int, size_kb: int) -> bytes:
+	"""生成约 size_kb KB 的中文文本，每份内容不同，避免全部命中块向量缓存。"""
+	parts: List[str] = []
+	size = 0
+	paragraph = 0
+	while size < size_kb * 1024:
+		text = f"第{paragraph}段：这是基准文档{index}的内容，讨论主题{paragraph % 17}与风险{paragraph % 5}，编号{uuid.uuid4().hex[:8]}。\n"
+		parts.append(text)
+		size += len(text.encode("utf-8"))
+		paragraph += 1
+	return "".join(parts).encode("utf-8")
+
+
+class Bench:
+	def __init__(self, base_url: str, args: argparse.Namespace) -> None:
+		self.base_url = base_url.rstrip("/")
+		self.ws_url = "ws" + self.base_url[len("http"):]
+		self.args = args
+		self.token = ""
+		self.document_id: Optional[str] = None
+		self.client = httpx.AsyncClient(
+			base_url=self.base_url,
+			timeout=args.timeout,
+			limits=httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency * 2),
+		)
+
+	@property
+	def headers(self) -> Dict[str, str]:
+		return {"Authorization": f"Bearer {self.token}"}
+
+	async def close(self) -> None:
+		await self.client.aclose()
+
+	async def register_and_login(self, username: str, password: str) -> str:
+		resp = await self.client.post("/api/auth/register", json={"username": username, "password": password})
+		if resp.status_code not in (200, 400):
+			resp.raise_for_status()
+		resp = await self.client.post("/api/auth/login", json={"username": username, "password": password})
+		resp.raise_for_status()
+		return resp.json()["token"]
+
+	async def upload(self, index: int) -> Tuple[Dict[str, float], str]:
+		"""上传并等待入库完成，返回 (耗时, document_id)；accepted 为上传接口返回 job 的耗时。"""
+		start = time.perf_counter()
+		resp = await self.client.post(
+			"/api/documents/upload",
+			files={"file": (f"bench-{index}.txt", make_document(index, self.args.upload_kb), "text/plain")},
+			headers=self.headers,
+		)
+		resp.raise_for_status()
+		accepted = time.perf_counter()
+		job = resp.json()
+		while True:
+			status = (await self.client.get(f"/api/documents/jobs/{job['job_id']}", headers=self.headers)).json()
+			if status.get("status") == "completed":
+				break
+			if status.get("status") == "failed":
+				raise RuntimeError(f"ingestion failed: {status.get('error')}")
+			await asyncio.sleep(0.05)
+		return {"latency": time.perf_counter() - start, "accepted": accepted - start}, job["document_id"]
+
+	async def setup(self) -> None:
+		self.token = await self.register_and_login(f"bench_{uuid.uuid4().hex[:8]}", "bench-password")
+		if {"chat", "sse", "ws"} & set(self.args.scenarios):
+			# 聊天场景基于一份预先入库的文档检索
+			_, self.document_id = await self.upload(-1)
+
+	# 场景：每个 worker 产出一个操作函数
+	@asynccontextmanager
+	async def auth_worker(self) -> AsyncIterator[Operation]:
+		async def op(i: int) -> Dict[str, float]:
+			start = time.perf_counter()
+			await self.register_and_login(f"bench_{uuid.uuid4().hex[:12]}", "bench-password")
+			return {"latency": time.perf_counter() - start}
+
+		yield op
+
+	@asynccontextmanager
+	async def upload_worker(self) -> AsyncIterator[Operation]:
+		async def op(i: int) -> Dict[str, float]:
+			timing, _ = await self.upload(i)
+			return timing
+
+		yield op
+
+	@asynccontextmanager
+	async def chat_worker(self) -> AsyncIterator[Operation]:
+		async def op(i: int) -> Dict[str, float]:
+			start = time.perf_counter()
+			resp = await self.client.post(
+				"/api/chat/message",
+				json={"message": QUESTIONS[i % len(QUESTIONS)], "document_id": self.document_id},
+				headers=self.headers,
+			)
+			resp.raise_for_status()
+			return {"latency": time.perf_counter() - start}
+
+		yield op
+
+	@asynccontextmanager
+	async def sse_worker(self) -> AsyncIterator[Operation]:
+		async def op(i: int) -> Dict[str, float]:
+			start = time.perf_counter()
+			first: Optional[float] = None
+			async with self.client.stream(
+				"POST",
+				"/api/chat/message",
+				json={"message": QUESTIONS[i % len(QUESTIONS)], "document_id": self.document_id, "stream": True},
+				headers=self.headers,
+			) as resp:
+				resp.raise_for_status()
+				async for line in resp.aiter_lines():
+					if line == "event: chunk" and first is None:
+						first = time.perf_counter()
+					elif line == "event: error":
+						raise RuntimeError("stream error")
+			timing = {"latency": time.perf_counter() - start}
+			if first is not None:
+				timing["ttft"] = first - start
+			return timing
+
+		yield op
+
+	@asynccontextmanager
+	async def ws_worker(self) -> AsyncIterator[Operation]:
+		# 每个 worker 复用一条连接，与前端的使用方式一致
+		async with websockets.connect(f"{self.ws_url}/ws/chat?token={self.token}&format={self.args.ws_format}", max_size=None) as ws:
+			async def op(i: int) -> Dict[str, float]:
+				start = time.perf_counter()
+				await ws.send(json.dumps({"type": "message", "content": QUESTIONS[i % len(QUESTIONS)], "document_id": self.document_id}))
+				first: Optional[float] = None
+				while True:
+					message = await ws.recv()
+					# compact 格式下回答片段是二进制帧
+					frame = {"type": "chunk"} if isinstance(message, bytes) else json.loads(message)
+					kind = frame.get("type")
+					if kind == "chunk" and first is None:
+						first = time.perf_counter()
+					elif kind == "end":
+						break
+					elif kind == "error":
+						raise RuntimeError(frame.get("message"))
+				end = time.perf_counter()
+				timing = {"latency": end - start}
+				if first is not None:
+					timing["ttft"] = first - start
+				return timing
+
+			yield op
+
+	async def run(self) -> Dict[str, Any]:
+		await self.setup()
+		workers = {"auth": self.auth_worker, "upload": self.upload_worker, "chat": self.chat_worker, "sse": self.sse_worker, "ws": self.ws_worker}
+		results: Dict[str, Any] = {}
+		for name in self.args.scenarios:
+			total = self.args.upload_requests if name == "upload" else self.args.requests
+			print(f"[INFO] Running {name}: {total} requests, concurrency {self.args.concurrency}")
+			results[name] = await drive(workers[name], self.args.concurrency, total)
+			print(f"[INFO] {name}: {format_summary(results[name])}")
+		return results
+
+
+def format_summary(summary: Dict[str, Any]) -> str:
+	text = f"{summary['throughput_rps']} req/s, errors {summary['errors']}"
+	for key in ("latency", "ttft", "accepted"):
+		stats = summary.get(f"{key}_ms")
+		if stats:
+			text += f", {key} p50/p95/p99 {stats['p50']}/{stats['p95']}/{stats['p99']} ms"
+	return text
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+	"""与基线结果对比：p95 延迟上升或吞吐下降超过 tolerance（比例）即视为回归。"""
+	regressions = []
+	for name, summary in current.get("scenarios", {}).items():
+		base = baseline.get("scenarios", {}).get(name)
+		if not base:
+			continue
+		for key in ("latency_ms", "ttft_ms"):
+			now_p95, base_p95 = summary.get(key, {}).get("p95"), base.get(key, {}).get("p95")
+			if now_p95 and base_p95 and now_p95 > base_p95 * (1 + tolerance):
+				regressions.append(f"{name} {key} p95 {base_p95} -> {now_p95}")
+		if base.get("throughput_rps") and summary["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+			regressions.append(f"{name} throughput {base['throughput_rps']} -> {summary['throughput_rps']} req/s")
+		if summary["errors"] > base.get("errors", 0):
+			regressions.append(f"{name} errors {base.get('errors', 0)} -> {summary['errors']}")
+	return regressions
+
+
+def start_process(args: List[str], env: Dict[str, str]) -> subprocess.Popen:
+	return subprocess.Popen([sys.executable, *args], cwd=ROOT, env=env)
+
+
+async def wait_until_ready(url: str, timeout: float = 30.0) -> None:
+	deadline = time.monotonic() + timeout
+	async with httpx.AsyncClient() as client:
+		while True:
+			try:
+				await client.get(url)
+				return
+			except httpx.HTTPError:
+				if time.monotonic() > deadline:
+					raise RuntimeError(f"{url} not ready after {timeout}s")
+				await asyncio.sleep(0.2)
+
+
+def parse_env(pairs: List[str]) -> Dict[str, str]:
+	env = {}
+	for pair in pairs:
+		key, _, value = pair.partition("=")
+		env[key] = value
+	return env
+
+
+async def main_async(args: argparse.Namespace) -> int:
+	processes: List[subprocess.Popen] = []
+	app_env: Dict[str, str] = parse_env(args.env)
+	base_url = args.app_url
+	try:
+		if not base_url:
+			fake_url = f"http://127.0.0.1:{args.fake_port}"
+			processes.append(
+				start_process(
+					[
+						"-m", "benchmarks.fake_openai",
+						"--port", str(args.fake_port),
+						"--embed-latency-ms", str(args.embed_latency_ms),
+						"--embed-latency-per-item-ms", str(args.embed_latency_per_item_ms),
+						"--embed-dim", str(args.embed_dim),
+						"--ttft-ms", str(args.ttft_ms),
+						"--tokens-per-second", str(args.tokens_per_second),
+						"--reply-tokens", str(args.reply_tokens),
+					],
+					dict(os.environ),
+				)
+			)
+			await wait_until_ready(f"{fake_url}/v1/models")
+			# 每次运行使用全新的临时数据目录，结果不受本地数据影响
+			data_dir = tempfile.mkdtemp(prefix="chat-bench-")
+			env = {
+				**os.environ,
+				"OPENAI_API_KEY": "bench",
+				"OPENAI_BASE_URL": f"{fake_url}/v1",
+				"DATA_DIR": data_dir,
+				# 问题列表循环使用，默认关闭回答缓存以测量完整的检索与生成路径；可用 --env 覆盖
+				"ANSWER_CACHE_ENABLED": "false",
+				**app_env,
+			}
+			processes.append(start_process(["-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(args.app_port), "--log-level", "warning", "--workers", str(args.workers)], env))
+			base_url = f"http://127.0.0.1:{args.app_port}"
+			await wait_until_ready(f"{base_url}/metrics")
+		bench = Bench(base_url, args)
+		try:
+			scenarios = await bench.run()
+		finally:
+			await bench.close()
+	finally:
+		for proc in processes:
+			proc.terminate()
+		for proc in processes:
+			try:
+				proc.wait(timeout=10)
+			except subprocess.TimeoutExpired:
+				proc.kill()
+
+	result = {
+		"started_at": datetime.utcnow().isoformat() + "Z",
+		"label": args.label,
+		"config": {
+			"concurrency": args.concurrency,
+			"requests": args.requests,
+			"upload_requests": args.upload_requests,
+			"upload_kb": args.upload_kb,
+			"embed_latency_ms": args.embed_latency_ms,
+			"embed_latency_per_item_ms": args.embed_latency_per_item_ms,
+			"embed_dim": args.embed_dim,
+			"ttft_ms": args.ttft_ms,
+			"tokens_per_second": args.tokens_per_second,
+			"reply_tokens": args.reply_tokens,
+			"ws_format": args.ws_format,
+			"workers": args.workers,
+			"app_env": app_env,
+			"app_url": args.app_url,
+		},
+		"environment": {"python": platform.python_version(), "platform": platform.platform(), "cpu_count": os.cpu_count()},
+		"scenarios": scenarios,
+	}
+	output = args.output or os.path.join(RESULTS_DIR, f"bench-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+	os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+	with open(output, "w", encoding="utf-8") as f:
+		json.dump(result, f, ensure_ascii=False, indent=2)
+	print(f"[INFO] Results written to {output}")
+
+	if args.baseline:
+		with open(args.baseline, "r", encoding="utf-8") as f:
+			regressions = compare(result, json.load(f), args.tolerance)
+		for line in regressions:
+			print(f"[WARN] Regression: {line}")
+		if regressions:
+			return 1
+		print(f"[INFO] No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+	return 0
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description="启动应用与本地 OpenAI 替身，按并发压测各接口并输出 JSON 结果")
+	parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"逗号分隔，可选 {', '.join(SCENARIOS)}")
+	parser.add_argument("--concurrency", type=int, default=8)
+	parser.add_argument("--requests", type=int, default=200, help="auth / chat / ws 场景的请求总数")
+	parser.add_argument("--upload-requests", type=int, default=20)
+	parser.add_argument("--upload-kb", type=int, default=64, help="每个上传文档的大小")
+	parser.add_argument("--timeout", type=float, default=120.0)
+	parser.add_argument("--embed-latency-ms", type=float, default=20.0)
+	parser.add_argument("--embed-latency-per-item-ms", type=float, default=0.5)
+	parser.add_argument("--embed-dim", type=int, default=1536)
+	parser.add_argument("--ttft-ms", type=float, default=200.0)
+	parser.add_argument("--tokens-per-second", type=float, default=50.0)
+	parser.add_argument("--reply-tokens", type=int, default=64)
+	parser.add_argument("--ws-format", choices=("json", "compact"), default="json", help="WebSocket 帧格式")
+	parser.add_argument("--workers", type=int, default=1, help="应用的 worker 进程数（多进程部署时的吞吐）")
+	parser.add_argument("--app-port", type=int, default=8765)
+	parser.add_argument("--fake-port", type=int, default=9100)
+	parser.add_argument("--app-url", default=None, help="压测已在运行的服务，不再启动应用与替身")
+	parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="传给应用的环境变量，例如 STORAGE_BACKEND=sqlite，可重复")
+	parser.add_argument("--label", default="", help="写入结果文件的说明")
+	parser.add_argument("--output", default=None, help="结果文件路径，默认 benchmarks/results/bench-<时间>.json")
+	parser.add_argument("--baseline", default=None, help="与之对比的历史结果文件，出现回归时退出码为 1")
+	parser.add_argument("--tolerance", type=float, default=0.2, help="允许的 p95 延迟上升 / 吞吐下降比例")
+	args = parser.parse_args()
+	args.scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+	unknown = set(args.scenarios) - set(SCENARIOS)
+	if unknown:
+		parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+	sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+	main()
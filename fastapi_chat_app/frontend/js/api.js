@@ -129,6 +129,12 @@ export const documentsAPI = {
         return client.uploadFile('/api/documents/upload', file);
     },
 
+    // 查询入库任务进度
+    async job(jobId) {
+        const client = new ApiClient();
+        return client.get(`/api/documents/jobs/${jobId}`);
+    },
+
     // 删除文档
     async delete(documentId) {
         const client = new ApiClient();
@@ -166,6 +172,15 @@ export const authAPI = {
         return client.post('/api/auth/login', { username, password });
     },
 
+    async logout() {
+        const client = new ApiClient();
+        try {
+            await client.post('/api/auth/logout', {});
+        } finally {
+            clearAuthToken();
+        }
+    },
+
     async profile() {
         const client = new ApiClient();
         try {
@@ -200,11 +215,15 @@ export class WebSocketClient {
         if (this.token) {
             params.append('token', this.token);
         }
+        // 紧凑帧格式：回答片段以 UTF-8 二进制帧发送，控制消息仍为 JSON
+        params.append('format', 'compact');
         const query = params.toString();
         if (query) {
             url += `?${query}`;
         }
         this.ws = new WebSocket(url);
+        this.ws.binaryType = 'arraybuffer';
+        const decoder = new TextDecoder('utf-8');
 
         this.ws.onopen = () => {
             console.log('WebSocket连接已建立');
@@ -216,7 +235,9 @@ export class WebSocketClient {
 
         this.ws.onmessage = (event) => {
             try {
-                const data = JSON.parse(event.data);
+                const data = event.data instanceof ArrayBuffer
+                    ? { type: 'chunk', content: decoder.decode(event.data) }
+                    : JSON.parse(event.data);
                 if (this.onMessage) {
                     this.onMessage(data);
                 }
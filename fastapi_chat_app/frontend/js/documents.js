@@ -99,8 +99,12 @@ class DocumentsApp {
 
         try {
             const response = await documentsAPI.upload(file);
-            showToast(`文档 "${response.filename}" 上传成功！`, 'success');
             this.fileInput.value = '';
+            const job = await this.waitForJob(response.job_id);
+            if (job.status === 'failed') {
+                throw new Error(job.error || '处理失败');
+            }
+            showToast(`文档 "${response.filename}" 上传成功！`, 'success');
             await this.loadDocuments();
         } catch (error) {
 			if (this.handleAuthError(error)) return;
@@ -111,6 +115,23 @@ class DocumentsApp {
         }
     }
 
+    // 轮询后台入库任务，直到完成或失败
+    async waitForJob(jobId) {
+        const uploadText = this.uploadArea.querySelector('.upload-text');
+        for (;;) {
+            const job = await documentsAPI.job(jobId);
+            if (job.status === 'completed' || job.status === 'failed') {
+                return job;
+            }
+            if (job.status === 'running') {
+                uploadText.textContent = `处理中 ${Math.round(job.progress * 100)}%（已处理 ${job.chunks_embedded}/${job.chunks_total} 块）...`;
+            } else {
+                uploadText.textContent = '排队处理中...';
+            }
+            await new Promise((resolve) => setTimeout(resolve, 1000));
+        }
+    }
+
     async deleteDocument(documentId, filename) {
         confirmDialog(
             `确定要删除文档 "${filename}" 吗？`,
@@ -1,15 +1,29 @@
+import argparse
 import uvicorn
 import os
 
 
+def resolve_workers(value: str) -> int:
+	"""worker 数量：正整数，或 auto（按 CPU 核数）。"""
+	if value.strip().lower() == "auto":
+		return os.cpu_count() or 1
+	workers = int(value)
+	if workers < 1:
+		raise ValueError("WORKERS 必须为正整数或 auto")
+	return workers
+
+
 def main() -> None:
+	parser = argparse.ArgumentParser(description="启动 FastAPI Chat App")
+	parser.add_argument("--workers", default=os.getenv("WORKERS", "1"), help="worker 进程数，auto 为 CPU 核数（默认取 WORKERS，未设置时为 1）")
+	args = parser.parse_args()
 	port = int(os.getenv("PORT", "8000"))
 	# 生产环境禁用 reload，开发环境可通过 RELOAD=true 启用
 	reload = os.getenv("RELOAD", "false").lower() == "true"
-	uvicorn.run("app.main:app", host="0.0.0.0", port=port, reload=reload)
+	# 多个 worker 进程共用 data 目录：写入经文件锁串行化，文档变更通过 changes.jsonl 同步到各进程；reload 模式只支持单进程
+	workers = 1 if reload else resolve_workers(args.workers)
+	uvicorn.run("app.main:app", host="0.0.0.0", port=port, reload=reload, workers=workers)
 
 
 if __name__ == "__main__":
 	main()
-
-
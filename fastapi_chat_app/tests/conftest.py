@@ -0,0 +1,34 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from app import config  # noqa: E402
+
+
+@pytest.fixture
+def cfg(tmp_path, monkeypatch):
+	"""
+	把配置中位于数据目录下的路径全部改到本测试的 tmp_path，并替换各模块引用的 load_config。
+	返回的配置对象在测试内共享，可直接修改字段（如 cfg.auth_token_ttl = 1）。
+	"""
+	original = config.load_config
+	base = original()
+	data_dir = base.data_dir
+	updates = {
+		name: str(tmp_path) + value[len(data_dir):]
+		for name, value in base.model_dump().items()
+		if isinstance(value, str) and value.startswith(data_dir)
+	}
+	test_cfg = base.model_copy(update=updates)
+
+	def load_config():
+		return test_cfg
+
+	for module in list(sys.modules.values()):
+		if getattr(module, "__name__", "").startswith("app") and getattr(module, "load_config", None) is original:
+			monkeypatch.setattr(module, "load_config", load_config)
+	return test_cfg
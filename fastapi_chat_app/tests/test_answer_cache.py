@@ -0,0 +1,88 @@
+import pytest
+
+from app.services.answer_cache import ALL_DOCUMENTS, AnswerCache
+from app.storage.json_storage import JSONStorage
+from app.storage.log_storage import LogStorage
+from app.storage.sqlite_storage import SQLiteStorage
+
+
+def _document(document_id: str, content: str) -> dict:
+	return {
+		"document_id": document_id,
+		"filename": f"{document_id}.txt",
+		"upload_time": "2024-01-01T00:00:00",
+		"chunks": [{"chunk_id": f"{document_id}-0", "chunk_index": 0, "content": content}],
+	}
+
+
+def _cache(storage) -> AnswerCache:
+	return AnswerCache(max_entries=16, ttl=60, threshold=0.9, versions=storage.document_versions)
+
+
+def test_exact_and_similar_questions_hit(cfg):
+	storage = JSONStorage()
+	storage.put_document(_document("d1", "v1"))
+	cache = _cache(storage)
+	scope = cache.key("d1", "dense", "model")
+	cache.put(scope, "What is E-1042?", [1.0, 0.0], "disk quota", ["chunk"])
+
+	assert cache.get(scope, "  what is e-1042? ").answer == "disk quota"
+	assert cache.get(scope, "Explain E-1042", [0.99, 0.05]).similarity > 0.9
+	assert cache.get(scope, "Explain E-2001", [0.0, 1.0]) is None
+	assert cache.get(cache.key("d1", "lexical", "model"), "What is E-1042?", exact_only=True) is None
+
+
+@pytest.mark.parametrize("backend", [JSONStorage, LogStorage, SQLiteStorage])
+def test_reingest_by_another_worker_changes_the_scope(cfg, backend):
+	storage = backend()
+	storage.put_document(_document("d1", "v1"))
+	storage.put_document(_document("d2", "other"))
+	cache = _cache(storage)
+	scope = cache.key("d1", "dense", "model")
+	all_scope = cache.key(ALL_DOCUMENTS, "dense", "model")
+	cache.put(scope, "question", None, "old answer", [])
+	cache.put(all_scope, "question", None, "old answer", [])
+	assert cache.get(scope, "question", exact_only=True) is not None
+
+	# 另一个进程的存储实例重新写入文档，本进程的缓存没有收到任何通知
+	backend().put_document(_document("d1", "v2"))
+
+	assert cache.key("d1", "dense", "model") != scope
+	assert cache.get(cache.key("d1", "dense", "model"), "question", exact_only=True) is None
+	assert cache.get(cache.key(ALL_DOCUMENTS, "dense", "model"), "question", exact_only=True) is None
+	assert cache.key("d2", "dense", "model")[1] == storage.document_versions()["d2"]
+
+
+def test_answer_generated_across_a_write_is_not_cached(cfg):
+	storage = JSONStorage()
+	storage.put_document(_document("d1", "v1"))
+	cache = _cache(storage)
+	scope = cache.key("d1", "dense", "model")
+
+	JSONStorage().put_document(_document("d1", "v2"))
+	cache.put(scope, "question", None, "answer from v1", [])
+
+	assert cache.stats()["entries"] == 0
+
+
+def test_delete_changes_the_scope(cfg):
+	storage = JSONStorage()
+	storage.put_document(_document("d1", "v1"))
+	cache = _cache(storage)
+	scope = cache.key("d1", "dense", "model")
+
+	JSONStorage().delete_document("d1")
+
+	assert cache.key("d1", "dense", "model") != scope
+
+
+def test_invalidate_releases_entries(cfg):
+	storage = JSONStorage()
+	storage.put_document(_document("d1", "v1"))
+	cache = _cache(storage)
+	cache.put(cache.key("d1", "dense", "model"), "question", None, "answer", [])
+	cache.put(cache.key(ALL_DOCUMENTS, "dense", "model"), "question", None, "answer", [])
+
+	cache.invalidate("d1")
+
+	assert cache.stats()["entries"] == 0
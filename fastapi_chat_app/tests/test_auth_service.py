@@ -0,0 +1,98 @@
+import pytest
+
+from app.services.auth_service import AuthService, _b64decode, _b64encode
+from app.storage.json_storage import JSONStorage
+
+
+@pytest.fixture
+def auth(cfg):
+	cfg.auth_token_mode = "signed"
+	service = AuthService(JSONStorage())
+	service.register_user("alice", "secret1")
+	return service
+
+
+def _login(service: AuthService) -> str:
+	return service.authenticate("alice", "secret1")["token"]
+
+
+def test_signed_token_round_trip(auth):
+	token = _login(auth)
+
+	assert token.startswith("v1.")
+	user = auth.verify_token(token)
+	assert user["username"] == "alice"
+
+
+def test_wrong_password_is_rejected(auth):
+	with pytest.raises(ValueError):
+		auth.authenticate("alice", "wrong-password")
+
+
+def test_tampered_signature_is_rejected(auth):
+	prefix, body, signature = _login(auth).split(".")
+	flipped = bytes([_b64decode(signature)[0] ^ 1]) + _b64decode(signature)[1:]
+
+	assert auth.verify_token(f"{prefix}.{body}.{_b64encode(flipped)}") is None
+
+
+def test_tampered_payload_is_rejected(auth):
+	prefix, body, signature = _login(auth).split(".")
+	payload = _b64decode(body).replace(b'"usr":"alice"', b'"usr":"admin"')
+
+	assert auth.verify_token(f"{prefix}.{_b64encode(payload)}.{signature}") is None
+
+
+def test_token_signed_with_another_secret_is_rejected(auth, cfg):
+	token = _login(auth)
+	cfg.auth_secret = "another-secret"
+
+	assert AuthService(JSONStorage()).verify_token(token) is None
+
+
+def test_expired_token_is_rejected(auth, cfg):
+	cfg.auth_token_ttl = -1
+
+	assert auth.verify_token(_login(auth)) is None
+
+
+@pytest.mark.parametrize("token", ["", "v1.", "v1.a.b", "v1.é.ü", "v1.x.y.z", "garbage"])
+def test_malformed_tokens_are_rejected(auth, token):
+	assert auth.verify_token(token) is None
+
+
+def test_revocation_is_seen_by_other_workers(auth):
+	token = _login(auth)
+	other = AuthService(JSONStorage())
+	assert other.verify_token(token) is not None
+
+	auth.revoke_token(token)
+
+	assert auth.verify_token(token) is None
+	assert other.verify_token(token) is None
+	# 新实例从吊销文件加载
+	assert AuthService(JSONStorage()).verify_token(token) is None
+
+
+def test_revoking_one_token_keeps_others_valid(auth):
+	first, second = _login(auth), _login(auth)
+	auth.revoke_token(first)
+
+	assert auth.verify_token(second) is not None
+
+
+def test_stored_token_mode(cfg):
+	cfg.auth_token_mode = "stored"
+	service = AuthService(JSONStorage())
+	service.register_user("bob", "secret1")
+	token = service.authenticate("bob", "secret1")["token"]
+
+	assert not token.startswith("v1.")
+	assert service.verify_token(token)["username"] == "bob"
+	service.revoke_token(token)
+	assert service.verify_token(token) is None
+
+
+def test_duplicate_username_is_rejected(auth):
+	with pytest.raises(ValueError):
+		auth.register_user("alice", "another1")
@@ -0,0 +1,118 @@
+import os
+
+import numpy as np
+import pytest
+
+from app.storage import binary_vector_storage
+from app.storage.binary_vector_storage import BinaryVectorStorage
+from app.storage.json_storage import JSONStorage
+
+
+def _legacy_vectors(js: JSONStorage) -> None:
+	js.write_vectors({"vectors": [
+		{"document_id": "doc-a", "chunk_vectors": [
+			{"chunk_id": "a1", "vector": [3.0, 4.0], "dimension": 2},
+			{"chunk_id": "a2", "vector": [0.0, 2.0], "dimension": 2},
+		]},
+		{"document_id": "doc-b", "chunk_vectors": [{"chunk_id": "b1", "vector": [1.0, 0.0], "dimension": 2}]},
+	]})
+
+
+def test_round_trip_normalizes_rows(cfg):
+	storage = BinaryVectorStorage(JSONStorage())
+	storage.upsert_document_vectors("doc", ["c1", "c2"], [[3.0, 4.0], [0.0, 5.0]], 2)
+
+	chunk_ids, matrix = storage.get_document_matrix("doc")
+	assert chunk_ids == ["c1", "c2"]
+	assert matrix.dtype == np.float32
+	np.testing.assert_allclose(matrix, [[0.6, 0.8], [0.0, 1.0]], atol=1e-6)
+	assert storage.list_document_ids() == ["doc"]
+
+	storage.delete_document_vectors("doc")
+	assert storage.get_document_matrix("doc") is None
+	assert not [name for name in os.listdir(cfg.vectors_dir) if name.startswith("doc.")]
+
+
+def test_rewrite_replaces_previous_data_file(cfg):
+	storage = BinaryVectorStorage(JSONStorage())
+	storage.upsert_document_vectors("doc", ["c1"], [[1.0, 0.0]], 2)
+	storage.upsert_document_vectors("doc", ["c2", "c3"], [[0.0, 1.0], [1.0, 1.0]], 2)
+
+	assert storage.get_document_matrix("doc")[0] == ["c2", "c3"]
+	assert len([name for name in os.listdir(cfg.vectors_dir) if name.endswith(".f32")]) == 1
+
+
+def test_aborted_writer_is_invisible(cfg):
+	storage = BinaryVectorStorage(JSONStorage())
+	storage.upsert_document_vectors("doc", ["c1"], [[1.0, 0.0]], 2)
+	writer = storage.open_writer("doc")
+	writer.append(["c2"], [[0.0, 1.0]])
+	writer.abort()
+
+	assert storage.get_document_matrix("doc")[0] == ["c1"]
+	assert len([name for name in os.listdir(cfg.vectors_dir) if name.endswith(".f32")]) == 1
+
+
+def test_overlapping_writers_keep_the_last_commit_readable(cfg):
+	storage = BinaryVectorStorage(JSONStorage())
+	storage.upsert_document_vectors("doc", ["c0"], [[1.0, 0.0]], 2)
+	slow = storage.open_writer("doc")
+	slow.append(["c1"], [[0.0, 1.0]])
+	storage.upsert_document_vectors("doc", ["c2"], [[1.0, 1.0]], 2)
+	slow.append(["c3"], [[1.0, 0.0]])
+	slow.commit()
+
+	assert storage.get_document_matrix("doc")[0] == ["c1", "c3"]
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_quantized_copy_matches_float32(cfg, dtype):
+	cfg.vector_dtype = dtype
+	storage = BinaryVectorStorage(JSONStorage())
+	rows = np.random.default_rng(0).normal(size=(16, 8)).astype(np.float32)
+	storage.upsert_document_vectors("doc", [f"c{i}" for i in range(16)], rows, 8)
+
+	_, matrix = storage.get_document_matrix("doc")
+	quantized = storage.get_quantized_matrix("doc")
+	assert quantized is not None
+	query = matrix[3]
+	assert int(np.argmax(quantized.scores(query))) == 3
+
+
+def test_unsupported_dtype_is_rejected(cfg):
+	cfg.vector_dtype = "bf16"
+	with pytest.raises(ValueError):
+		BinaryVectorStorage(JSONStorage())
+
+
+def test_migrates_vectors_json_on_first_use(cfg):
+	js = JSONStorage()
+	_legacy_vectors(js)
+	storage = BinaryVectorStorage(js)
+
+	assert sorted(storage.list_document_ids()) == ["doc-a", "doc-b"]
+	chunk_ids, matrix = storage.get_document_matrix("doc-a")
+	assert chunk_ids == ["a1", "a2"]
+	np.testing.assert_allclose(matrix, [[0.6, 0.8], [0.0, 1.0]], atol=1e-6)
+	# 源文件保持不变
+	assert len(js.read_vectors()["vectors"]) == 2
+
+
+def test_interrupted_migration_is_retried(cfg, monkeypatch):
+	js = JSONStorage()
+	_legacy_vectors(js)
+	migrate = binary_vector_storage.migrate_json_vectors
+
+	def crash(source, target):
+		migrate(source, target)
+		raise RuntimeError("crash")
+
+	monkeypatch.setattr(binary_vector_storage, "migrate_json_vectors", crash)
+	with pytest.raises(RuntimeError):
+		BinaryVectorStorage(js)
+	assert not os.path.exists(cfg.vectors_dir)
+
+	monkeypatch.setattr(binary_vector_storage, "migrate_json_vectors", migrate)
+	storage = BinaryVectorStorage(js)
+	assert sorted(storage.list_document_ids()) == ["doc-a", "doc-b"]
+	assert not os.path.exists(cfg.vectors_dir + ".migrating")
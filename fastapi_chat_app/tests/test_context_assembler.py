@@ -0,0 +1,85 @@
+import random
+
+from app.services.context_assembler import ContextAssembler, _overlap, _span_tokens
+from app.utils.text_processor import estimate_tokens, split_text_into_chunks
+
+
+def _brute_overlap(left: str, right: str) -> int:
+	for size in range(min(len(left), len(right)), 0, -1):
+		if left.endswith(right[:size]):
+			return size
+	return 0
+
+
+def test_overlap_matches_exhaustive_scan_within_window():
+	rng = random.Random(0)
+	for _ in range(2000):
+		left = "".join(rng.choice("ab中") for _ in range(rng.randint(0, 40)))
+		right = "".join(rng.choice("ab中") for _ in range(rng.randint(0, 40)))
+		assert _overlap(left, right) == _brute_overlap(left, right)
+
+
+def test_overlap_of_adjacent_chunks_and_duplicates():
+	text = "".join(f"第{i}句讲的是主题{i % 7}。" for i in range(600))
+	chunks = split_text_into_chunks(text)
+
+	assert _overlap(chunks[0], chunks[1]) == 100
+	assert _overlap(chunks[2], chunks[2]) == len(chunks[2])
+	assert _overlap(chunks[0], chunks[5]) == _brute_overlap(chunks[0], chunks[5]) < 100
+
+
+def _passages(text: str, document_id: str = "d1"):
+	chunks = split_text_into_chunks(text)
+	return [
+		{"document_id": document_id, "chunk_id": f"{document_id}-{i}", "chunk_index": i, "content": c, "score": 1.0 - i / 100}
+		for i, c in enumerate(chunks)
+	]
+
+
+def test_adjacent_chunks_merge_without_overlap():
+	text = "".join(f"第{i}句讲的是主题{i % 7}。" for i in range(300))
+	passages = _passages(text)
+	assembler = ContextAssembler(max_tokens=100000, mmr_lambda=1.0, dedupe_threshold=1.1)
+
+	result = assembler.assemble(passages[:3], k=3)
+
+	# 800 字符的分块每块与前一块重叠 100 字符
+	assert result.chunks == [text[:800 + 2 * 700]]
+	assert result.tokens == _span_tokens(result.chunks[0])
+	assert result.saved_tokens > 0
+
+
+def test_budget_uses_merged_estimate():
+	text = "".join(f"sentence {i} covers topic {i % 7}. " for i in range(400))
+	passages = _passages(text)
+	merged = ContextAssembler(max_tokens=100000, mmr_lambda=1.0, dedupe_threshold=1.1).assemble(passages[:4], k=4)
+
+	# 预算恰好等于合并后的估算时四个片段都能选入，少一个 token 时最后一个被挤掉
+	exact = ContextAssembler(max_tokens=merged.tokens, mmr_lambda=1.0, dedupe_threshold=1.1).assemble(passages[:4], k=4)
+	short = ContextAssembler(max_tokens=merged.tokens - 1, mmr_lambda=1.0, dedupe_threshold=1.1).assemble(passages[:4], k=4)
+
+	assert exact.chunks == merged.chunks
+	assert short.tokens < merged.tokens
+	assert all(estimate_tokens(c) > 0 for c in short.chunks)
+
+
+def test_near_duplicates_are_skipped():
+	content = "The disk quota is exceeded when error E-1042 appears."
+	passages = [
+		{"document_id": "a", "chunk_id": "a0", "chunk_index": 0, "content": content, "score": 2.0},
+		{"document_id": "b", "chunk_id": "b0", "chunk_index": 0, "content": content + " ", "score": 1.9},
+		{"document_id": "c", "chunk_id": "c0", "chunk_index": 0, "content": "Restart the sync service.", "score": 1.0},
+	]
+
+	result = ContextAssembler(max_tokens=1000, mmr_lambda=0.7, dedupe_threshold=0.9).assemble(passages, k=3)
+
+	assert result.chunks == [content, "Restart the sync service."]
+
+
+def test_oversized_first_passage_is_truncated():
+	passages = [{"document_id": "a", "chunk_id": "a0", "chunk_index": 0, "content": "x" * 4000, "score": 1.0}]
+
+	result = ContextAssembler(max_tokens=100, mmr_lambda=0.7, dedupe_threshold=0.9).assemble(passages, k=1)
+
+	assert result.tokens <= 100
+	assert result.chunks[0] == "x" * len(result.chunks[0])
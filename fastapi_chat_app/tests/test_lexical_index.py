@@ -0,0 +1,84 @@
+import pytest
+
+from app.services.chat_service import reciprocal_rank_fusion
+from app.storage.lexical_index import BM25Index, tokenize
+
+
+@pytest.fixture
+def index():
+	index = BM25Index()
+	index.add("policy", [
+		("p0", "年假申请需提前三天提交，由部门经理审批。"),
+		("p1", "报销流程：提交发票后五个工作日内到账。"),
+	])
+	index.add("manual", [
+		("m0", "Error code E-1042 means the disk quota is exceeded."),
+		("m1", "Restart the sync service to clear error E-2001."),
+		("m2", "The disk usage report lists quota per user."),
+	])
+	return index
+
+
+def test_tokenize_mixes_cjk_bigrams_and_words():
+	assert tokenize("年假ＡＢＣ E-1042 申") == ["年假", "abc", "e-1042", "申"]
+
+
+def test_exact_code_ranks_first(index):
+	results = index.search("E-1042", k=3)
+
+	assert results[0][:2] == ("manual", "m0")
+	assert len(results) == 1
+
+
+def test_cjk_query_ranks_matching_chunk(index):
+	results = index.search("年假怎么申请", k=3)
+
+	assert results[0][:2] == ("policy", "p0")
+
+
+def test_term_frequency_and_idf_order(index):
+	# "quota" 出现在 m0 与 m2，"disk" 同样；"report" 只在 m2，稀有词项决定排序
+	results = index.search("disk quota report", k=3)
+
+	assert [chunk_id for _, chunk_id, _ in results] == ["m2", "m0"]
+	assert results[0][2] > results[1][2] > 0
+
+
+def test_document_filter(index):
+	assert index.search("error", k=5, document_ids=["policy"]) == []
+	assert {c for _, c, _ in index.search("error", k=5, document_ids=["manual"])} == {"m0", "m1"}
+
+
+def test_no_match_and_empty_query(index):
+	assert index.search("kubernetes", k=3) == []
+	assert index.search("", k=3) == []
+	assert index.search("error", k=0) == []
+
+
+def test_remove_and_replace(index):
+	index.remove("manual")
+	assert index.search("error", k=5) == []
+	assert len(index) == 2
+
+	index.add("policy", [("p9", "error handling policy")])
+	assert [(d, c) for d, c, _ in index.search("error", k=5)] == [("policy", "p9")]
+	assert index.search("年假", k=5) == []
+
+
+def test_compaction_keeps_results(index):
+	for i in range(1100):
+		index.add(f"tmp{i}", [(f"t{i}", "filler text")])
+	for i in range(1100):
+		index.remove(f"tmp{i}")
+
+	# 墓碑超过阈值时已压缩过一次，之后的删除只打墓碑
+	assert index.stats()["tombstones"] < 1100
+	assert len(index) == 5
+	assert index.search("E-1042", k=3)[0][:2] == ("manual", "m0")
+
+
+def test_reciprocal_rank_fusion():
+	fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "a"]], k=60)
+
+	assert [key for key, _ in fused] == ["a", "c", "b"]
+	assert fused[0][1] == pytest.approx(1 / 61 + 1 / 62)
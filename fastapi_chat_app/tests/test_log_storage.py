@@ -0,0 +1,139 @@
+import json
+import os
+
+import pytest
+
+from app.storage.json_storage import JSONStorage
+from app.storage.log_storage import LogStorage, RecordLog
+
+
+@pytest.fixture
+def log_path(tmp_path):
+	return str(tmp_path / "records.jsonl")
+
+
+def test_round_trip_and_reopen(log_path):
+	log = RecordLog(log_path)
+	log.put("a", {"v": 1})
+	log.put("b", {"v": 2})
+	log.put("a", {"v": 3})
+	assert log.delete("b")
+	assert not log.delete("missing")
+	log.close()
+
+	reopened = RecordLog(log_path)
+	assert reopened.keys() == ["a"]
+	assert reopened.get("a") == {"v": 3}
+	assert reopened.get("b") is None
+
+
+def test_sees_appends_from_another_handle(log_path):
+	first = RecordLog(log_path)
+	second = RecordLog(log_path)
+	first.put("a", {"v": 1})
+	second.put("b", {"v": 2})
+
+	assert sorted(first.keys()) == ["a", "b"]
+	assert second.get("a") == {"v": 1}
+
+
+def test_corrupt_middle_line_is_skipped(log_path):
+	with open(log_path, "wb") as f:
+		f.write(b'{"op":"put","key":"a","record":{"v":1}}\n')
+		f.write(b'{"op":"put","key":\n')
+		f.write(b'{"op":"put","key":"b","record":{"v":2}}\n')
+
+	log = RecordLog(log_path)
+	assert sorted(log.keys()) == ["a", "b"]
+	assert log.stats()["dead_bytes"] == len(b'{"op":"put","key":\n')
+
+
+def test_torn_tail_is_repaired_before_append(log_path):
+	with open(log_path, "wb") as f:
+		f.write(b'{"op":"put","key":"a","record":{"v":1}}\n')
+		f.write(b'{"op":"put","key":"b","rec')
+
+	log = RecordLog(log_path)
+	assert log.keys() == ["a"]
+	log.put("c", {"v": 3})
+	log.close()
+
+	with open(log_path, "rb") as f:
+		lines = f.read().splitlines()
+	assert [json.loads(line)["key"] for line in lines] == ["a", "c"]
+
+
+def test_compaction_drops_dead_records(log_path):
+	log = RecordLog(log_path, compact_min_bytes=10 ** 9)
+	for i in range(20):
+		log.put("a", {"v": i})
+	log.put("b", {"v": "keep"})
+	log.delete("gone")
+	before = os.path.getsize(log_path)
+
+	log.compact()
+
+	assert os.path.getsize(log_path) < before
+	assert log.stats()["dead_bytes"] == 0
+	assert log.stats()["compactions"] == 1
+	assert log.get("a") == {"v": 19}
+	assert RecordLog(log_path).get("b") == {"v": "keep"}
+
+
+def test_other_handle_follows_compaction(log_path):
+	writer = RecordLog(log_path, compact_min_bytes=10 ** 9)
+	reader = RecordLog(log_path)
+	for i in range(5):
+		writer.put("a", {"v": i})
+	writer.compact()
+	writer.put("b", {"v": 1})
+
+	assert reader.get("a") == {"v": 4}
+	assert reader.get("b") == {"v": 1}
+
+
+def test_put_file_appends_a_prepared_record(log_path, tmp_path):
+	record_path = str(tmp_path / "record.json")
+	with open(record_path, "w", encoding="utf-8") as f:
+		json.dump({"chunks": [{"content": "中文"}], "filename": "a.txt"}, f, ensure_ascii=False)
+	log = RecordLog(log_path)
+	log.put_file("doc", record_path)
+
+	assert log.get("doc") == {"chunks": [{"content": "中文"}], "filename": "a.txt"}
+	assert RecordLog(log_path).get("doc")["filename"] == "a.txt"
+
+
+def _document(document_id: str) -> dict:
+	return {
+		"document_id": document_id,
+		"filename": f"{document_id}.txt",
+		"upload_time": "2024-01-01T00:00:00",
+		"chunks": [{"chunk_id": f"{document_id}-0", "content": "hello"}],
+	}
+
+
+def test_log_storage_imports_json_backend_once(cfg):
+	js = JSONStorage()
+	js.put_document(_document("d1"))
+	js.put_user({"user_id": "u1", "username": "Alice", "tokens": []})
+
+	storage = LogStorage()
+	assert [d["document_id"] for d in storage.list_documents()] == ["d1"]
+	assert storage.find_user("alice")["user_id"] == "u1"
+
+	# 日志已存在时不再从 json 导入
+	js.put_document(_document("d2"))
+	assert [d["document_id"] for d in LogStorage().list_documents()] == ["d1"]
+
+
+def test_log_storage_chunk_writer(cfg):
+	storage = LogStorage()
+	writer = storage.open_chunk_writer("d1")
+	writer.append([{"chunk_id": "c0", "content": "a"}])
+	writer.append([{"chunk_id": "c1", "content": "b"}])
+	writer.commit({"document_id": "d1", "filename": "d1.txt", "upload_time": "2024-01-01T00:00:00"})
+
+	document = storage.get_document("d1")
+	assert [c["chunk_id"] for c in document["chunks"]] == ["c0", "c1"]
+	assert document["filename"] == "d1.txt"
+	assert not [name for name in os.listdir(cfg.data_dir) if name.endswith(".chunks")]
@@ -0,0 +1,68 @@
+import json
+import os
+
+from app.storage.json_storage import JSONStorage
+from app.storage.read_cache import SnapshotCache
+
+
+def test_signature_mismatch_invalidates():
+	cache = SnapshotCache(max_bytes=1024)
+	cache.put("a", (1, 1, 10), {"v": 1}, 10)
+
+	assert cache.get("a", (1, 1, 10)) == {"v": 1}
+	assert cache.get("a", (2, 1, 10)) is None
+	assert cache.get("a", (1, 1, 10)) is None
+	stats = cache.stats()
+	assert (stats["hits"], stats["misses"], stats["invalidations"]) == (1, 2, 1)
+
+
+def test_lru_eviction_respects_byte_budget():
+	cache = SnapshotCache(max_bytes=25)
+	cache.put("a", (1, 1, 10), "a", 10)
+	cache.put("b", (1, 1, 10), "b", 10)
+	cache.get("a", (1, 1, 10))
+	cache.put("c", (1, 1, 10), "c", 10)
+
+	assert cache.get("b", (1, 1, 10)) is None
+	assert cache.get("a", (1, 1, 10)) == "a"
+	assert cache.stats()["bytes"] == 20
+	# 超过上限的单个文件不缓存
+	cache.put("big", (1, 1, 100), "big", 100)
+	assert cache.get("big", (1, 1, 100)) is None
+
+
+def test_storage_reuses_snapshot_until_file_changes(cfg):
+	js = JSONStorage()
+	js.write_users({"users": [{"id": "u1"}]})
+
+	first = js.read_users()
+	hits = js.cache_stats()["hits"]
+	second = js.read_users()
+	assert js.cache_stats()["hits"] == hits + 1
+	assert second["users"] is first["users"]
+
+	# 其他进程原子替换文件：新 inode 使快照失效
+	tmp_path = cfg.users_path + ".other"
+	with open(tmp_path, "w", encoding="utf-8") as f:
+		json.dump({"users": [{"id": "u2"}]}, f)
+	os.replace(tmp_path, cfg.users_path)
+
+	assert js.read_users()["users"] == [{"id": "u2"}]
+
+
+def test_top_level_copy_is_private(cfg):
+	js = JSONStorage()
+	js.write_users({"users": [], "extra": 1})
+
+	data = js.read_users()
+	data["users"] = [{"id": "changed"}]
+	assert js.read_users()["users"] == []
+
+
+def test_disabled_cache_reads_from_disk(cfg):
+	cfg.storage_cache_enabled = False
+	js = JSONStorage()
+	js.write_users({"users": [{"id": "u1"}]})
+
+	assert js.read_users()["users"] == [{"id": "u1"}]
+	assert js.cache_stats() == {"enabled": False}
@@ -0,0 +1,122 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+from app.services.auth_service import AuthService
+from app.storage.json_storage import JSONStorage
+from app.storage.sqlite_storage import SQLiteDatabase, SQLiteStorage, SQLiteVectorStorage, migrate_json_to_sqlite
+
+
+def _document(document_id: str, upload_time: str = "2024-01-01T00:00:00") -> dict:
+	return {
+		"document_id": document_id,
+		"filename": f"{document_id}.txt",
+		"upload_time": upload_time,
+		"metadata": {"size": 3},
+		"chunks": [{"chunk_id": f"{document_id}-{i}", "chunk_index": i, "content": f"内容 {i}"} for i in range(3)],
+	}
+
+
+def _user(user_id: str, username: str) -> dict:
+	return {
+		"user_id": user_id,
+		"username": username,
+		"password_hash": "hash",
+		"salt": "salt",
+		"created_at": "2024-01-01T00:00:00",
+		"tokens": [{"token": f"{user_id}-token", "created_at": 1, "expires_at": 2}],
+	}
+
+
+def test_document_round_trip(cfg):
+	storage = SQLiteStorage()
+	storage.put_document(_document("d1", "2024-01-01T00:00:00"))
+	storage.put_document(_document("d2", "2024-02-01T00:00:00"))
+
+	assert storage.get_document("d1") == _document("d1")
+	assert [d["document_id"] for d in storage.recent_documents(1)] == ["d2"]
+	assert "chunks" not in storage.list_documents(include_chunks=False)[0]
+
+	storage.delete_document("d1")
+	assert storage.get_document("d1") is None
+	assert storage.database.conn.execute("SELECT COUNT(*) FROM chunks WHERE document_id = 'd1'").fetchone()[0] == 0
+
+
+def test_chunk_writer_commit_and_abort(cfg):
+	storage = SQLiteStorage()
+	writer = storage.open_chunk_writer("d1")
+	writer.append([{"chunk_id": "c0", "chunk_index": 0, "content": "a"}])
+	writer.append([{"chunk_id": "c1", "chunk_index": 1, "content": "b"}])
+	writer.commit({"document_id": "d1", "filename": "d1.txt", "upload_time": "2024-01-01T00:00:00"})
+
+	aborted = storage.open_chunk_writer("d2")
+	aborted.append([{"chunk_id": "x0", "chunk_index": 0, "content": "x"}])
+	aborted.abort()
+
+	assert [c["chunk_id"] for c in storage.get_document("d1")["chunks"]] == ["c0", "c1"]
+	assert storage.get_document("d2") is None
+	assert storage.database.conn.execute("SELECT COUNT(*) FROM staged_chunks").fetchone()[0] == 0
+
+
+def test_user_round_trip_and_case_insensitive_lookup(cfg):
+	storage = SQLiteStorage()
+	storage.put_user(_user("u1", "Alice"))
+	storage.put_user(_user("u2", "Ölaf"))
+
+	assert storage.get_user("u1") == _user("u1", "Alice")
+	assert storage.find_user(" alice ")["user_id"] == "u1"
+	# 非 ASCII 字母同样不区分大小写
+	assert storage.find_user("ölaf")["user_id"] == "u2"
+	assert storage.find_user("bob") is None
+
+
+def test_duplicate_non_ascii_username_is_rejected(cfg):
+	auth = AuthService(SQLiteStorage())
+	auth.register_user("Öl", "secret1")
+
+	with pytest.raises(ValueError):
+		auth.register_user("öl", "secret1")
+
+
+def test_migrates_json_files_on_first_open(cfg):
+	js = JSONStorage()
+	js.put_document(_document("d1"))
+	js.write_users({"users": [_user("u1", "Alice")]})
+
+	storage = SQLiteStorage()
+	assert storage.get_document("d1") == _document("d1")
+	assert storage.find_user("ALICE")["user_id"] == "u1"
+
+
+def test_migrate_json_to_sqlite_imports_vectors(cfg):
+	js = JSONStorage()
+	js.put_document(_document("d1"))
+	js.write_vectors({"vectors": [{"document_id": "d1", "chunk_vectors": [
+		{"chunk_id": "d1-0", "vector": [3.0, 4.0], "dimension": 2},
+		{"chunk_id": "d1-1", "vector": [1.0, 0.0], "dimension": 2},
+	]}]})
+	target = SQLiteStorage()
+
+	counts = migrate_json_to_sqlite(js, target)
+
+	assert counts == {"documents": 1, "users": 0, "vector_documents": 1}
+	chunk_ids, matrix = SQLiteVectorStorage(target).get_document_matrix("d1")
+	assert chunk_ids == ["d1-0", "d1-1"]
+	np.testing.assert_allclose(matrix, [[0.6, 0.8], [1.0, 0.0]], atol=1e-6)
+
+
+def test_upgrade_adds_username_lower_column(tmp_path):
+	path = str(tmp_path / "old.db")
+	conn = sqlite3.connect(path)
+	conn.execute(
+		"CREATE TABLE users (user_id TEXT PRIMARY KEY, username TEXT NOT NULL COLLATE NOCASE UNIQUE, "
+		"password_hash TEXT NOT NULL, salt TEXT NOT NULL, created_at TEXT NOT NULL)"
+	)
+	conn.execute("INSERT INTO users VALUES ('u1', 'Ölaf', 'hash', 'salt', '2024-01-01')")
+	conn.commit()
+	conn.close()
+
+	db = SQLiteDatabase(path)
+	assert db.conn.execute("SELECT username_lower FROM users WHERE user_id = 'u1'").fetchone()[0] == "ölaf"
+	db.close()
@@ -0,0 +1,78 @@
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.websocket import router
+
+
+class _Auth:
+	def verify_token(self, token):
+		return {"user_id": "u1", "username": "alice"} if token == "good" else None
+
+
+class _Sessions:
+	def __init__(self):
+		self.created = []
+
+	def get(self, session_id, user_id):
+		return None
+
+	def new(self, user_id, document_id):
+		self.created.append(document_id)
+		return {"session_id": "s1"}
+
+	def release(self, session_id):
+		pass
+
+
+class _Chat:
+	async def _answer(self):
+		yield "你好"
+
+	def stream_answer(self, document_id, content, **kwargs):
+		return self._answer()
+
+
+@pytest.fixture
+def client(cfg):
+	app = FastAPI()
+	app.include_router(router)
+	app.state.services = SimpleNamespace(auth=_Auth(), sessions=_Sessions(), chat=_Chat(), cfg=cfg)
+	return TestClient(app)
+
+
+@pytest.mark.parametrize("frame", [
+	{"type": "message", "content": 123},
+	{"type": "message", "content": ["hi"]},
+	{"type": "message", "content": "hi", "session_id": 5},
+	{"type": "message", "content": "hi", "session_id": {"id": "s"}},
+	{"type": "message", "content": "hi", "document_id": ["d1"]},
+	{"type": "message", "content": "hi", "retrieval_mode": ["dense"]},
+	{"type": "message", "content": "   "},
+	["message"],
+])
+def test_invalid_frame_gets_error_and_connection_stays_open(client, frame):
+	with client.websocket_connect("/ws/chat?token=good&format=json") as ws:
+		ws.send_json(frame)
+		assert ws.receive_json()["type"] == "error"
+
+		ws.send_json({"type": "message", "content": "hi"})
+		assert ws.receive_json() == {"type": "start", "session_id": "s1"}
+		assert ws.receive_json() == {"type": "chunk", "content": "你好"}
+		assert ws.receive_json() == {"type": "end"}
+
+
+def test_non_json_text_frame_gets_error(client):
+	with client.websocket_connect("/ws/chat?token=good&format=json") as ws:
+		ws.send_text("not json")
+		assert ws.receive_json()["type"] == "error"
+
+
+def test_compact_format_sends_binary_chunks(client):
+	with client.websocket_connect("/ws/chat?token=good&format=compact") as ws:
+		ws.send_json({"type": "message", "content": "hi", "document_id": None})
+		assert ws.receive_json()["type"] == "start"
+		assert ws.receive_bytes() == "你好".encode("utf-8")
+		assert ws.receive_json() == {"type": "end"}